@@ -0,0 +1,166 @@
+import random
+from collections import Counter
+from dataclasses import asdict, dataclass
+from typing import Dict
+
+
+@dataclass
+class BatchOutcome:
+    """The result of one generation request for `batch_num` pairs."""
+
+    batch_num: int
+    # Schema-valid items parsed from the response.
+    returned: int
+    # Elements dropped as malformed, invalid or cut off.
+    lost: int
+    seconds: float
+    truncated: bool
+    # Whether the response contained a JSON array at all.
+    found_array: bool = True
+
+    @property
+    def damaged(self) -> bool:
+        return self.lost > 0 or not self.found_array
+
+
+@dataclass
+class SizeStats:
+    """
+    Exponentially decayed totals of the requests made with one batch size.
+    `count` is the undecayed number of requests.
+    """
+
+    count: int = 0
+    requests: float = 0.0
+    seconds: float = 0.0
+    parse_failures: float = 0.0
+    truncations: float = 0.0
+    returned: float = 0.0
+    accepted: float = 0.0
+
+    def score(self) -> float:
+        """Accepted samples per second of request latency."""
+        return self.accepted / max(self.seconds, 1e-9)
+
+
+class BatchSizer:
+    """
+    Chooses the number of pairs requested per prompt.
+
+    The candidate sizes lie on a grid between `minimum` and `maximum`. Each
+    size keeps decayed statistics of latency, parse failures, truncations and
+    accepted samples, so the estimate follows the acceptance rate as it drops
+    over a run. The sizer climbs toward the size with the most accepted
+    samples per second: every size next to the current best is tried until it
+    has `min_observations` results, and afterwards occasionally re-tried with
+    probability `explore_rate`.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int,
+        maximum: int,
+        step: int,
+        decay: float = 0.9,
+        min_observations: int = 3,
+        explore_rate: float = 0.1,
+    ):
+        if not 0 < minimum <= maximum:
+            raise ValueError("Batch size bounds must satisfy 0 < minimum <= maximum.")
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decay = decay
+        self.min_observations = min_observations
+        self.explore_rate = explore_rate
+        self.current = self._clamp(initial)
+        sizes = set(range(minimum, maximum + 1, step))
+        sizes.update((maximum, self.current))
+        self.stats: Dict[int, SizeStats] = {
+            size: SizeStats() for size in sorted(sizes)
+        }
+        # Requests handed out but not yet recorded, per size.
+        self._pending: Counter = Counter()
+        self._rng = random.Random(initial)
+
+    def next_size(self) -> int:
+        """Returns the batch size for the next request."""
+        size = self._choose()
+        self._pending[size] += 1
+        return size
+
+    def record(self, outcome: BatchOutcome, accepted: int):
+        """Adds the result of a request made with `outcome.batch_num` pairs."""
+        self._pending[outcome.batch_num] -= 1
+        stats = self.stats.setdefault(outcome.batch_num, SizeStats())
+        stats.count += 1
+        for name in (
+            "requests",
+            "seconds",
+            "parse_failures",
+            "truncations",
+            "returned",
+            "accepted",
+        ):
+            setattr(stats, name, getattr(stats, name) * self.decay)
+        stats.requests += 1
+        stats.seconds += outcome.seconds
+        stats.parse_failures += outcome.damaged
+        stats.truncations += outcome.truncated
+        stats.returned += outcome.returned
+        stats.accepted += accepted
+
+    def summary(self) -> str:
+        parts = [
+            f"{size}: {stats.score():.2f}/s "
+            f"(n={stats.count}, fail={stats.parse_failures / stats.requests:.0%}, "
+            f"trunc={stats.truncations / stats.requests:.0%})"
+            for size, stats in self.stats.items()
+            if stats.count
+        ]
+        details = f" [{', '.join(parts)}]" if parts else ""
+        return f"current {self.current}{details}"
+
+    def state(self) -> Dict:
+        return {
+            "current": self.current,
+            "stats": {str(size): asdict(stats) for size, stats in self.stats.items()},
+        }
+
+    def restore(self, state: Dict):
+        """Restores a state saved by `state()`, limited to the current bounds."""
+        for size, stats in state.get("stats", {}).items():
+            if self.minimum <= int(size) <= self.maximum:
+                self.stats[int(size)] = SizeStats(**stats)
+        self.current = self._clamp(state.get("current", self.current))
+        self.stats.setdefault(self.current, SizeStats())
+        self.stats = dict(sorted(self.stats.items()))
+
+    def _clamp(self, size: int) -> int:
+        return min(max(size, self.minimum), self.maximum)
+
+    def _observed(self, size: int) -> int:
+        return self.stats[size].count + self._pending[size]
+
+    def _choose(self) -> int:
+        if self._observed(self.current) < self.min_observations:
+            return self.current
+
+        measured = [
+            size
+            for size, stats in self.stats.items()
+            if stats.count >= self.min_observations
+        ]
+        if measured:
+            self.current = max(measured, key=lambda size: self.stats[size].score())
+
+        sizes = list(self.stats)
+        position = sizes.index(self.current)
+        neighbours = sizes[max(position - 1, 0) : position + 2]
+        neighbours.remove(self.current)
+        for size in neighbours:
+            if self._observed(size) < self.min_observations:
+                return size
+        if neighbours and self._rng.random() < self.explore_rate:
+            return self._rng.choice(neighbours)
+        return self.current
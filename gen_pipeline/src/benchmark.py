@@ -0,0 +1,259 @@
+import argparse
+import logging
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from constants import CAR_PROPERTY_FUNCTIONS_FILE, VEHICLE_PROPERTIES_FILE
+from data.data_filter import QueryFilter
+from data.data_format import QueryItem
+from generation_pipeline import GenerationPipeline
+from inference.fake.fake_engine import FakeLLMEngine
+
+logger = logging.getLogger(__name__)
+
+_SRC_DIR = Path(__file__).resolve().parent
+# The module each startup target imports; None runs `cli.py --help`.
+_STARTUP_TARGETS: Dict[str, Optional[str]] = {
+    "cli --help": None,
+    "generate": "generation_pipeline",
+    "refine": "refine",
+    "evaluate": "evaluate",
+}
+
+
+class _TimedQueryFilter(QueryFilter):
+    def __init__(self, existing_data: List[QueryItem], **kwargs):
+        start = time.perf_counter()
+        super().__init__(existing_data, **kwargs)
+        self.seconds = time.perf_counter() - start
+
+    def extend_unique(self, new_data: List[QueryItem]):
+        start = time.perf_counter()
+        super().extend_unique(new_data)
+        self.seconds += time.perf_counter() - start
+
+
+class _TimedPipeline(GenerationPipeline):
+    """Generation pipeline that records the time spent filtering and saving."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.filter = None
+        self.save_seconds = 0.0
+
+    def _create_filter(self, data: List[QueryItem]) -> QueryFilter:
+        self.filter = _TimedQueryFilter(data, **self._filter_options())
+        return self.filter
+
+    def _write_output(self, data: List[QueryItem]):
+        start = time.perf_counter()
+        super()._write_output(data)
+        self.save_seconds += time.perf_counter() - start
+
+    def _append_journal(self, items: List[QueryItem]):
+        start = time.perf_counter()
+        super()._append_journal(items)
+        self.save_seconds += time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Car tool pipeline benchmarks.")
+    subparsers = parser.add_subparsers(
+        dest="command", required=True, help="available benchmarks"
+    )
+    parser_gen = subparsers.add_parser(
+        "generate", help="Run `generate` end to end against a local fake engine."
+    )
+    parser_gen.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 100000],
+        help="the sample targets to benchmark",
+    )
+    parser_gen.add_argument(
+        "--work-dir",
+        type=Path,
+        default=None,
+        help="the directory for the generated datasets "
+        "(default: a temporary directory removed afterwards)",
+    )
+    parser_gen.add_argument(
+        "--latency", type=float, default=0.0, help="mean fake LLM latency in seconds"
+    )
+    parser_gen.add_argument(
+        "--malformed-rate",
+        type=float,
+        default=0.05,
+        help="the fraction of truncated fake responses",
+    )
+    parser_gen.add_argument(
+        "--duplicate-rate",
+        type=float,
+        default=0.1,
+        help="the fraction of duplicated items within a fake response",
+    )
+    parser_gen.add_argument(
+        "--concurrency", type=int, default=1, help="expansion requests in flight"
+    )
+    parser_gen.add_argument(
+        "--save-interval", type=int, default=5, help="checkpoint every N loops"
+    )
+    parser_gen.add_argument(
+        "--filter-mode",
+        choices=["lsh", "exact"],
+        default="lsh",
+        help="duplicate filter strategy",
+    )
+    parser_gen.add_argument(
+        "--filter-workers",
+        type=int,
+        default=1,
+        help="the number of duplicate filter processes",
+    )
+    parser_gen.add_argument(
+        "--checkpoint-mode",
+        choices=["rewrite", "journal"],
+        default="rewrite",
+        help="how intermediate results are saved",
+    )
+    parser_gen.add_argument(
+        "--example-sampling",
+        choices=["coverage", "random"],
+        default="coverage",
+        help="how expansion examples are selected",
+    )
+    parser_gen.add_argument(
+        "--filter-tokenizer",
+        type=Path,
+        default=None,
+        help="a local tokenizer.json for the duplicate filter",
+    )
+    parser_gen.add_argument("--seed", type=int, default=0, help="random seed")
+    parser_gen.set_defaults(func=bench_generate)
+    parser_startup = subparsers.add_parser(
+        "startup",
+        help="Measure the cold start time of `cli.py` and of each subcommand's imports.",
+    )
+    parser_startup.add_argument(
+        "--repeat", type=int, default=5, help="runs per target (the median is reported)"
+    )
+    parser_startup.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    logging.basicConfig(format="[%(levelname)s] [%(name)s] %(message)s")
+    logger.setLevel(logging.INFO)
+    args.func(args)
+
+
+def bench_generate(args):
+    if args.work_dir is None:
+        with tempfile.TemporaryDirectory(prefix="cartool-benchmark-") as work_dir:
+            args.work_dir = Path(work_dir)
+            bench_generate(args)
+        return
+
+    rows = []
+    for size in args.sizes:
+        random.seed(args.seed)
+        engine = FakeLLMEngine(
+            CAR_PROPERTY_FUNCTIONS_FILE,
+            VEHICLE_PROPERTIES_FILE,
+            seed=args.seed,
+            latency=args.latency,
+            malformed_rate=args.malformed_rate,
+            duplicate_rate=args.duplicate_rate,
+        )
+
+        run_dir = args.work_dir / f"generate_{size}"
+        shutil.rmtree(run_dir, ignore_errors=True)
+        pipeline = _TimedPipeline(
+            size,
+            run_dir / "dataset.json",
+            args.save_interval,
+            args.concurrency,
+            engine=engine,
+            filter_mode=args.filter_mode,
+            filter_workers=args.filter_workers,
+            checkpoint_mode=args.checkpoint_mode,
+            example_sampling=args.example_sampling,
+            filter_tokenizer=args.filter_tokenizer,
+        )
+        start = time.perf_counter()
+        pipeline.run()
+        total = time.perf_counter() - start
+
+        per_call = pipeline._expansion_accepted / max(pipeline._expansion_calls, 1)
+        rows.append(
+            (
+                size,
+                total,
+                size / total,
+                pipeline.filter.seconds,
+                pipeline.save_seconds,
+                per_call,
+            )
+        )
+        logger.info("Finished %d samples in %.1fs", size, total)
+
+    print(
+        f"{'samples':>10} {'total s':>10} {'samples/s':>10} {'filter s':>10} "
+        f"{'save s':>10} {'acc/call':>10}"
+    )
+    for size, total, rate, filter_s, save_s, per_call in rows:
+        print(
+            f"{size:>10} {total:>10.2f} {rate:>10.1f} {filter_s:>10.2f} "
+            f"{save_s:>10.2f} {per_call:>10.2f}"
+        )
+
+
+def bench_startup(args):
+    rows = []
+    for target, module in _STARTUP_TARGETS.items():
+        runs = [_time_startup(module) for _ in range(args.repeat)]
+        wall = statistics.median(wall for wall, _, _ in runs)
+        imports = statistics.median(imports for _, imports, _ in runs)
+        heaviest = ", ".join(
+            f"{package} {seconds * 1000:.0f}ms"
+            for package, seconds in runs[-1][2].most_common(3)
+        )
+        rows.append((target, wall, imports, heaviest))
+
+    print(f"{'target':>12} {'wall s':>10} {'import s':>10}  heaviest packages")
+    for target, wall, imports, heaviest in rows:
+        print(f"{target:>12} {wall:>10.2f} {imports:>10.2f}  {heaviest}")
+
+
+def _time_startup(module: Optional[str]) -> Tuple[float, float, Counter]:
+    """
+    Runs a fresh interpreter with `-X importtime`; returns the wall time, the
+    total import time and the import time per top-level package.
+    """
+    if module is None:
+        command = [sys.executable, "-X", "importtime", "cli.py", "--help"]
+    else:
+        command = [sys.executable, "-X", "importtime", "-c", f"import {module}"]
+    start = time.perf_counter()
+    result = subprocess.run(
+        command, cwd=_SRC_DIR, capture_output=True, text=True, check=True
+    )
+    wall = time.perf_counter() - start
+
+    packages = Counter()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        packages[name.strip().split(".")[0]] += int(self_us) / 1e6
+    return wall, sum(packages.values()), packages
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,17 @@
 import argparse
 import logging
+import random
 from pathlib import Path
-from generation_pipeline import GenerationPipeline
-from refine import PostProcess
+from data.seed_format import COMPRESSIONS
+from data.tool_calls import PARSERS
+from constants import (
+    CACHE_MAX_MB,
+    CONTEXT_CACHE_TTL,
+    BATCH_SIZE_MIN,
+    BATCH_SIZE_MAX,
+    MODEL_NAME,
+    OPENAI_BASE_URL,
+)
 
 
 def main():
@@ -30,6 +39,134 @@ def main():
         default=5,
         help="save intermediate results every N loops (0 to disable intermediate saving)",
     )
+    parser_gen.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="the number of expansion requests kept in flight at once",
+    )
+    parser_gen.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=None,
+        help="cache raw LLM responses in this directory and replay them, by request "
+        "number, on resumed runs and re-runs",
+    )
+    parser_gen.add_argument(
+        "--cache-max-mb",
+        type=int,
+        default=CACHE_MAX_MB,
+        help="the maximum on-disk size of the response cache in MB",
+    )
+    parser_gen.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="random seed for example selection",
+    )
+    parser_gen.add_argument(
+        "--filter-mode",
+        choices=["lsh", "exact"],
+        default="lsh",
+        help="duplicate filter strategy: check only LSH candidates, or every existing sample",
+    )
+    parser_gen.add_argument(
+        "--filter-workers",
+        type=int,
+        default=1,
+        help="the number of processes used to check candidates against existing samples",
+    )
+    parser_gen.add_argument(
+        "--no-token-cache",
+        action="store_true",
+        help="do not persist the duplicate filter's tokens next to the output file",
+    )
+    parser_gen.add_argument(
+        "--filter-tokenizer",
+        type=Path,
+        default=None,
+        help="a local tokenizer.json for the duplicate filter, loaded without "
+        "transformers (default: the gpt2 tokenizer from the Hugging Face hub)",
+    )
+    parser_gen.add_argument(
+        "--checkpoint-mode",
+        choices=["rewrite", "journal"],
+        default="rewrite",
+        help="rewrite the whole output at each checkpoint, or append new samples "
+        "to a JSONL journal and compact it into the output at the end",
+    )
+    parser_gen.add_argument(
+        "--skip-answer-validation",
+        action="store_true",
+        help="keep samples whose answers do not match the vehicle property catalogue",
+    )
+    parser_gen.add_argument(
+        "--context-cache-ttl",
+        type=int,
+        default=CONTEXT_CACHE_TTL,
+        help="lifetime in seconds of the cached static prompt prefix (0 to send it inline)",
+    )
+    parser_gen.add_argument(
+        "--property-subset",
+        type=int,
+        default=0,
+        help="list only the properties used by the examples plus N others in each prompt (0 to list all)",
+    )
+    parser_gen.add_argument(
+        "--example-sampling",
+        choices=["coverage", "random"],
+        default="coverage",
+        help="coverage favours examples and hints from rarely used function calls; random samples examples uniformly",
+    )
+    parser_gen.add_argument(
+        "--batch-size-min",
+        type=int,
+        default=BATCH_SIZE_MIN,
+        help="the smallest number of pairs requested per prompt",
+    )
+    parser_gen.add_argument(
+        "--batch-size-max",
+        type=int,
+        default=BATCH_SIZE_MAX,
+        help="the largest number of pairs requested per prompt (equal to --batch-size-min "
+        "to disable adaptive sizing; adaptive sizing is always off with --cache-dir)",
+    )
+    parser_gen.add_argument(
+        "--engine",
+        choices=["gemini", "openai"],
+        default="gemini",
+        help="generate with Gemini, or with a self-hosted server exposing the "
+        "OpenAI chat completions API (e.g. vLLM or llama-server)",
+    )
+    parser_gen.add_argument(
+        "--model",
+        default=None,
+        help=f"the model name (default: {MODEL_NAME}; required for --engine openai)",
+    )
+    parser_gen.add_argument(
+        "--base-url",
+        default=OPENAI_BASE_URL,
+        help="the API base URL of the OpenAI-compatible server",
+    )
+    parser_gen.add_argument(
+        "--rpm",
+        type=float,
+        default=None,
+        help="the requests-per-minute quota of the Gemini API key (unlimited if not set)",
+    )
+    parser_gen.add_argument(
+        "--tpm",
+        type=float,
+        default=None,
+        help="the input-tokens-per-minute quota of the Gemini API key (unlimited if not set)",
+    )
+    parser_gen.add_argument(
+        "--metrics-out",
+        type=Path,
+        default=None,
+        help="periodically write stage timings, token usage and cost to this file "
+        "(Prometheus textfile if it ends in .prom, JSON otherwise)",
+    )
     parser_gen.set_defaults(func=handle_generate)
     # Subcommand: `refine`
     parser_refine = subparsers.add_parser(
@@ -50,7 +187,144 @@ def main():
     parser_refine.add_argument(
         "--output", required=True, type=Path, help="the output file path"
     )
+    parser_refine.add_argument(
+        "--trusted-input",
+        action="store_true",
+        help="skip per-field validation of the data file (only for files written by `generate`)",
+    )
+    parser_refine.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="the number of processes used to build entries",
+    )
+    parser_refine.add_argument(
+        "--format",
+        choices=["jsonl", "seeds"],
+        default="jsonl",
+        help="jsonl writes full entries; seeds writes the shared assets once plus a shuffle seed per sample",
+    )
+    parser_refine.add_argument(
+        "--compression",
+        choices=list(COMPRESSIONS),
+        default="none",
+        help="compress the output file",
+    )
+    parser_refine.add_argument(
+        "--metrics-out",
+        type=Path,
+        default=None,
+        help="write stage timings to this file "
+        "(Prometheus textfile if it ends in .prom, JSON otherwise)",
+    )
+    parser_refine.add_argument(
+        "--leakage",
+        choices=["report", "redraw", "off"],
+        default="report",
+        help="report eval items with near-duplicates in train, replace them "
+        "with clean train items, or skip the check",
+    )
+    parser_refine.add_argument(
+        "--filter-tokenizer",
+        type=Path,
+        default=None,
+        help="a local tokenizer.json for the near-duplicate check "
+        "(default: the gpt2 tokenizer from the Hugging Face hub)",
+    )
     parser_refine.set_defaults(func=handle_refine)
+    # Subcommand: `evaluate`
+    parser_eval = subparsers.add_parser(
+        "evaluate", help="Score a model on a split of a refined dataset."
+    )
+    parser_eval.add_argument(
+        "--data-file",
+        required=True,
+        type=Path,
+        help="path to the refined dataset (JSONL or seeds format)",
+    )
+    parser_eval.add_argument(
+        "--output",
+        required=True,
+        type=Path,
+        help="the JSONL file the scored entries are appended to "
+        "(a re-run resumes from it)",
+    )
+    parser_eval.add_argument(
+        "--split",
+        choices=["eval", "train", "all"],
+        default="eval",
+        help="the entries to evaluate",
+    )
+    parser_eval.add_argument(
+        "--parser",
+        choices=list(PARSERS),
+        default="json",
+        help="how function calls are extracted from the model output",
+    )
+    parser_eval.add_argument(
+        "--engine",
+        choices=["gemini", "openai"],
+        default="gemini",
+        help="evaluate a Gemini model, or a model served by a self-hosted "
+        "server exposing the OpenAI chat completions API",
+    )
+    parser_eval.add_argument(
+        "--model",
+        default=None,
+        help=f"the model name (default: {MODEL_NAME}; required for --engine openai)",
+    )
+    parser_eval.add_argument(
+        "--base-url",
+        default=OPENAI_BASE_URL,
+        help="the API base URL of the OpenAI-compatible server",
+    )
+    parser_eval.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="the number of requests kept in flight at once",
+    )
+    parser_eval.add_argument(
+        "--batch-size",
+        type=int,
+        default=32,
+        help="the number of entries scored and saved together",
+    )
+    parser_eval.add_argument(
+        "--temperature", type=float, default=0.0, help="the sampling temperature"
+    )
+    parser_eval.add_argument(
+        "--rpm",
+        type=float,
+        default=None,
+        help="the requests-per-minute quota of the Gemini API key (unlimited if not set)",
+    )
+    parser_eval.add_argument(
+        "--tpm",
+        type=float,
+        default=None,
+        help="the input-tokens-per-minute quota of the Gemini API key (unlimited if not set)",
+    )
+    parser_eval.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=None,
+        help="cache raw LLM responses in this directory and replay them on re-runs",
+    )
+    parser_eval.add_argument(
+        "--cache-max-mb",
+        type=int,
+        default=CACHE_MAX_MB,
+        help="the maximum on-disk size of the response cache in MB",
+    )
+    parser_eval.add_argument(
+        "--metrics-out",
+        type=Path,
+        default=None,
+        help="periodically write batch timings and token usage to this file "
+        "(Prometheus textfile if it ends in .prom, JSON otherwise)",
+    )
+    parser_eval.set_defaults(func=handle_evaluate)
 
     args = parser.parse_args()
     log_level = logging.DEBUG if args.verbose else logging.INFO
@@ -64,15 +338,81 @@ def main():
         parser.print_help()
 
 
+# Each handler imports its own pipeline, so that a subcommand (or `--help`)
+# does not pay for the dependencies of the others.
 def handle_generate(args):
-    pipeline = GenerationPipeline(args.num_samples, args.output, args.save_interval)
+    from generation_pipeline import GenerationPipeline
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    pipeline = GenerationPipeline(
+        args.num_samples,
+        args.output,
+        args.save_interval,
+        args.concurrency,
+        cache_dir=args.cache_dir,
+        cache_max_mb=args.cache_max_mb,
+        filter_mode=args.filter_mode,
+        filter_workers=args.filter_workers,
+        token_cache=not args.no_token_cache,
+        filter_tokenizer=args.filter_tokenizer,
+        checkpoint_mode=args.checkpoint_mode,
+        validate_answers=not args.skip_answer_validation,
+        context_cache_ttl=args.context_cache_ttl or None,
+        property_subset=args.property_subset,
+        example_sampling=args.example_sampling,
+        batch_size_min=args.batch_size_min,
+        batch_size_max=args.batch_size_max,
+        rpm=args.rpm,
+        tpm=args.tpm,
+        metrics_out=args.metrics_out,
+        engine_type=args.engine,
+        model_name=args.model,
+        base_url=args.base_url,
+    )
     pipeline.run()
 
 
 def handle_refine(args):
-    p = PostProcess(args.data_file, args.num_test, args.output)
+    from refine import PostProcess
+
+    p = PostProcess(
+        args.data_file,
+        args.num_test,
+        args.output,
+        trusted=args.trusted_input,
+        workers=args.workers,
+        output_format=args.format,
+        compression=args.compression,
+        metrics_out=args.metrics_out,
+        leakage=args.leakage,
+        filter_tokenizer=args.filter_tokenizer,
+    )
     p.refine()
 
 
+def handle_evaluate(args):
+    from evaluate import Evaluator
+
+    evaluator = Evaluator(
+        args.data_file,
+        args.output,
+        split=args.split,
+        parser=args.parser,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        temperature=args.temperature,
+        engine_type=args.engine,
+        model_name=args.model,
+        base_url=args.base_url,
+        rpm=args.rpm,
+        tpm=args.tpm,
+        cache_dir=args.cache_dir,
+        cache_max_mb=args.cache_max_mb,
+        metrics_out=args.metrics_out,
+    )
+    evaluator.run()
+
+
 if __name__ == "__main__":
     main()
@@ -6,8 +6,44 @@ VEHICLE_PROPERTY_SCHEMA_FILE = METADATA_DIR / "vehicle_property_schema.txt"
 VEHICLE_PROPERTIES_FILE = METADATA_DIR / "vehicle_properties.txt"
 CAR_PROPERTY_FUNCTIONS_FILE = METADATA_DIR / "car_property_functions.txt"
 
+# Maps a vehicle property `dataType` to the type part of its getter/setter name,
+# e.g. "Integer" -> getIntProperty / setIntProperty.
+DATA_TYPE_TO_FUNCTION_SUFFIX = {
+    "Boolean": "Boolean",
+    "Integer": "Int",
+    "Long": "Long",
+    "Float": "Float",
+    "String": "String",
+    "IntArray": "IntArray",
+    "LongArray": "LongArray",
+    "FloatArray": "FloatArray",
+}
+
 SECRETS_PATH = Path("secrets/access_token.toml")
 MODEL_NAME = "gemini-3-pro-preview"
+# Default endpoint of the OpenAI-compatible engine (vLLM's default port).
+OPENAI_BASE_URL = "http://localhost:8000/v1"
+CACHE_MAX_MB = 1024
+# Lifetime in seconds of the provider-side cache for the static prompt prefix.
+CONTEXT_CACHE_TTL = 3600
+# Number of least covered function calls suggested in each expansion prompt.
+COVERAGE_HINT_CELLS = 6
+# Pairs requested per prompt: starting sizes and the bounds for adaptive sizing.
+SEED_BATCH_SIZE = 15
+EXPANSION_BATCH_SIZE = 30
+BATCH_SIZE_MIN = 10
+BATCH_SIZE_MAX = 60
+BATCH_SIZE_STEP = 5
+# Consecutive failed expansion requests after which a run gives up.
+MAX_FAILED_REQUESTS_IN_A_ROW = 10
+# Gemini prices in USD per million tokens, used to estimate the cost of a run.
+PRICE_PER_M_INPUT_TOKENS = 2.00
+PRICE_PER_M_CACHED_INPUT_TOKENS = 0.20
+PRICE_PER_M_OUTPUT_TOKENS = 12.00
+# Minimum seconds between periodic writes of the metrics file.
+METRICS_WRITE_INTERVAL = 30
 
 FILTER_TOKENIZER_NAME = "gpt2"
 FILTER_THRESHOLD = 0.8
+FILTER_LSH_NUM_PERM = 128
+FILTER_LSH_BANDS = 32
@@ -0,0 +1,124 @@
+import json
+import random
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from .data_format import Answer, QueryItem
+from constants import DATA_TYPE_TO_FUNCTION_SUFFIX
+
+# (function name, propertyName, areaId)
+Cell = Tuple[str, str, int]
+
+
+class CoverageIndex:
+    """
+    Incremental coverage statistics of a dataset over the property catalogue.
+
+    Every answer falls into a (function, propertyName, areaId) cell; the index
+    counts the answers per cell, remembers which items touch each cell, and
+    counts queries by their number of calls. All cells the catalogue allows
+    start at zero, so cells the dataset has never exercised can be reported.
+    """
+
+    # Queries with at least this many calls share one bucket.
+    MAX_CALLS = 3
+
+    def __init__(self, properties_file: Path):
+        self.cell_counts: Counter = Counter(
+            {
+                cell: 0
+                for cell in self._catalogue_cells(
+                    json.loads(Path(properties_file).read_text(encoding="utf-8"))
+                )
+            }
+        )
+        self.call_counts: Counter = Counter(
+            {calls: 0 for calls in range(1, self.MAX_CALLS + 1)}
+        )
+        self._items_by_cell: Dict[Cell, List[int]] = defaultdict(list)
+        self._items_by_calls: Dict[int, List[int]] = defaultdict(list)
+        self._size = 0
+
+    def add(self, items: Iterable[QueryItem]):
+        """Indexes items appended to the dataset, in dataset order."""
+        for item in items:
+            index = self._size
+            self._size += 1
+            calls = min(len(item.answers), self.MAX_CALLS)
+            self.call_counts[calls] += 1
+            self._items_by_calls[calls].append(index)
+            for cell in {self._cell(answer) for answer in item.answers}:
+                if cell is None:
+                    continue
+                self.cell_counts[cell] += 1
+                self._items_by_cell[cell].append(index)
+
+    def sample_examples(self, data: List[QueryItem], k: int) -> List[QueryItem]:
+        """
+        Samples `k` distinct items, favouring items from rarely covered cells
+        (weighted by 1 / count) and items with the rarest number of calls.
+        """
+        k = min(k, len(data))
+        chosen: Dict[int, None] = {}
+        # A quarter of the examples demonstrate the least common call count.
+        rare_calls = self.rarest_call_count(require_items=True)
+        if rare_calls is not None:
+            pool = self._items_by_calls[rare_calls]
+            for index in random.sample(pool, min(k // 4, len(pool))):
+                chosen[index] = None
+
+        cells = list(self._items_by_cell)
+        if cells:
+            weights = [1.0 / self.cell_counts[cell] for cell in cells]
+            for _ in range(4 * k):
+                if len(chosen) >= k:
+                    break
+                cell = random.choices(cells, weights)[0]
+                chosen[random.choice(self._items_by_cell[cell])] = None
+
+        if len(chosen) < k:
+            remaining = [i for i in range(len(data)) if i not in chosen]
+            for index in random.sample(remaining, k - len(chosen)):
+                chosen[index] = None
+        return [data[index] for index in chosen]
+
+    def underrepresented(self, n: int) -> List[Cell]:
+        """Returns `n` of the least covered catalogue cells, ties broken randomly."""
+        keys = {cell: (count, random.random()) for cell, count in self.cell_counts.items()}
+        return sorted(keys, key=keys.__getitem__)[:n]
+
+    def rarest_call_count(self, require_items: bool = False) -> Optional[int]:
+        """Returns the call count bucket with the fewest queries."""
+        buckets = [
+            calls
+            for calls in self.call_counts
+            if not require_items or self._items_by_calls[calls]
+        ]
+        if not buckets:
+            return None
+        return min(buckets, key=lambda calls: (self.call_counts[calls], calls))
+
+    @staticmethod
+    def _cell(answer: Answer) -> Optional[Cell]:
+        property_name = answer.arguments.get("propertyName")
+        area_id = answer.arguments.get("areaId")
+        if not isinstance(property_name, str) or not isinstance(area_id, int):
+            return None
+        return answer.name, property_name, area_id
+
+    @staticmethod
+    def _catalogue_cells(properties: List[Dict]) -> List[Cell]:
+        cells = []
+        for prop in properties:
+            suffix = DATA_TYPE_TO_FUNCTION_SUFFIX.get(prop["dataType"])
+            if suffix is None:
+                continue
+            functions = []
+            if prop["access"] != "WriteOnly":
+                functions.append(f"get{suffix}Property")
+            if prop["access"] != "ReadOnly":
+                functions.append(f"set{suffix}Property")
+            for profile in prop.get("areaIdProfiles", []):
+                for function in functions:
+                    cells.append((function, prop["propertyName"], profile["areaId"]))
+        return cells
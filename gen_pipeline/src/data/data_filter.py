@@ -1,10 +1,20 @@
 import logging
 import re
-from typing import List, Iterable
+from pathlib import Path
+from typing import Any, Dict, List, Iterable, Optional, Sequence
 from .data_format import QueryItem
-from transformers import AutoTokenizer
-from rouge_score import rouge_scorer
-from constants import FILTER_THRESHOLD, FILTER_TOKENIZER_NAME
+from .filter_tokenizer import FilterTokenizer
+from .lcs import LCSMatcher
+from .lsh_index import MinHashLSHIndex
+from .sharded_scorer import ShardedOverlapScorer
+from .token_cache import TokenCache
+from .token_store import TokenStore
+from metrics import Metrics
+from constants import (
+    FILTER_THRESHOLD,
+    FILTER_LSH_NUM_PERM,
+    FILTER_LSH_BANDS,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -12,17 +22,68 @@ logger = logging.getLogger(__name__)
 class QueryFilter:
     """
     Filters data by rejecting those with high ROUGE-L token overlap.
+
+    By default, a MinHash/LSH index narrows the existing items down to likely
+    near-duplicates before the exact ROUGE-L check (see MinHashLSHIndex for
+    the recall bound). Pass `use_index=False` to compare every candidate
+    against every existing item instead.
+
+    Masked queries are stored as integer token IDs and scored with a
+    bit-parallel LCS (see LCSMatcher), which yields exactly the same scores as
+    `rouge_scorer._score_lcs` over the token strings.
+
+    With `workers > 1`, the comparison against existing items is spread over
+    a process pool holding shards of the token store (see
+    ShardedOverlapScorer). Call `close()` to release the pool.
+
+    When `cache_path` is given, token IDs are persisted in sidecar files with
+    that prefix (see TokenCache), so a resumed run only tokenizes items that
+    are not cached yet.
+
+    Queries are tokenized with FILTER_TOKENIZER_NAME, or with the standalone
+    `tokenizer.json` at `tokenizer_file` if given (see FilterTokenizer).
+
+    Each step of `extend_unique()` is timed in `metrics` as a `filter_*` stage.
     """
 
     MASK_TOKEN = "<ARG>"
     DEBUG = True
 
-    def __init__(self, existing_data: List[QueryItem]):
-        self.tokenizer = AutoTokenizer.from_pretrained(FILTER_TOKENIZER_NAME)
+    def __init__(
+        self,
+        existing_data: List[QueryItem],
+        use_index: bool = True,
+        workers: int = 1,
+        cache_path: Optional[Path] = None,
+        metrics: Optional[Metrics] = None,
+        tokenizer_file: Optional[Path] = None,
+    ):
+        self.metrics = metrics or Metrics()
+        self.tokenizer = FilterTokenizer.load(tokenizer_file)
         self._existing_data = existing_data
-        self._existing_tokens: List[List[str]] = [
-            self._get_masked_tokens(item) for item in existing_data
-        ]
+
+        self._token_cache = None
+        self._existing_tokens = TokenStore()
+        cached_count = 0
+        if cache_path is not None:
+            self._token_cache = TokenCache(cache_path, self._tokenizer_id())
+            self._existing_tokens, cached_count = self._token_cache.load(
+                existing_data
+            )
+        uncached_data = existing_data[cached_count:]
+        uncached_tokens = [self._get_masked_tokens(item) for item in uncached_data]
+        self._existing_tokens.extend(uncached_tokens)
+        if self._token_cache is not None:
+            self._token_cache.append(uncached_data, uncached_tokens)
+
+        self._index = None
+        if use_index:
+            self._index = MinHashLSHIndex(FILTER_LSH_NUM_PERM, FILTER_LSH_BANDS)
+            for tokens in self._existing_tokens:
+                self._index.add(self._index.signature(tokens))
+        self._scorer = None
+        if workers > 1:
+            self._scorer = ShardedOverlapScorer(self._existing_tokens, workers)
 
     def extend_unique(self, new_data: List[QueryItem]):
         """
@@ -30,46 +91,106 @@ class QueryFilter:
         """
         accepted_buffer = []
         accepted_tokens_buffer = []
-
-        for candidate in new_data:
-            candidate_tokens = self._get_masked_tokens(candidate)
-
-            if not self._validate(candidate_tokens, self._existing_tokens):
-                continue
-
-            if not self._validate(candidate_tokens, accepted_tokens_buffer):
-                continue
-
-            accepted_buffer.append(candidate)
-            accepted_tokens_buffer.append(candidate_tokens)
-
-        self._existing_data.extend(accepted_buffer)
-        self._existing_tokens.extend(accepted_tokens_buffer)
+        accepted_signatures = []
+
+        with self.metrics.timer("filter_tokenize"):
+            candidates_tokens = [self._get_masked_tokens(c) for c in new_data]
+        signatures = [None] * len(new_data)
+        candidate_ids = None
+        if self._index is not None:
+            # Only items sharing an LSH band can be near-duplicates.
+            with self.metrics.timer("filter_lsh"):
+                signatures = [self._index.signature(t) for t in candidates_tokens]
+                candidate_ids = [sorted(self._index.query(s)) for s in signatures]
+
+        with self.metrics.timer("filter_score"):
+            if self._scorer is not None:
+                rejected = self._scorer.rejected(candidates_tokens, candidate_ids)
+            else:
+                rejected = [
+                    not self._validate(
+                        tokens, self._existing_context(candidate_ids, k)
+                    )
+                    for k, tokens in enumerate(candidates_tokens)
+                ]
+
+        with self.metrics.timer("filter_batch"):
+            for candidate, candidate_tokens, signature, is_rejected in zip(
+                new_data, candidates_tokens, signatures, rejected
+            ):
+                if is_rejected:
+                    continue
+
+                if not self._validate(candidate_tokens, accepted_tokens_buffer):
+                    continue
+
+                accepted_buffer.append(candidate)
+                accepted_tokens_buffer.append(candidate_tokens)
+                accepted_signatures.append(signature)
+
+        with self.metrics.timer("filter_commit"):
+            self._existing_data.extend(accepted_buffer)
+            self._existing_tokens.extend(accepted_tokens_buffer)
+            if self._token_cache is not None:
+                self._token_cache.append(accepted_buffer, accepted_tokens_buffer)
+            if self._index is not None:
+                for signature in accepted_signatures:
+                    self._index.add(signature)
+
+    def close(self):
+        """Shuts down the worker pool, if any."""
+        if self._scorer is not None:
+            self._scorer.close()
+            self._scorer = None
+
+    def _tokenizer_id(self) -> str:
+        # Cached IDs are only valid for the same vocabulary and masking.
+        return f"{self.tokenizer.identity}|{self.MASK_TOKEN}"
+
+    def _existing_context(
+        self, candidate_ids: Optional[List[List[int]]], k: int
+    ) -> Iterable[Sequence[int]]:
+        if candidate_ids is None:
+            return self._existing_tokens
+        return (self._existing_tokens[i] for i in candidate_ids[k])
 
     def _validate(
-        self, candidate_tokens: List[str], context_tokens: Iterable[List[str]]
+        self, candidate_tokens: List[int], context_tokens: Iterable[Sequence[int]]
     ) -> bool:
+        matcher = LCSMatcher(candidate_tokens)
         for existing_tokens in context_tokens:
-            score = rouge_scorer._score_lcs(candidate_tokens, existing_tokens).fmeasure
+            # Skip pairs whose lengths alone rule out the threshold. The margin
+            # keeps float rounding from changing any decision.
+            if matcher.max_fmeasure(len(existing_tokens)) < FILTER_THRESHOLD - 1e-9:
+                continue
+            score = matcher.fmeasure(existing_tokens)
             if score > FILTER_THRESHOLD:
                 if self.DEBUG:
-                    c_s = self.tokenizer.convert_tokens_to_string(candidate_tokens)
-                    e_s = self.tokenizer.convert_tokens_to_string(existing_tokens)
+                    c_s = self.tokenizer.decode(candidate_tokens)
+                    e_s = self.tokenizer.decode(existing_tokens)
                     logger.debug(f"Query '{c_s}' overlaps '{e_s}'. Score: {score}")
                 return False
         return True
 
-    def _get_masked_tokens(self, item: QueryItem) -> List[str]:
+    def _get_masked_tokens(self, item: QueryItem) -> List[int]:
+        """Tokenizes the masked query of an item into token IDs."""
+        masked_query = self.mask_query(
+            item.query, [answer.arguments for answer in item.answers]
+        )
+        return self.tokenizer.encode(masked_query)
+
+    @classmethod
+    def mask_query(cls, query: str, arguments: Iterable[Dict[str, Any]]) -> str:
         """
-        Replaces specific argument values in the query with a generic mask
-        and then tokenizes the result.
+        Replaces the argument values of the answers in the query with a
+        generic mask.
         """
-        masked_query = item.query
+        masked_query = query
 
         # Collect all values from arguments that need to be masked
         values_to_mask = []
-        for answer in item.answers:
-            for val in answer.arguments.values():
+        for answer_arguments in arguments:
+            for val in answer_arguments.values():
                 # Only mask strings and numbers
                 if isinstance(val, (str, int, float)):
                     values_to_mask.append(str(val))
@@ -84,7 +205,7 @@ class QueryFilter:
             if len(val) > 1 or val.isdigit():
                 pattern = re.escape(val)
                 masked_query = re.sub(
-                    pattern, self.MASK_TOKEN, masked_query, flags=re.IGNORECASE
+                    pattern, cls.MASK_TOKEN, masked_query, flags=re.IGNORECASE
                 )
 
-        return self.tokenizer.tokenize(masked_query)
+        return masked_query
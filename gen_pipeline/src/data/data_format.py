@@ -1,8 +1,11 @@
 import json
-from pydantic import BaseModel, field_validator
-from typing import List, Dict, Any
+import logging
+from pydantic import BaseModel, TypeAdapter, field_validator
+from typing import List, Dict, Any, Iterator, TextIO
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
 
 class Answer(BaseModel):
     name: str
@@ -20,16 +23,116 @@ class QueryItem(BaseModel):
         return v
 
 
-def parse_generated_data_safely(json_str) -> List[QueryItem]:
+def load_existing_data(file, journal=None, trusted=False) -> List[QueryItem]:
+    """
+    Loads a generated JSON dataset. If `journal` names an existing JSONL file,
+    the samples appended to it since the dataset was last written follow.
+    The output file may be missing when only the journal was written.
+    """
+    data = []
+    if Path(file).exists():
+        data.extend(iter_query_items(file, trusted=trusted))
+    if journal is not None and Path(journal).exists():
+        data.extend(load_journal(journal, trusted=trusted))
+    return data
+
+
+def load_journal(file, trusted=False) -> List[QueryItem]:
+    """
+    Loads samples from a JSONL journal. A truncated final line, left by a
+    crash during an append, is skipped.
+    """
+    return list(iter_query_items(file, trusted=trusted, skip_truncated_tail=True))
+
+
+_QUERY_ITEMS_ADAPTER = TypeAdapter(List[QueryItem])
+
+
+def iter_query_items(
+    file,
+    trusted: bool = False,
+    batch_size: int = 1024,
+    skip_truncated_tail: bool = False,
+) -> Iterator[QueryItem]:
     """
-    Parses the generated JSON format data and validates the format.
+    Streams QueryItems from a JSON array or JSONL file in bounded memory.
+
+    Raw objects are validated `batch_size` at a time. With `trusted=True`,
+    items are constructed without per-field validation; only use it for
+    files written by this pipeline.
     """
-    raw_data = json.loads(json_str)
+    with open(file, "r", encoding="utf-8") as f:
+        first_char = f.read(1)
+        while first_char.isspace():
+            first_char = f.read(1)
+        if first_char == "[":
+            raw_items = _iter_json_array(f)
+        else:
+            raw_items = _iter_json_lines(f, first_char, skip_truncated_tail, file)
+
+        batch = []
+        for raw_item in raw_items:
+            batch.append(raw_item)
+            if len(batch) >= batch_size:
+                yield from to_query_items(batch, trusted)
+                batch = []
+        yield from to_query_items(batch, trusted)
+
+
+def to_query_items(raw_items: List[Dict], trusted: bool = False) -> List[QueryItem]:
+    """
+    Converts raw sample dicts to QueryItems, skipping validation if `trusted`.
+    """
+    if not trusted:
+        return _QUERY_ITEMS_ADAPTER.validate_python(raw_items)
+    return [
+        QueryItem.model_construct(
+            query=raw["query"],
+            answers=[Answer.model_construct(**answer) for answer in raw["answers"]],
+        )
+        for raw in raw_items
+    ]
+
 
-    validated_data = [QueryItem(**item) for item in raw_data]
-    return validated_data
+def _iter_json_array(f: TextIO, chunk_size: int = 1 << 20) -> Iterator[Any]:
+    """Yields the elements of a JSON array whose opening bracket was consumed."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        if pos < len(buffer):
+            try:
+                element, pos = decoder.raw_decode(buffer, pos)
+                yield element
+                continue
+            except json.JSONDecodeError:
+                # The element may continue in the next chunk.
+                if eof:
+                    raise
+        elif eof:
+            raise ValueError("Unterminated JSON array.")
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
 
 
-def load_existing_data(file) -> List[QueryItem]:
-    content = Path(file).read_text(encoding="utf-8")
-    return parse_generated_data_safely(content)
+def _iter_json_lines(
+    f: TextIO, first_char: str, skip_truncated_tail: bool, file
+) -> Iterator[Any]:
+    line = first_char + f.readline()
+    while line:
+        next_line = f.readline()
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                if next_line or not skip_truncated_tail:
+                    raise
+                logger.warning("Skipping truncated last line of %s", file)
+        line = next_line
@@ -0,0 +1,172 @@
+import json
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, Optional
+from .data_format import Answer, QueryItem
+from constants import DATA_TYPE_TO_FUNCTION_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class AreaSpec:
+    min_value: Optional[float]
+    max_value: Optional[float]
+    enum_values: FrozenSet
+
+
+@dataclass(frozen=True)
+class PropertySpec:
+    data_type: str
+    access: str
+    areas: Dict[int, AreaSpec]
+
+
+@dataclass(frozen=True)
+class FunctionSpec:
+    is_setter: bool
+    data_type: str
+    parameters: FrozenSet[str]
+    required: FrozenSet[str]
+
+
+class AnswerValidator:
+    """
+    Checks generated answers against the vehicle property catalogue.
+
+    The property and function metadata are indexed by name once, so every
+    answer is checked with a few dictionary lookups. Rejected items are
+    counted by the reason of their first invalid answer in `rejections`.
+    """
+
+    def __init__(self, properties_file: Path, functions_file: Path):
+        self._properties = self._index_properties(
+            json.loads(Path(properties_file).read_text(encoding="utf-8"))
+        )
+        self._functions = self._index_functions(
+            json.loads(Path(functions_file).read_text(encoding="utf-8"))
+        )
+        self.rejections: Counter = Counter()
+
+    def filter(self, items: List[QueryItem]) -> List[QueryItem]:
+        """Returns the items whose answers are all valid."""
+        valid_items = []
+        for item in items:
+            reason = next(
+                (r for r in map(self.check, item.answers) if r is not None), None
+            )
+            if reason is None:
+                valid_items.append(item)
+            else:
+                self.rejections[reason] += 1
+                logger.debug("Rejected query '%s': %s", item.query, reason)
+        return valid_items
+
+    def check(self, answer: Answer) -> Optional[str]:
+        """Returns the reason why the answer is invalid, or None if it is valid."""
+        function = self._functions.get(answer.name)
+        if function is None:
+            return "unknown_function"
+        arguments = answer.arguments
+        if not function.required.issubset(arguments):
+            return "missing_argument"
+        if not function.parameters.issuperset(arguments):
+            return "unexpected_argument"
+
+        property_name = arguments.get("propertyName")
+        prop = None
+        if isinstance(property_name, str):
+            prop = self._properties.get(property_name)
+        if prop is None:
+            return "unknown_property"
+        if prop.data_type != function.data_type:
+            return "data_type_mismatch"
+        if function.is_setter and prop.access == "ReadOnly":
+            return "write_to_read_only"
+        if not function.is_setter and prop.access == "WriteOnly":
+            return "read_from_write_only"
+
+        area_id = arguments.get("areaId")
+        area = None
+        if isinstance(area_id, int) and not isinstance(area_id, bool):
+            area = prop.areas.get(area_id)
+        if area is None:
+            return "invalid_area_id"
+
+        if function.is_setter:
+            return self._check_value(arguments.get("value"), prop.data_type, area)
+        return None
+
+    @staticmethod
+    def _check_value(value: Any, data_type: str, area: AreaSpec) -> Optional[str]:
+        if data_type == "Boolean":
+            return None if isinstance(value, bool) else "invalid_value_type"
+        if data_type == "String":
+            return None if isinstance(value, str) else "invalid_value_type"
+
+        if data_type.endswith("Array"):
+            if not isinstance(value, list) or not value:
+                return "invalid_value_type"
+            elements = value
+        else:
+            elements = [value]
+
+        allow_float = data_type.startswith("Float")
+        for element in elements:
+            if isinstance(element, bool) or not isinstance(
+                element, (int, float) if allow_float else int
+            ):
+                return "invalid_value_type"
+            if area.min_value is not None and element < area.min_value:
+                return "value_out_of_range"
+            if area.max_value is not None and element > area.max_value:
+                return "value_out_of_range"
+            if area.enum_values and element not in area.enum_values:
+                return "value_not_in_enum"
+        return None
+
+    @staticmethod
+    def _index_properties(properties: List[Dict]) -> Dict[str, PropertySpec]:
+        index = {}
+        for prop in properties:
+            areas = {}
+            for profile in prop.get("areaIdProfiles", []):
+                areas[profile["areaId"]] = AreaSpec(
+                    min_value=_parse_bound(profile.get("minValue")),
+                    max_value=_parse_bound(profile.get("maxValue")),
+                    enum_values=frozenset(profile.get("supportedEnumValues") or []),
+                )
+            index[prop["propertyName"]] = PropertySpec(
+                data_type=prop["dataType"], access=prop["access"], areas=areas
+            )
+        return index
+
+    @staticmethod
+    def _index_functions(functions: List[Dict]) -> Dict[str, FunctionSpec]:
+        suffix_to_data_type = {
+            suffix: data_type
+            for data_type, suffix in DATA_TYPE_TO_FUNCTION_SUFFIX.items()
+        }
+        index = {}
+        for function in functions:
+            name = function["name"]
+            is_setter = name.startswith("set")
+            suffix = name[3 : -len("Property")]
+            if suffix not in suffix_to_data_type:
+                raise ValueError(f"Cannot infer the data type of function '{name}'.")
+            parameters = function.get("parameters", {})
+            index[name] = FunctionSpec(
+                is_setter=is_setter,
+                data_type=suffix_to_data_type[suffix],
+                parameters=frozenset(parameters.get("properties", {})),
+                required=frozenset(parameters.get("required", [])),
+            )
+        return index
+
+
+def _parse_bound(value) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    return float(value)
@@ -0,0 +1,115 @@
+import json
+import random
+from typing import Dict, List, Optional, Tuple
+
+# Stands in for a shuffled container while an object is serialized; its encoded
+# form is then used to split the output around the container.
+_SLOT = "\x00slot\x00"
+_ENCODED_SLOT = json.dumps(_SLOT)
+
+
+class EntryTemplate:
+    """
+    Pre-serialized pieces of a JSONL entry.
+
+    Every tool, tool parameter, vehicle property and `areaIdProfile` is
+    serialized once. An entry is assembled by joining the pieces in a random
+    order, which yields the same bytes as shuffling the parsed objects and
+    serializing the whole entry.
+    """
+
+    def __init__(self, tools: List[Dict], props: List[Dict], base_prompt: str):
+        self.tools = [self._split_tool(tool) for tool in tools]
+        self.props = [self._split_prop(prop) for prop in props]
+        # The developer message is nested inside a JSON string, so its pieces
+        # are stored already escaped.
+        self.prompt_parts = [
+            self._escape(part)
+            for part in base_prompt.split("{vehicle_properties_placeholder}")
+        ]
+
+    def build(self, item: Dict, metadata_label: str, rng: random.Random) -> str:
+        """
+        Builds a single entry, shuffling the tools and vehicle properties.
+        """
+        tools = list(self.tools)
+        rng.shuffle(tools)
+        tool_chunks = []
+        for head, params, tail in tools:
+            if params is None:
+                tool_chunks.append(head)
+                continue
+            # Shuffles the order of the parameters within each tool.
+            params = list(params)
+            rng.shuffle(params)
+            tool_chunks.append(head + "{" + ", ".join(params) + "}" + tail)
+
+        props = list(self.props)
+        rng.shuffle(props)
+        prop_chunks = []
+        for head, profiles, tail in props:
+            if profiles is None:
+                prop_chunks.append(head)
+                continue
+            profiles = list(profiles)
+            rng.shuffle(profiles)
+            prop_chunks.append(head + "[" + ",".join(profiles) + "]" + tail)
+        props_str = "[" + ",".join(prop_chunks) + "]"
+
+        tool_calls = [
+            {"function": {"name": answer["name"], "arguments": answer["arguments"]}}
+            for answer in item["answers"]
+        ]
+
+        return "".join(
+            (
+                '{"metadata": ',
+                json.dumps(metadata_label, ensure_ascii=False),
+                ', "tools": [',
+                ", ".join(tool_chunks),
+                '], "messages": [{"role": "developer", "content": "',
+                props_str.join(self.prompt_parts),
+                '"}, {"role": "user", "content": ',
+                json.dumps(item["query"], ensure_ascii=False),
+                '}, {"role": "assistant", "tool_calls": ',
+                json.dumps(tool_calls, ensure_ascii=False),
+                "}]}",
+            )
+        )
+
+    @staticmethod
+    def _escape(text: str) -> str:
+        return json.dumps(text, ensure_ascii=False)[1:-1]
+
+    @classmethod
+    def _split_tool(cls, tool: Dict) -> Tuple[str, Optional[List[str]], str]:
+        params = tool.get("parameters", {})
+        properties = params.get("properties")
+        if not isinstance(properties, dict):
+            return json.dumps({"function": tool}, ensure_ascii=False), None, ""
+        tool = {**tool, "parameters": {**params, "properties": _SLOT}}
+        head, tail = json.dumps({"function": tool}, ensure_ascii=False).split(
+            _ENCODED_SLOT
+        )
+        fragments = [
+            json.dumps(key, ensure_ascii=False)
+            + ": "
+            + json.dumps(value, ensure_ascii=False)
+            for key, value in properties.items()
+        ]
+        return head, fragments, tail
+
+    @classmethod
+    def _split_prop(cls, prop: Dict) -> Tuple[str, Optional[List[str]], str]:
+        def dumps(obj) -> str:
+            return cls._escape(
+                json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+            )
+
+        profiles = prop.get("areaIdProfiles")
+        if not isinstance(profiles, list):
+            return dumps(prop), None, ""
+        head, tail = dumps({**prop, "areaIdProfiles": _SLOT}).split(
+            cls._escape(_ENCODED_SLOT)
+        )
+        return head, [dumps(profile) for profile in profiles], tail
@@ -0,0 +1,47 @@
+import hashlib
+from pathlib import Path
+from typing import List, Optional
+from constants import FILTER_TOKENIZER_NAME
+
+
+class FilterTokenizer:
+    """
+    Turns masked queries into token IDs for the duplicate filter.
+
+    Wraps a `tokenizers.Tokenizer`, either loaded directly from a local
+    `tokenizer.json` (fast to import, no hub access) or taken from the
+    `transformers` tokenizer named by FILTER_TOKENIZER_NAME. Both encode a
+    text to the same IDs as `tokenize()` followed by `convert_tokens_to_ids()`
+    on the `transformers` tokenizer. `identity` tells cached token IDs of
+    different vocabularies apart.
+    """
+
+    def __init__(self, tokenizer, identity: str):
+        self._tokenizer = tokenizer
+        self.identity = identity
+
+    @classmethod
+    def load(cls, tokenizer_file: Optional[Path] = None) -> "FilterTokenizer":
+        if tokenizer_file is not None:
+            from tokenizers import Tokenizer
+
+            tokenizer = Tokenizer.from_file(str(tokenizer_file))
+            digest = hashlib.sha256(Path(tokenizer_file).read_bytes()).hexdigest()
+            identity = f"{Path(tokenizer_file).name}:{digest[:16]}"
+            return cls(tokenizer, identity)
+
+        # Importing transformers is slow, so it is only done when no
+        # standalone tokenizer file is given.
+        from transformers import AutoTokenizer
+
+        pretrained = AutoTokenizer.from_pretrained(FILTER_TOKENIZER_NAME)
+        return cls(
+            pretrained.backend_tokenizer,
+            f"{pretrained.name_or_path}|{len(pretrained)}",
+        )
+
+    def encode(self, text: str) -> List[int]:
+        return self._tokenizer.encode(text, add_special_tokens=False).ids
+
+    def decode(self, ids: List[int]) -> str:
+        return self._tokenizer.decode(list(ids))
@@ -0,0 +1,105 @@
+import json
+from typing import Any, List, Optional
+
+
+class JsonArrayStream:
+    """
+    Incrementally extracts the elements of the first JSON array in a text
+    that arrives in chunks, e.g. a streamed LLM response.
+
+    Text before the array (such as a markdown code fence) is skipped. An
+    opening code fence discards whatever was parsed before it, unless that
+    already produced elements, so brackets in prose ahead of a fenced block
+    (e.g. "Here are [5] queries: ```json [...]```") are not taken for the
+    array. Element boundaries are found by tracking bracket depth outside of
+    strings, and each complete element is decoded on its own, so a malformed
+    element or a cut-off tail only drops that element; `lost` counts the
+    dropped ones.
+    """
+
+    def __init__(self):
+        # 0 before the array, 1 between its elements, >1 inside an element.
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        # Text of the element in progress from earlier chunks.
+        self._partial: List[str] = []
+        # Consecutive backticks outside of strings, and whether a code fence
+        # has opened.
+        self._backticks = 0
+        self._fenced = False
+        self._emitted = 0
+        self.started = False
+        self.finished = False
+        self.lost = 0
+
+    def feed(self, text: str) -> List[Any]:
+        """Consumes a chunk and returns the elements it completed."""
+        elements = []
+        start: Optional[int] = 0 if self._partial else None
+        for i, ch in enumerate(text):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            # A backtick is never part of JSON outside of a string.
+            if ch == "`":
+                self._backticks += 1
+                if self._backticks == 3 and not self._fenced and not self._emitted:
+                    self._restart()
+                    start = None
+                continue
+            self._backticks = 0
+            if self.finished:
+                if self._fenced or self._emitted:
+                    break
+                # An array in prose may still be followed by a fenced one.
+                continue
+            if self._depth == 0:
+                if ch == "[":
+                    self._depth = 1
+                    self.started = True
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in "[{":
+                if self._depth == 1:
+                    start = i
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.finished = True
+                elif self._depth == 1 and start is not None:
+                    element = "".join(self._partial) + text[start : i + 1]
+                    self._partial = []
+                    start = None
+                    try:
+                        elements.append(json.loads(element))
+                        self._emitted += 1
+                    except ValueError:
+                        self.lost += 1
+
+        if start is not None and not self.finished:
+            self._partial.append(text[start:])
+        return elements
+
+    def _restart(self):
+        """Discards everything parsed before an opening code fence."""
+        self._depth = 0
+        self._partial = []
+        self._fenced = True
+        self.started = False
+        self.finished = False
+        self.lost = 0
+
+    def close(self):
+        """Marks the end of the text; an unfinished element counts as lost."""
+        if self._partial:
+            self._partial = []
+            self.lost += 1
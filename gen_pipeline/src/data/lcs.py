@@ -0,0 +1,51 @@
+from typing import Dict, Sequence
+
+
+class LCSMatcher:
+    """
+    Scores one token-ID sequence against many others by longest common
+    subsequence, using the bit-parallel algorithm of Allison-Dix / Hyyrö.
+
+    The fixed sequence is encoded once as a bitmask per distinct token; each
+    comparison then costs one pass over the other sequence with a handful of
+    big-integer operations per token instead of an O(n*m) table.
+    """
+
+    def __init__(self, tokens: Sequence[int]):
+        self.length = len(tokens)
+        self._all_ones = (1 << self.length) - 1
+        masks: Dict[int, int] = {}
+        for i, token in enumerate(tokens):
+            masks[token] = masks.get(token, 0) | (1 << i)
+        self._masks = masks
+
+    def lcs_length(self, other: Sequence[int]) -> int:
+        masks = self._masks
+        v = self._all_ones
+        for token in other:
+            match = masks.get(token)
+            if match:
+                u = v & match
+                v = (v + u) | (v - u)
+        return self.length - (v & self._all_ones).bit_count()
+
+    def fmeasure(self, other: Sequence[int]) -> float:
+        """
+        ROUGE-L F-measure with this sequence as the target and `other` as the
+        prediction, using the same arithmetic as `rouge_scorer._score_lcs` so
+        that threshold decisions are identical.
+        """
+        if not self.length or not other:
+            return 0.0
+        lcs = self.lcs_length(other)
+        precision = lcs / len(other)
+        recall = lcs / self.length
+        if precision + recall > 0:
+            return 2 * precision * recall / (precision + recall)
+        return 0.0
+
+    def max_fmeasure(self, other_length: int) -> float:
+        """Upper bound of `fmeasure()` for any sequence of the given length."""
+        if not self.length or not other_length:
+            return 0.0
+        return 2 * min(self.length, other_length) / (self.length + other_length)
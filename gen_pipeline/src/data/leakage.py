@@ -0,0 +1,261 @@
+import json
+from array import array
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+from .data_filter import QueryFilter
+from .filter_tokenizer import FilterTokenizer
+from .lcs import LCSMatcher
+from .lsh_index import MinHashLSHIndex
+from .token_store import TokenStore
+from constants import FILTER_THRESHOLD, FILTER_LSH_NUM_PERM, FILTER_LSH_BANDS
+
+# Items handed to a worker process at a time.
+_CHUNK_SIZE = 512
+# Eval items searched by a worker process at a time.
+_SEARCH_CHUNK_SIZE = 64
+# Buckets of the per-item token count sketch.
+_SKETCH_BUCKETS = 128
+
+_worker_tokenizer: Optional[FilterTokenizer] = None
+_worker_index: Optional[MinHashLSHIndex] = None
+_worker_leakage_index: Optional["LeakageIndex"] = None
+_worker_members: Optional[np.ndarray] = None
+
+
+def _init_worker(tokenizer_file: Optional[Path]):
+    global _worker_tokenizer, _worker_index
+    _worker_tokenizer = FilterTokenizer.load(tokenizer_file)
+    _worker_index = MinHashLSHIndex(FILTER_LSH_NUM_PERM, FILTER_LSH_BANDS)
+
+
+def _prepare(lines: List[bytes]) -> List[Tuple[List[int], np.ndarray, np.ndarray]]:
+    """
+    Returns the masked token IDs, MinHash signature and token count sketch of
+    each JSON line.
+    """
+    prepared = []
+    for line in lines:
+        item = json.loads(line)
+        masked_query = QueryFilter.mask_query(
+            item["query"], [answer["arguments"] for answer in item["answers"]]
+        )
+        tokens = _worker_tokenizer.encode(masked_query)
+        sketch = np.bincount(
+            np.asarray(tokens, dtype=np.int64) % _SKETCH_BUCKETS,
+            minlength=_SKETCH_BUCKETS,
+        ).astype(np.uint16)
+        prepared.append((tokens, _worker_index.signature(tokens), sketch))
+    return prepared
+
+
+def _init_search_worker(index: "LeakageIndex", members: np.ndarray):
+    global _worker_leakage_index, _worker_members
+    _worker_leakage_index = index
+    _worker_members = members
+
+
+def _search(positions: List[int]) -> List[Tuple[int, List[Tuple[int, float]]]]:
+    return [
+        (position, _worker_leakage_index.neighbours(position, _worker_members))
+        for position in positions
+    ]
+
+
+class LeakageIndex:
+    """
+    Finds near-duplicates between dataset splits with the similarity used by
+    QueryFilter: ROUGE-L over masked query tokens above FILTER_THRESHOLD.
+
+    All items are tokenized and MinHash-signed once, on `workers` processes,
+    and indexed with MinHashLSHIndex. A lookup takes the items sharing an LSH
+    band and, before any LCS, drops those whose F-measure is bounded below
+    the threshold by their token counts: the LCS of two sequences is at most
+    the size of their token multiset intersection, which the per-item counts
+    of tokens hashed into _SKETCH_BUCKETS buckets over-estimate. The bound is
+    exact, so results match scoring every candidate.
+
+    Items are addressed by their position in `lines`; split membership is
+    passed to each lookup as a boolean mask over positions. `find_leaks()`
+    splits the eval items across `workers` processes as well, each holding a
+    copy of the index; `redraw()` runs in this process, as every replacement
+    depends on the previous ones.
+    """
+
+    def __init__(
+        self,
+        lines: Iterable[bytes],
+        tokenizer_file: Optional[Path] = None,
+        workers: int = 1,
+    ):
+        self._workers = workers
+        self._tokens = TokenStore()
+        self._index = MinHashLSHIndex(FILTER_LSH_NUM_PERM, FILTER_LSH_BANDS)
+        lengths = array("q")
+        sketches = bytearray()
+        for tokens, signature, sketch in self._prepare_all(
+            lines, tokenizer_file, workers
+        ):
+            self._tokens.append(tokens)
+            self._index.add(signature)
+            lengths.append(len(tokens))
+            sketches += sketch.tobytes()
+        self._lengths = np.frombuffer(lengths, dtype=np.int64)
+        self._sketches = np.frombuffer(sketches, dtype=np.uint16).reshape(
+            -1, _SKETCH_BUCKETS
+        )
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def neighbours(self, position: int, members: np.ndarray) -> List[Tuple[int, float]]:
+        """
+        Returns the member items near-duplicating the item at `position`,
+        with their scores.
+        """
+        tokens = self._tokens[position]
+        if not tokens:
+            return []
+        candidates = self._index.query(self._index.signature(tokens))
+        candidates.discard(position)
+        candidates = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        candidates = candidates[members[candidates]]
+
+        overlap = np.minimum(
+            self._sketches[candidates], self._sketches[position]
+        ).sum(axis=1, dtype=np.int64)
+        max_fmeasure = 2 * overlap / (self._lengths[candidates] + len(tokens))
+        candidates = np.sort(candidates[max_fmeasure >= FILTER_THRESHOLD - 1e-9])
+
+        matcher = LCSMatcher(tokens)
+        found = []
+        for other in candidates.tolist():
+            score = matcher.fmeasure(self._tokens[other])
+            if score > FILTER_THRESHOLD:
+                found.append((other, score))
+        return found
+
+    def find_leaks(
+        self, eval_indices: Sequence[int], train_indices: Sequence[int]
+    ) -> Dict[int, List[Tuple[int, float]]]:
+        """Maps each eval item with near-duplicates in train to them."""
+        in_train = self._mask(train_indices)
+        positions = list(eval_indices)
+        if self._workers == 1 or len(positions) < 2 * _SEARCH_CHUNK_SIZE:
+            results = ((p, self.neighbours(p, in_train)) for p in positions)
+            return {position: found for position, found in results if found}
+
+        chunks = [
+            positions[start : start + _SEARCH_CHUNK_SIZE]
+            for start in range(0, len(positions), _SEARCH_CHUNK_SIZE)
+        ]
+        with Pool(
+            self._workers, initializer=_init_search_worker, initargs=(self, in_train)
+        ) as pool:
+            return {
+                position: found
+                for results in pool.imap(_search, chunks)
+                for position, found in results
+                if found
+            }
+
+    def redraw(
+        self,
+        eval_indices: Sequence[int],
+        train_indices: Sequence[int],
+        leaks: Dict[int, List[Tuple[int, float]]],
+    ) -> Tuple[List[int], List[int], List[int]]:
+        """
+        Replaces each leaking eval item, as found by `find_leaks()`, with a
+        train item that has no near-duplicate left in train, drawn in
+        `train_indices` order. The replaced eval items join the end of train,
+        and eval items that they near-duplicate are checked again.
+
+        Returns the new eval and train indices, and the eval items still
+        leaking because train ran out of clean replacements.
+        """
+        eval_list = list(eval_indices)
+        in_train = self._mask(train_indices)
+        in_eval = self._mask(eval_list)
+        slots = {position: slot for slot, position in enumerate(eval_list)}
+        pending = deque(slots[position] for position in leaks)
+        draws = iter(train_indices)
+        moved_to_train = []
+
+        while pending:
+            slot = pending.popleft()
+            position = eval_list[slot]
+            if not self.neighbours(position, in_train):
+                continue
+            in_eval[position] = False
+            in_train[position] = True
+            replacement = next(
+                (
+                    candidate
+                    for candidate in draws
+                    if in_train[candidate] and not self.neighbours(candidate, in_train)
+                ),
+                None,
+            )
+            if replacement is None:
+                in_eval[position] = True
+                in_train[position] = False
+                pending.appendleft(slot)
+                break
+
+            moved_to_train.append(position)
+            in_train[replacement] = False
+            in_eval[replacement] = True
+            eval_list[slot] = replacement
+            del slots[position]
+            slots[replacement] = slot
+            # The item now in train may leak into other eval items.
+            for other, _ in self.neighbours(position, in_eval):
+                pending.append(slots[other])
+
+        still_leaking = sorted(
+            {
+                eval_list[slot]
+                for slot in pending
+                if self.neighbours(eval_list[slot], in_train)
+            }
+        )
+        # A drawn replacement may itself have been moved back to train.
+        moved = self._mask(moved_to_train)
+        new_train = [
+            position
+            for position in train_indices
+            if in_train[position] and not moved[position]
+        ]
+        return eval_list, new_train + moved_to_train, still_leaking
+
+    def _mask(self, positions: Iterable[int]) -> np.ndarray:
+        mask = np.zeros(len(self._tokens), dtype=bool)
+        mask[np.fromiter(positions, dtype=np.int64)] = True
+        return mask
+
+    @staticmethod
+    def _prepare_all(
+        lines: Iterable[bytes], tokenizer_file: Optional[Path], workers: int
+    ) -> Iterator[Tuple[List[int], np.ndarray, np.ndarray]]:
+        lines = iter(lines)
+        if workers == 1:
+            _init_worker(tokenizer_file)
+            while chunk := list(islice(lines, _CHUNK_SIZE)):
+                yield from _prepare(chunk)
+            return
+
+        with Pool(workers, initializer=_init_worker, initargs=(tokenizer_file,)) as pool:
+            # `imap` reads its input eagerly, so lines are handed over in
+            # windows to keep them off the heap.
+            window = workers * 4
+            while True:
+                chunks = [list(islice(lines, _CHUNK_SIZE)) for _ in range(window)]
+                chunks = [chunk for chunk in chunks if chunk]
+                if not chunks:
+                    return
+                for prepared in pool.imap(_prepare, chunks):
+                    yield from prepared
@@ -0,0 +1,76 @@
+import zlib
+from collections import Counter
+from typing import Dict, List, Sequence, Set
+import numpy as np
+
+# Universal hashing h(x) = (a * x + b) mod p with p = 2^31 - 1. Shingle hashes
+# and coefficients are reduced below p, so a * x + b never overflows uint64.
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+
+
+class MinHashLSHIndex:
+    """
+    Approximate candidate index for the ROUGE-L duplicate check.
+
+    Items are shingled into their token multiset, where the k-th occurrence of
+    a token is its own shingle, so the Jaccard similarity of two shingle sets
+    equals the multiset Jaccard similarity of the token sequences.
+    The LCS of two sequences is a common sub-multiset, so a ROUGE-L F-measure
+    of F implies a multiset Jaccard of at least F / (2 - F).
+
+    Signatures of `num_perm` MinHash values are split into `bands` bands of
+    `num_perm / bands` rows, and two items become candidates when any band
+    matches. A pair with Jaccard J collides with probability
+    1 - (1 - J^rows)^bands. With the defaults (128 permutations, 32 bands of
+    4 rows) and FILTER_THRESHOLD = 0.8, every pair that the exact filter would
+    reject has J >= 2/3 and is found with probability above 99.9%.
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 32, seed: int = 1):
+        if num_perm % bands != 0:
+            raise ValueError("num_perm must be divisible by bands.")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def signature(self, tokens: Sequence) -> np.ndarray:
+        """Computes the MinHash signature of a token sequence."""
+        if not tokens:
+            return np.full(self.num_perm, _MERSENNE_PRIME, dtype=np.uint64)
+        occurrences = Counter()
+        shingles = []
+        for token in tokens:
+            k = occurrences[token]
+            occurrences[token] = k + 1
+            shingles.append(zlib.crc32(f"{token}\x1f{k}".encode("utf-8")))
+        x = np.asarray(shingles, dtype=np.uint64) % _MERSENNE_PRIME
+        hashes = (np.outer(x, self._a) + self._b) % _MERSENNE_PRIME
+        return hashes.min(axis=0)
+
+    def add(self, signature: np.ndarray) -> int:
+        """Indexes a signature and returns its item id (insertion order)."""
+        item_id = self._size
+        for band, key in enumerate(self._band_keys(signature)):
+            self._buckets[band].setdefault(key, []).append(item_id)
+        self._size += 1
+        return item_id
+
+    def query(self, signature: np.ndarray) -> Set[int]:
+        """Returns the ids of all indexed items sharing a band with the signature."""
+        candidates: Set[int] = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            bucket = self._buckets[band].get(key)
+            if bucket:
+                candidates.update(bucket)
+        return candidates
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [band.tobytes() for band in signature.reshape(self.bands, self.rows)]
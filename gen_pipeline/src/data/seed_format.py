@@ -0,0 +1,136 @@
+"""
+The seeds format stores a refined dataset without expanding the shared assets
+into every entry.
+
+The first line is a header holding the tools, the vehicle properties and the
+developer message template. Every following line holds one sample:
+`{"metadata", "seed", "query", "answers"}`. An entry is rebuilt by shuffling
+the header assets with `random.Random(seed)`, which reproduces the JSONL line
+`refine --format jsonl` writes for the same sample byte for byte.
+"""
+import gzip
+import json
+import random
+from pathlib import Path
+from typing import Dict, Iterator, List, TextIO
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from .entry_template import EntryTemplate
+
+SEEDS_FORMAT = "cartool-seeds"
+SEEDS_FORMAT_VERSION = 1
+
+COMPRESSIONS = ("none", "gzip", "zstd")
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def open_output(path: Path, compression: str = "none") -> TextIO:
+    """Opens a text file for writing, optionally compressed."""
+    if compression == "none":
+        return open(path, "w", encoding="utf-8")
+    if compression == "gzip":
+        return gzip.open(path, "wt", encoding="utf-8")
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd compression requires the `zstandard` package.")
+        return zstandard.open(path, "wt", encoding="utf-8")
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+def open_input(path: Path) -> TextIO:
+    """Opens a text file for reading, detecting gzip and zstd compression."""
+    with open(path, "rb") as f:
+        magic = f.read(4)
+    if magic.startswith(_GZIP_MAGIC):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if magic.startswith(_ZSTD_MAGIC):
+        if zstandard is None:
+            raise RuntimeError(
+                f"{path} is zstd-compressed; install `zstandard` to read it."
+            )
+        return zstandard.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def write_seeds_header(
+    f: TextIO, tools: List[Dict], props: List[Dict], base_prompt: str
+):
+    header = {
+        "format": SEEDS_FORMAT,
+        "version": SEEDS_FORMAT_VERSION,
+        "tools": tools,
+        "vehicle_properties": props,
+        "developer_prompt": base_prompt,
+    }
+    f.write(json.dumps(header, ensure_ascii=False) + "\n")
+
+
+def format_seed_record(item: Dict, metadata_label: str, seed: int) -> str:
+    record = {
+        "metadata": metadata_label,
+        "seed": seed,
+        "query": item["query"],
+        "answers": item["answers"],
+    }
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def iter_seeded_entries(path: Path) -> Iterator[str]:
+    """
+    Lazily rebuilds the JSONL entries (without the trailing newline) of a
+    seeds-format file.
+    """
+    with open_input(path) as f:
+        header = json.loads(f.readline() or "{}")
+        if header.get("format") != SEEDS_FORMAT:
+            raise ValueError(f"{path} is not a seeds-format dataset.")
+        if header.get("version") != SEEDS_FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported seeds format version: {header.get('version')}"
+            )
+        template = EntryTemplate(
+            header["tools"], header["vehicle_properties"], header["developer_prompt"]
+        )
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield template.build(
+                record, record["metadata"], random.Random(record["seed"])
+            )
+
+
+def iter_entries(path: Path) -> Iterator[str]:
+    """
+    Lazily yields the JSONL entries (without the trailing newline) of a
+    refined dataset in either format.
+    """
+    with open_input(path) as f:
+        first_line = f.readline()
+    try:
+        header = json.loads(first_line)
+    except json.JSONDecodeError:
+        header = None
+    if isinstance(header, dict) and header.get("format") == SEEDS_FORMAT:
+        yield from iter_seeded_entries(path)
+        return
+    with open_input(path) as f:
+        for line in f:
+            if line.strip():
+                yield line.rstrip("\n")
+
+
+def expand_seeds(path: Path, output: Path, compression: str = "none") -> int:
+    """Writes the full JSONL dataset for a seeds-format file."""
+    count = 0
+    with open_output(output, compression) as f:
+        for entry in iter_seeded_entries(path):
+            f.write(entry + "\n")
+            count += 1
+    return count
@@ -0,0 +1,147 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Optional, Sequence, Tuple
+from .lcs import LCSMatcher
+from .token_store import TokenStore
+from constants import FILTER_THRESHOLD
+
+# Per-worker views of the shared token store, attached once by the initializer.
+_worker_blocks: Tuple[shared_memory.SharedMemory, ...] = ()
+_worker_data: Optional[memoryview] = None
+_worker_offsets: Optional[memoryview] = None
+
+
+def _attach_store(data_name: str, offsets_name: str, num_items: int):
+    global _worker_blocks, _worker_data, _worker_offsets
+    data_block = shared_memory.SharedMemory(name=data_name)
+    offsets_block = shared_memory.SharedMemory(name=offsets_name)
+    _worker_blocks = (data_block, offsets_block)
+    _worker_data = data_block.buf.cast("i")
+    _worker_offsets = offsets_block.buf.cast("q")[: num_items + 1]
+
+
+def _score_shard(
+    start: int,
+    end: int,
+    candidates: List[List[int]],
+    candidate_ids: Optional[List[List[int]]],
+) -> List[bool]:
+    """Returns, per candidate, whether any item in [start, end) overlaps it."""
+    return _find_overlaps(
+        _worker_data, _worker_offsets, start, end, candidates, candidate_ids
+    )
+
+
+def _find_overlaps(data, offsets, start, end, candidates, candidate_ids):
+    rejected = []
+    for i, tokens in enumerate(candidates):
+        matcher = LCSMatcher(tokens)
+        item_ids = range(start, end) if candidate_ids is None else candidate_ids[i]
+        overlaps = False
+        for item_id in item_ids:
+            existing = data[offsets[item_id] : offsets[item_id + 1]]
+            if matcher.max_fmeasure(len(existing)) < FILTER_THRESHOLD - 1e-9:
+                continue
+            if matcher.fmeasure(existing) > FILTER_THRESHOLD:
+                overlaps = True
+                break
+        rejected.append(overlaps)
+    return rejected
+
+
+class ShardedOverlapScorer:
+    """
+    Checks candidates against a TokenStore on a pool of worker processes.
+
+    The store is copied once into shared memory and split into one contiguous
+    shard per worker; workers attach to it when they start, so only the
+    candidates travel with each batch. Items appended to the store afterwards
+    are scored in the calling process until they outgrow `rebuild_ratio` of
+    the shared snapshot, at which point the snapshot and the pool are rebuilt.
+    """
+
+    def __init__(self, store: TokenStore, workers: int, rebuild_ratio: float = 0.25):
+        self._store = store
+        self._workers = workers
+        self._rebuild_ratio = rebuild_ratio
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._blocks: Tuple[shared_memory.SharedMemory, ...] = ()
+        self._snapshot_size = 0
+        self._start_pool()
+
+    def rejected(
+        self,
+        candidates: Sequence[List[int]],
+        candidate_ids: Optional[Sequence[Sequence[int]]] = None,
+    ) -> List[bool]:
+        """
+        Returns, per candidate, whether it overlaps any stored item. When
+        `candidate_ids` is given, each candidate is only compared with the
+        listed item ids.
+        """
+        tail = len(self._store) - self._snapshot_size
+        if tail > max(self._snapshot_size * self._rebuild_ratio, 1000):
+            self._start_pool()
+
+        futures = []
+        for start, end in self._shard_ranges():
+            shard_ids = None
+            if candidate_ids is not None:
+                shard_ids = [[i for i in ids if start <= i < end] for ids in candidate_ids]
+                if not any(shard_ids):
+                    continue
+            futures.append(
+                self._pool.submit(_score_shard, start, end, list(candidates), shard_ids)
+            )
+
+        # Score the items added since the snapshot here while the workers run.
+        start, end = self._snapshot_size, len(self._store)
+        tail_ids = None
+        if candidate_ids is not None:
+            tail_ids = [[i for i in ids if i >= start] for ids in candidate_ids]
+        rejected = _find_overlaps(
+            self._store.data, self._store.offsets, start, end, candidates, tail_ids
+        )
+
+        for future in futures:
+            rejected = [a or b for a, b in zip(rejected, future.result())]
+        return rejected
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = ()
+
+    def _shard_ranges(self) -> List[Tuple[int, int]]:
+        size = self._snapshot_size
+        bounds = [size * k // self._workers for k in range(self._workers + 1)]
+        return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+    def _start_pool(self):
+        self.close()
+        self._snapshot_size = len(self._store)
+        blocks = []
+        for buffer in (self._store.data, self._store.offsets):
+            with memoryview(buffer) as view, view.cast("B") as raw:
+                # Keep the block non-empty and 8-byte aligned for the casts.
+                block = shared_memory.SharedMemory(
+                    create=True, size=max(raw.nbytes, 8)
+                )
+                block.buf[: raw.nbytes] = raw
+            blocks.append(block)
+        self._blocks = tuple(blocks)
+        # The pool is (re)started while request threads are running, and
+        # forking a multi-threaded process can leave locks held in the child.
+        # The workers only attach to the shared blocks by name, so they are
+        # started from a fork server instead.
+        self._pool = ProcessPoolExecutor(
+            max_workers=self._workers,
+            mp_context=multiprocessing.get_context("forkserver"),
+            initializer=_attach_store,
+            initargs=(blocks[0].name, blocks[1].name, self._snapshot_size),
+        )
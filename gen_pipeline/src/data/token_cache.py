@@ -0,0 +1,130 @@
+import hashlib
+import json
+import logging
+from array import array
+from pathlib import Path
+from typing import List, Sequence, Tuple
+from .data_format import QueryItem
+from .token_store import TokenStore
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCache:
+    """
+    Sidecar files that persist the filter's masked token IDs next to a dataset.
+
+    Four files share the given path prefix and are only ever appended to:
+    `.data` (int32 token IDs), `.offsets` (int64 end offset of each item),
+    `.digests` (an 8-byte content hash of each item) and `.json` (the
+    tokenizer identity the IDs were produced with). On load, the stored
+    digests are compared with the dataset item by item; the matching prefix
+    is reused and everything after it is dropped and re-tokenized.
+    """
+
+    DIGEST_SIZE = 8
+
+    def __init__(self, path_prefix: Path, tokenizer_id: str):
+        prefix = str(path_prefix)
+        self._data_path = Path(prefix + ".data")
+        self._offsets_path = Path(prefix + ".offsets")
+        self._digests_path = Path(prefix + ".digests")
+        self._meta_path = Path(prefix + ".json")
+        self._tokenizer_id = tokenizer_id
+        self._end_offset = 0
+
+    def load(self, items: Sequence[QueryItem]) -> Tuple[TokenStore, int]:
+        """
+        Returns a store holding the cached tokens of the leading `items` that
+        are unchanged since they were cached, and the number of such items.
+        """
+        store = TokenStore()
+        if not self._is_compatible():
+            self._reset()
+            return store, 0
+
+        digests = self._digests_path.read_bytes()
+        offsets = self._read_array(self._offsets_path, "q")
+        data = self._read_array(self._data_path, "i")
+
+        # Files may be out of step after a crash mid-append; trust only
+        # entries that are complete in all three.
+        count = min(len(digests) // self.DIGEST_SIZE, len(offsets), len(items))
+        while count and offsets[count - 1] > len(data):
+            count -= 1
+
+        reused = 0
+        while reused < count:
+            start = reused * self.DIGEST_SIZE
+            if digests[start : start + self.DIGEST_SIZE] != self._digest(items[reused]):
+                break
+            reused += 1
+
+        self._end_offset = offsets[reused - 1] if reused else 0
+        store.data = data[: self._end_offset]
+        store.offsets = array("q", [0]) + offsets[:reused]
+        self._truncate(reused)
+        logger.info("Reusing cached filter tokens for %d/%d items", reused, len(items))
+        return store, reused
+
+    def append(self, items: Sequence[QueryItem], token_lists: Sequence[List[int]]):
+        """Appends the tokens of newly accepted items to the sidecar."""
+        if not items:
+            return
+        data = array("i")
+        offsets = array("q")
+        for tokens in token_lists:
+            data.extend(tokens)
+            offsets.append(self._end_offset + len(data))
+        digests = b"".join(self._digest(item) for item in items)
+
+        # Data is written before the offsets and digests that reference it.
+        for path, payload in (
+            (self._data_path, data.tobytes()),
+            (self._offsets_path, offsets.tobytes()),
+            (self._digests_path, digests),
+        ):
+            with open(path, "ab") as f:
+                f.write(payload)
+        self._end_offset += len(data)
+
+    def _is_compatible(self) -> bool:
+        try:
+            meta = json.loads(self._meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        paths = (self._data_path, self._offsets_path, self._digests_path)
+        return meta.get("tokenizer") == self._tokenizer_id and all(
+            path.exists() for path in paths
+        )
+
+    def _reset(self):
+        self._meta_path.parent.mkdir(parents=True, exist_ok=True)
+        for path in (self._data_path, self._offsets_path, self._digests_path):
+            path.write_bytes(b"")
+        self._meta_path.write_text(
+            json.dumps({"tokenizer": self._tokenizer_id}), encoding="utf-8"
+        )
+        self._end_offset = 0
+
+    def _truncate(self, count: int):
+        sizes = (
+            (self._data_path, self._end_offset * array("i").itemsize),
+            (self._offsets_path, count * array("q").itemsize),
+            (self._digests_path, count * self.DIGEST_SIZE),
+        )
+        for path, size in sizes:
+            with open(path, "r+b") as f:
+                f.truncate(size)
+
+    @staticmethod
+    def _read_array(path: Path, typecode: str) -> array:
+        values = array(typecode)
+        raw = path.read_bytes()
+        values.frombytes(raw[: len(raw) - len(raw) % values.itemsize])
+        return values
+
+    @classmethod
+    def _digest(cls, item: QueryItem) -> bytes:
+        payload = item.model_dump_json().encode("utf-8")
+        return hashlib.blake2b(payload, digest_size=cls.DIGEST_SIZE).digest()
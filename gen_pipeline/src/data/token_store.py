@@ -0,0 +1,35 @@
+from array import array
+from typing import Iterable, Iterator
+
+
+class TokenStore:
+    """
+    Append-only list of integer token sequences kept in one flat buffer.
+
+    Sequences are addressed by insertion index; `offsets[i]:offsets[i + 1]`
+    delimits the i-th sequence in `data`.
+    """
+
+    def __init__(self):
+        self.data = array("i")
+        self.offsets = array("q", [0])
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> array:
+        if index < 0:
+            index += len(self)
+        return self.data[self.offsets[index] : self.offsets[index + 1]]
+
+    def __iter__(self) -> Iterator[array]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def append(self, tokens: Iterable[int]):
+        self.data.extend(tokens)
+        self.offsets.append(len(self.data))
+
+    def extend(self, sequences: Iterable[Iterable[int]]):
+        for tokens in sequences:
+            self.append(tokens)
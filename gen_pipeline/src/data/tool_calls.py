@@ -0,0 +1,195 @@
+"""
+Parsers that extract the function calls from a model's raw output, as
+`{"function": {"name", "arguments"}}` dicts like the `tool_calls` of a refined
+entry, and order-insensitive matching of predicted calls against targets.
+"""
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+ToolCall = Dict[str, Dict[str, Any]]
+
+
+def infer_value_type(value_str: str) -> Any:
+    """
+    Parses a raw string value into its appropriate Python type.
+    """
+    value_str = value_str.strip()
+
+    if value_str.startswith("<escape>") and value_str.endswith("<escape>"):
+        return value_str[8:-8]  # Remove tags and return as string
+
+    if value_str == "true":
+        return True
+    if value_str == "false":
+        return False
+    if value_str == "null":
+        return None
+
+    try:
+        return int(value_str)
+    except ValueError:
+        pass
+
+    try:
+        return float(value_str)
+    except ValueError:
+        pass
+
+    return value_str
+
+
+def extract_function_call_json(model_output: str) -> List[ToolCall]:
+    """
+    For models producing JSON blocks (e.g., Gemma).
+    """
+    results = []
+    # Try to extract JSON from code blocks
+    match = re.search(r"```(?:tool_code|json)?\s*(.*?)\s*```", model_output, re.DOTALL)
+
+    json_str = ""
+    if match:
+        json_str = match.group(1).strip()
+    else:
+        # Fallback: look for outer brackets
+        start_array = model_output.find("[")
+        start_obj = model_output.find("{")
+
+        if start_array != -1 and (start_obj == -1 or start_array < start_obj):
+            end_idx = model_output.rfind("]")
+            if end_idx != -1:
+                json_str = model_output[start_array : end_idx + 1]
+        elif start_obj != -1:
+            end_idx = model_output.rfind("}")
+            if end_idx != -1:
+                json_str = model_output[start_obj : end_idx + 1]
+
+    if not json_str:
+        return results
+
+    try:
+        data = json.loads(json_str)
+    except json.JSONDecodeError:
+        return results
+    if isinstance(data, dict):
+        data = [data]
+    if not isinstance(data, list):
+        return results
+
+    for item in data:
+        if not isinstance(item, dict):
+            continue
+        # Accept calls already wrapped like the refined `tool_calls`.
+        item = item.get("function", item)
+        func_name = item.get("name")
+        params = item.get("arguments", {})
+        if func_name and isinstance(params, dict):
+            results.append({"function": {"name": func_name, "arguments": params}})
+    return results
+
+
+def extract_function_call_functiongemma(model_output: str) -> List[ToolCall]:
+    """
+    Parses the function call markers of FunctionGemma, e.g.
+    `<start_function_call>call:open_map{query:San Francisco}<end_function_call>`.
+    """
+    results = []
+
+    # Pattern to extract the full content of a single function call
+    raw_calls = re.findall(
+        r"<start_function_call>(.*?)<end_function_call>", model_output, re.DOTALL
+    )
+    for raw_call in raw_calls:
+        # Expected format: call:func_name{...}
+        if not raw_call.strip().startswith("call:"):
+            continue
+        if "{" not in raw_call:
+            continue
+
+        # Split only on the first brace to separate name and args
+        pre_brace, args_segment = raw_call.split("{", 1)
+        function_name = pre_brace.replace("call:", "").strip()
+
+        # Remove the trailing closing brace '}'
+        args_content = args_segment.strip()
+        if args_content.endswith("}"):
+            args_content = args_content[:-1]
+
+        arguments = {}
+        arg_pattern = r"(?:^|,)\s*(?P<key>[^:]+):(?P<value><escape>.*?<escape>|[^,]*)"
+        for match in re.finditer(arg_pattern, args_content, re.DOTALL):
+            key = match.group("key").strip()
+            arguments[key] = infer_value_type(match.group("value"))
+
+        results.append({"function": {"name": function_name, "arguments": arguments}})
+
+    return results
+
+
+def extract_function_call_gemma4(model_output: str) -> List[ToolCall]:
+    """
+    Parses the tool call markers of Gemma 4, e.g.
+    `<|tool_call>call:open_map{query:<|"|>San Francisco<|"|>}<tool_call|>`.
+    """
+
+    def cast(value: str) -> Any:
+        try:
+            return int(value)
+        except ValueError:
+            pass
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        return {"true": True, "false": False}.get(value.lower(), value.strip("'\""))
+
+    return [
+        {
+            "function": {
+                "name": name,
+                "arguments": {
+                    key: cast((quoted or bare).strip())
+                    for key, quoted, bare in re.findall(
+                        r'(\w+):(?:<\|"\|>(.*?)<\|"\|>|([^,}]*))', args
+                    )
+                },
+            }
+        }
+        for name, args in re.findall(
+            r"<\|tool_call>call:(\w+)\{(.*?)\}<tool_call\|>", model_output, re.DOTALL
+        )
+    ]
+
+
+PARSERS: Dict[str, Callable[[str], List[ToolCall]]] = {
+    "json": extract_function_call_json,
+    "functiongemma": extract_function_call_functiongemma,
+    "gemma4": extract_function_call_gemma4,
+}
+
+
+def match_calls(target: List[ToolCall], output: List[ToolCall]) -> List[bool]:
+    """
+    Matches each target call to a distinct, equal output call regardless of
+    order. Returns whether each target call was matched; the output calls
+    left unmatched are `len(output) - sum(result)`.
+    """
+    unmatched: List[Optional[ToolCall]] = list(output)
+    matched = []
+    for call in target:
+        index = next(
+            (i for i, other in enumerate(unmatched) if _same_call(call, other)), None
+        )
+        if index is not None:
+            unmatched[index] = None
+        matched.append(index is not None)
+    return matched
+
+
+def _same_call(call: ToolCall, other: Optional[ToolCall]) -> bool:
+    # Compared with `==`, so an argument of 1 matches 1.0 as in the notebook.
+    return (
+        other is not None
+        and call["function"]["name"] == other["function"]["name"]
+        and call["function"]["arguments"] == other["function"]["arguments"]
+    )
@@ -0,0 +1,374 @@
+import asyncio
+import dataclasses
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from constants import (
+    CACHE_MAX_MB,
+    MODEL_NAME,
+    OPENAI_BASE_URL,
+    METRICS_WRITE_INTERVAL,
+)
+from data.seed_format import iter_entries
+from data.tool_calls import PARSERS, ToolCall, match_calls
+from inference.api.llm_engine import LLMEngine, LLMOptions, LLMResponse
+from inference.cache.cached_engine import CachedLLMEngine
+from inference.engine_factory import create_engine
+from metrics import Metrics
+from prompt.prompt import EVALUATION_TOOLS_SECTION
+
+logger = logging.getLogger(__name__)
+
+# Properties listed in the logged breakdown, starting with the least accurate.
+_WORST_PROPERTIES = 10
+
+
+class Evaluator:
+    """
+    Scores a model on a split of a refined dataset.
+
+    Each user query is sent with the developer message and tools of its own
+    entry as the system instruction, `batch_size` entries at a time with up
+    to `concurrency` requests in flight.
+
+    Each scored entry is appended to the `output` JSONL as soon as its batch
+    completes, and a re-run skips the entries already in it. A failed
+    request is recorded with its error and retried by the next run. A
+    summary with the accuracy per function and per property is written next
+    to the output.
+    """
+
+    def __init__(
+        self,
+        data_file: Path,
+        output: Path,
+        engine: Optional[LLMEngine] = None,
+        split="eval",
+        parser="json",
+        concurrency=4,
+        batch_size=32,
+        temperature=0.0,
+        engine_type="gemini",
+        model_name=None,
+        base_url=OPENAI_BASE_URL,
+        rpm=None,
+        tpm=None,
+        cache_dir=None,
+        cache_max_mb=CACHE_MAX_MB,
+        metrics_out=None,
+    ):
+        if concurrency < 1:
+            raise ValueError("Concurrency must be at least 1.")
+        if batch_size < 1:
+            raise ValueError("Batch size must be at least 1.")
+        if engine_type == "openai" and engine is None and not model_name:
+            raise ValueError("A model name is required for the openai engine.")
+        self.data_file = data_file
+        self.output = output
+        self.summary_path = output.with_name(output.name + ".summary.json")
+        # "eval", "train" or "all" entries of the dataset.
+        self.split = split
+        self.parse = PARSERS[parser]
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.options = LLMOptions(
+            model_name=model_name or MODEL_NAME, temperature=temperature
+        )
+        self.metrics = Metrics(metrics_out, METRICS_WRITE_INTERVAL)
+        if engine is None:
+            engine = create_engine(
+                engine_type,
+                self.options.model_name,
+                base_url,
+                max_connections=concurrency,
+                rpm=rpm,
+                tpm=tpm,
+            )
+            if cache_dir is not None:
+                engine = CachedLLMEngine(engine, cache_dir, cache_max_mb * 1024 * 1024)
+        self.engine = engine
+        # Number of entries in the split, known once they have been read.
+        self._entry_count = 0
+
+    def run(self) -> Dict:
+        """Scores the pending entries and returns the summary of all of them."""
+        records = self._load_results()
+        logger.info(
+            "Evaluating %s entries (%d already scored)", self.split, len(records)
+        )
+
+        start = time.perf_counter()
+        self.engine.load(self.options)
+        try:
+            scored = self._evaluate(records)
+        finally:
+            self.engine.unload()
+        elapsed = time.perf_counter() - start
+        if any(index >= self._entry_count for index in records):
+            raise ValueError(
+                f"{self.output} holds results for another dataset; "
+                "remove it or choose another output."
+            )
+
+        summary = self._summarize(list(records.values()))
+        summary["failed"] = self._entry_count - len(records)
+        summary["throughput"] = {
+            "entries": scored,
+            "seconds": elapsed,
+            "entries_per_second": scored / elapsed if elapsed else 0.0,
+            "output_tokens_per_second": (
+                self.metrics.counter("output_tokens") / elapsed if elapsed else 0.0
+            ),
+        }
+        self.summary_path.parent.mkdir(parents=True, exist_ok=True)
+        self.summary_path.write_text(json.dumps(summary, indent=2), encoding="utf-8")
+        self.metrics.write()
+        self.metrics.log_summary()
+        self._log_summary(summary)
+        return summary
+
+    def _iter_entries(self) -> Iterator[Tuple[int, str, List[ToolCall], str]]:
+        """
+        Yields the index, user query, target calls and system instruction of
+        each entry of the split.
+        """
+        self._entry_count = 0
+        for line in iter_entries(self.data_file):
+            entry = json.loads(line)
+            if self.split != "all" and entry.get("metadata") != self.split:
+                continue
+            messages = entry["messages"]
+            system_instruction = (
+                messages[0]["content"]
+                + "\n"
+                + EVALUATION_TOOLS_SECTION.replace(
+                    "{tools_placeholder}",
+                    json.dumps(entry["tools"], ensure_ascii=False),
+                )
+            )
+            yield (
+                self._entry_count,
+                messages[1]["content"],
+                messages[2].get("tool_calls", []),
+                system_instruction,
+            )
+            self._entry_count += 1
+        if not self._entry_count:
+            raise ValueError(f"No {self.split} entries found in {self.data_file}.")
+
+    def _iter_pending(
+        self, records: Dict[int, Dict]
+    ) -> Iterator[Tuple[int, str, List[ToolCall], str]]:
+        """Yields the entries without a result, checking those that have one."""
+        for entry in self._iter_entries():
+            index, query = entry[0], entry[1]
+            record = records.get(index)
+            if record is None:
+                yield entry
+            elif record["query"] != query:
+                raise ValueError(
+                    f"{self.output} holds results for another dataset; "
+                    "remove it or choose another output."
+                )
+
+    def _load_results(self) -> Dict[int, Dict]:
+        """
+        Loads the entries scored by a previous run; failed ones are left out
+        to be retried. A truncated final line, left by a crash during an
+        append, is dropped by rewriting the file.
+        """
+        records: Dict[int, Dict] = {}
+        if not self.output.exists():
+            return records
+        truncated = False
+        with open(self.output, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    truncated = True
+                    continue
+                if "error" not in record:
+                    records[record["index"]] = record
+        if truncated:
+            logger.warning("Dropping a truncated line of %s", self.output)
+            tmp_path = self.output.with_name(self.output.name + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for record in records.values():
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.output)
+        return records
+
+    def _evaluate(self, records: Dict[int, Dict]) -> int:
+        """Scores the pending entries into `records`; returns how many."""
+        # All batches share one event loop, as an async client may bind its
+        # connection pool to the loop it first runs on.
+        return asyncio.run(self._aevaluate(records))
+
+    async def _aevaluate(self, records: Dict[int, Dict]) -> int:
+        self.output.parent.mkdir(parents=True, exist_ok=True)
+        scored = failed = 0
+        with open(self.output, "a", encoding="utf-8") as f:
+            for batch in _batches(self._iter_pending(records), self.batch_size):
+                with self.metrics.timer("generate_batch"):
+                    responses = await self._agenerate_batch(batch)
+                for (index, query, target, _), response in zip(batch, responses):
+                    if isinstance(response, Exception):
+                        logger.warning(
+                            "Request for entry %d failed: %s", index, response
+                        )
+                        record = {
+                            "index": index,
+                            "query": query,
+                            "error": str(response),
+                        }
+                        self.metrics.count("entries_failed")
+                        failed += 1
+                    else:
+                        record = self._score(index, query, target, response)
+                        records[index] = record
+                        self.metrics.count("entries_scored")
+                        scored += 1
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+                self.metrics.maybe_write()
+                logger.info("Scored %d entries, %d failed", scored, failed)
+        return scored
+
+    async def _agenerate_batch(
+        self, batch: List[Tuple[int, str, List[ToolCall], str]]
+    ) -> List[Union[LLMResponse, Exception]]:
+        """
+        Generates a response for every entry of the batch, in order; a
+        failed request yields its exception instead.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_one(query: str, system_instruction: str) -> LLMResponse:
+            async with semaphore:
+                return await self.engine.agenerate(
+                    query,
+                    dataclasses.replace(
+                        self.options, system_instruction=system_instruction
+                    ),
+                )
+
+        return await asyncio.gather(
+            *(run_one(query, instruction) for _, query, _, instruction in batch),
+            return_exceptions=True,
+        )
+
+    def _score(
+        self, index: int, query: str, target: List[ToolCall], response: LLMResponse
+    ) -> Dict:
+        self.metrics.count("input_tokens", response.input_tokens or 0)
+        self.metrics.count("output_tokens", response.output_tokens or 0)
+        with self.metrics.timer("parse"):
+            output = self.parse(response.text)
+        matched = match_calls(target, output)
+        return {
+            "index": index,
+            "query": query,
+            "target": target,
+            "output": output,
+            "output_text": response.text,
+            "matched": matched,
+            "correct": all(matched) and len(output) == len(target),
+        }
+
+    @staticmethod
+    def _summarize(records: List[Dict]) -> Dict:
+        """
+        Computes the exact-match accuracy of the entries, the precision and
+        recall of the calls, and the share of target calls matched for each
+        function and each property.
+        """
+        target_calls = sum(len(record["target"]) for record in records)
+        output_calls = sum(len(record["output"]) for record in records)
+        matched_calls = sum(sum(record["matched"]) for record in records)
+        functions: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+        properties: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+        for record in records:
+            for call, matched in zip(record["target"], record["matched"]):
+                counts = [functions[call["function"]["name"]]]
+                property_name = call["function"]["arguments"].get("propertyName")
+                if isinstance(property_name, str):
+                    counts.append(properties[property_name])
+                for count in counts:
+                    count[0] += 1
+                    count[1] += matched
+
+        def breakdown(counts: Dict[str, List[int]]) -> Dict[str, Dict]:
+            return {
+                name: {"calls": calls, "matched": matched, "accuracy": matched / calls}
+                for name, (calls, matched) in sorted(counts.items())
+            }
+
+        return {
+            "entries": len(records),
+            "accuracy": (
+                sum(record["correct"] for record in records) / len(records)
+                if records
+                else 0.0
+            ),
+            "unparsed": sum(
+                1 for record in records if record["target"] and not record["output"]
+            ),
+            "call_precision": matched_calls / output_calls if output_calls else 0.0,
+            "call_recall": matched_calls / target_calls if target_calls else 0.0,
+            "functions": breakdown(functions),
+            "properties": breakdown(properties),
+        }
+
+    def _log_summary(self, summary: Dict):
+        throughput = summary["throughput"]
+        logger.info(
+            "Accuracy %.2f%% over %d entries (%d failed; call precision %.2f%%, "
+            "recall %.2f%%, %d without parsable calls); %.2f entries/s, %.1f "
+            "output tokens/s",
+            summary["accuracy"] * 100,
+            summary["entries"],
+            summary["failed"],
+            summary["call_precision"] * 100,
+            summary["call_recall"] * 100,
+            summary["unparsed"],
+            throughput["entries_per_second"],
+            throughput["output_tokens_per_second"],
+        )
+        lines = [f"{'function':<32} {'calls':>8} {'accuracy':>10}"]
+        for name, values in summary["functions"].items():
+            lines.append(
+                f"{name:<32} {values['calls']:>8} {values['accuracy'] * 100:>9.2f}%"
+            )
+        logger.info("Accuracy per function:\n%s", "\n".join(lines))
+
+        worst = sorted(
+            summary["properties"].items(), key=lambda item: item[1]["accuracy"]
+        )[:_WORST_PROPERTIES]
+        if worst:
+            lines = [f"{'property':<48} {'calls':>8} {'accuracy':>10}"]
+            for name, values in worst:
+                lines.append(
+                    f"{name:<48} {values['calls']:>8} {values['accuracy'] * 100:>9.2f}%"
+                )
+            logger.info(
+                "Least accurate properties (all in %s):\n%s",
+                self.summary_path,
+                "\n".join(lines),
+            )
+        logger.info("Results written to %s", self.output)
+
+
+def _batches(items: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
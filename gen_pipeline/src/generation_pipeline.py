@@ -1,54 +1,214 @@
 import json
+import os
+import queue
 import random
-import re
-import tomllib
+import time
 import logging
-from typing import Dict, List, Optional
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import (
+    Callable,
+    ContextManager,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+from pydantic import ValidationError
 from constants import (
-    SECRETS_PATH,
     MODEL_NAME,
+    OPENAI_BASE_URL,
     XLAM_FUNCTION_CALLING_SAMPLES_FILE,
     VEHICLE_PROPERTY_SCHEMA_FILE,
     VEHICLE_PROPERTIES_FILE,
     CAR_PROPERTY_FUNCTIONS_FILE,
+    CACHE_MAX_MB,
+    COVERAGE_HINT_CELLS,
+    SEED_BATCH_SIZE,
+    EXPANSION_BATCH_SIZE,
+    BATCH_SIZE_MIN,
+    BATCH_SIZE_MAX,
+    BATCH_SIZE_STEP,
+    MAX_FAILED_REQUESTS_IN_A_ROW,
+    PRICE_PER_M_INPUT_TOKENS,
+    PRICE_PER_M_CACHED_INPUT_TOKENS,
+    PRICE_PER_M_OUTPUT_TOKENS,
+    METRICS_WRITE_INTERVAL,
 )
 from prompt.prompt import (
-    GENERATION_PROMPT,
+    GENERATION_PROMPT_PREFIX,
+    GENERATION_PROMPT_SUFFIX,
+    SUBSET_PROPERTIES_NOTE,
+    SUBSET_PROPERTIES_SECTION,
+    COVERAGE_HINT_SECTION,
     SEED_GENERATION_EXAMPLE_SECTION,
     EXPANSION_GENERATION_EXAMPLE_SECTION,
 )
-from inference.api.llm_engine import LLMEngine, LLMOptions
-from inference.gemini.google_gen_ai_engine import GoogleGenAIEngine
-from data.data_format import QueryItem, parse_generated_data_safely, load_existing_data
+from inference.api.llm_engine import LLMEngine, LLMOptions, LLMResponse
+from inference.cache.cached_engine import CachedLLMEngine
+from inference.router.router_engine import RouterEngine
+from inference.engine_factory import create_engine
+from data.data_format import QueryItem, load_existing_data
+from data.json_stream import JsonArrayStream
 from data.data_filter import QueryFilter
+from data.data_validator import AnswerValidator
+from data.coverage_index import CoverageIndex
+from batch_sizer import BatchOutcome, BatchSizer
+from metrics import Metrics
 
 logger = logging.getLogger(__name__)
 
 
 class GenerationPipeline:
 
-    def __init__(self, num_samples, output, save_interval):
+    def __init__(
+        self,
+        num_samples,
+        output,
+        save_interval,
+        concurrency=1,
+        cache_dir=None,
+        cache_max_mb=CACHE_MAX_MB,
+        engine: Optional[LLMEngine] = None,
+        filter_mode="lsh",
+        filter_workers=1,
+        token_cache=True,
+        filter_tokenizer=None,
+        checkpoint_mode="rewrite",
+        validate_answers=True,
+        context_cache_ttl=None,
+        property_subset=0,
+        example_sampling="coverage",
+        batch_size_min=BATCH_SIZE_MIN,
+        batch_size_max=BATCH_SIZE_MAX,
+        rpm=None,
+        tpm=None,
+        metrics_out=None,
+        engine_type="gemini",
+        model_name=None,
+        base_url=OPENAI_BASE_URL,
+    ):
+        if concurrency < 1:
+            raise ValueError("Concurrency must be at least 1.")
+        if engine_type == "openai" and engine is None and not model_name:
+            raise ValueError("A model name is required for the openai engine.")
+        if property_subset < 0:
+            raise ValueError("Property subset size cannot be negative.")
         self.num_samples = num_samples
         self.output_path = output
         self.save_interval = save_interval
-        self.engine = self._initialize_engine()
+        self.concurrency = concurrency
+        self.cache_dir = cache_dir
+        self.cache_max_mb = cache_max_mb
+        self.filter_mode = filter_mode
+        self.filter_workers = filter_workers
+        self.token_cache = token_cache
+        self.filter_tokenizer = filter_tokenizer
+        self.checkpoint_mode = checkpoint_mode
+        self.context_cache_ttl = context_cache_ttl
+        # Requests- and tokens-per-minute quotas for the Gemini engine.
+        self.rpm = rpm
+        self.tpm = tpm
+        self.metrics = Metrics(metrics_out, METRICS_WRITE_INTERVAL)
+        self.engine_type = engine_type
+        self.model_name = model_name or MODEL_NAME
+        self.base_url = base_url
+        # Set when the secrets file configures several Gemini backends.
+        self._router: Optional[RouterEngine] = None
+        # Set with a response cache. Requests are numbered in the order their
+        # prompts are built, and the cache replays responses by number, so a
+        # resumed run or a run with other filter settings still gets hits.
+        self._cache: Optional[CachedLLMEngine] = None
+        self._request_count = 0
+        # Requests whose results are in the data; a resumed run continues
+        # numbering from here.
+        self._consumed_requests = 0
+        # When positive, each prompt lists the properties used by its examples
+        # plus this many others instead of the whole catalogue.
+        self.property_subset = property_subset
+        self.example_sampling = example_sampling
+        self.coverage: Optional[CoverageIndex] = None
+        # Expansion requests completed and samples they added, for the
+        # acceptance rate.
+        self._expansion_calls = 0
+        self._expansion_accepted = 0
+        # Elements dropped from responses, and valid items recovered from
+        # responses that had dropped elements.
+        self._lost_count = 0
+        self._salvaged_count = 0
+        self.journal_path = output.with_name(output.name + ".journal.jsonl")
+        self.state_path = output.with_name(output.name + ".state.json")
+        self.seed_sizer = self._create_sizer(
+            SEED_BATCH_SIZE, batch_size_min, batch_size_max
+        )
+        self.expansion_sizer = self._create_sizer(
+            EXPANSION_BATCH_SIZE, batch_size_min, batch_size_max
+        )
+        # Number of leading samples already durable in the output and journal.
+        self._saved_count = 0
         self.prompt_assets = self._load_prompt_assets()
+        # The static part of the prompt is rendered once and handed to the
+        # engine as its system instruction, so every request shares it verbatim.
+        self.prompt_prefix = self._render_prompt_prefix()
+        self._property_entries = self._load_property_entries()
+        # Properties not referenced by the examples are drawn from a shuffled
+        # rotation, so every property is offered once per pass over the catalogue.
+        self._property_rotation: List[str] = []
+        self._property_tokens_saved = 0
+        self._subset_prompt_count = 0
+        self._subset_property_count = 0
+        self.engine = engine if engine is not None else self._initialize_engine()
+        if isinstance(self.engine, CachedLLMEngine):
+            self._cache = self.engine
+        self.engine.load(
+            LLMOptions(
+                model_name=self.model_name,
+                temperature=1.0,
+                thinking_mode=True,
+                system_instruction=self.prompt_prefix,
+                context_cache_ttl=context_cache_ttl,
+            )
+        )
+        self.validator = None
+        if validate_answers:
+            self.validator = AnswerValidator(
+                VEHICLE_PROPERTIES_FILE, CAR_PROPERTY_FUNCTIONS_FILE
+            )
 
-    def _initialize_engine(self) -> LLMEngine:
-        if not SECRETS_PATH.exists():
-            raise FileNotFoundError(f"Secrets file not found at: {self.SECRETS_PATH}")
-
-        with open(SECRETS_PATH, "rb") as f:
-            secrets = tomllib.load(f)
-
-        api_key = secrets.get("ai_services", {}).get("gemini", {}).get("api_key")
-        if not api_key:
-            raise ValueError("API key not found in secrets file.")
+    def _create_sizer(self, initial: int, minimum: int, maximum: int) -> BatchSizer:
+        """
+        Adaptive sizing follows request timing, but replayed responses take
+        no time and hold the number of pairs of the recorded request. With a
+        cache the size is fixed at `initial`, clamped to the bounds.
+        """
+        if self.cache_dir is not None and minimum != maximum:
+            size = min(max(initial, minimum), maximum)
+            logger.info(
+                "Response cache in use: requesting a fixed %d pairs per prompt",
+                size,
+            )
+            minimum = maximum = size
+        return BatchSizer(initial, minimum, maximum, BATCH_SIZE_STEP)
 
-        engine = GoogleGenAIEngine(api_key=api_key)
-        engine.load(
-            LLMOptions(model_name=MODEL_NAME, temperature=1.0, thinking_mode=True)
+    def _initialize_engine(self) -> LLMEngine:
+        engine = create_engine(
+            self.engine_type,
+            self.model_name,
+            self.base_url,
+            max_connections=self.concurrency,
+            rpm=self.rpm,
+            tpm=self.tpm,
         )
+        if isinstance(engine, RouterEngine):
+            self._router = engine
+        if self.cache_dir is not None:
+            engine = CachedLLMEngine(
+                engine, self.cache_dir, self.cache_max_mb * 1024 * 1024
+            )
         return engine
 
     def _load_prompt_assets(self) -> Dict[str, str]:
@@ -83,151 +243,614 @@ class GenerationPipeline:
             "car_funcs": car_funcs,
         }
 
+    def _render_prompt_prefix(self) -> str:
+        replacements = {
+            "{vehicle_property_schema_placeholder}": self.prompt_assets[
+                "vehicle_schema"
+            ],
+            "{vehicle_properties_placeholder}": (
+                SUBSET_PROPERTIES_NOTE
+                if self.property_subset > 0
+                else self.prompt_assets["vehicle_props"]
+            ),
+            "{car_property_functions_placeholder}": self.prompt_assets["car_funcs"],
+        }
+
+        prefix = GENERATION_PROMPT_PREFIX
+        for placeholder, content in replacements.items():
+            prefix = prefix.replace(placeholder, content)
+
+        return prefix
+
+    def _load_property_entries(self) -> Dict[str, Dict]:
+        """Maps each property name to its catalogue entry, in catalogue order."""
+        return {
+            prop["propertyName"]: prop
+            for prop in json.loads(self.prompt_assets["vehicle_props"])
+        }
+
     def run(self):
         """
         Executes the generation pipeline: loads initial data (from disk or seed)
         and expands it until the sample target is met.
         """
+        try:
+            self._run()
+        finally:
+            # Also releases the client and context cache of a failed run.
+            self.engine.unload()
+
+    def _run(self):
         if self._is_cold_start():
             logger.info("Starting cold generation (Seed phase)...")
             data = self._generate_valid_seed()
+            self.metrics.count("samples_accepted", len(data))
             self._save_data(data)
         else:
             logger.info("Loading existing data...")
-            data = load_existing_data(self.output_path)
+            data = load_existing_data(self.output_path, journal=self.journal_path)
+            self._saved_count = len(data)
+            self._load_state()
+            if self.journal_path.exists():
+                # Compact right away so that new appends never follow a
+                # partially written line.
+                self._save_data(data)
 
-        filter = QueryFilter(data)
+        with self.metrics.timer("filter_init"):
+            filter = self._create_filter(data)
+        if self.example_sampling == "coverage":
+            self.coverage = CoverageIndex(VEHICLE_PROPERTIES_FILE)
+            self.coverage.add(data)
         loop_iteration = 0
-        while len(data) < self.num_samples:
-            loop_iteration += 1
-            expansion_batch = self._run_expansion_generation(data)
-            if expansion_batch:
-                filter.extend_unique(expansion_batch)
-            # Logging
-            current_count = len(data)
-            percent = min(100.0, (current_count / self.num_samples) * 100)
-            logger.info(
-                "Expansion Loop %d: %d/%d (%.1f%%) - %s",
-                loop_iteration,
-                current_count,
-                self.num_samples,
-                percent,
-                "Batch added" if expansion_batch else "No data added",
-            )
-            # Saving checkpoint.
-            if self.save_interval > 0 and loop_iteration % self.save_interval == 0:
-                self._save_data(data)
+        failed_in_a_row = 0
+        # Expansion prompts are built on this thread so that example sampling
+        # stays sequential; only the blocking LLM calls run on the workers.
+        # Results are consumed in submission order, which keeps the filter
+        # input deterministic regardless of which request finishes first.
+        # Items of the oldest request are filtered as they stream in.
+        executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="expansion"
+        )
+        in_flight: Deque[Tuple[Future, queue.SimpleQueue]] = deque()
+        try:
+            while len(data) < self.num_samples:
+                while len(in_flight) < self.concurrency:
+                    batch_num = self.expansion_sizer.next_size()
+                    with self.metrics.timer("prompt"):
+                        prompt = self._build_expansion_prompt(data, batch_num)
+                    sink = queue.SimpleQueue()
+                    future = executor.submit(
+                        self._stream_to_queue,
+                        prompt,
+                        batch_num,
+                        sink,
+                        self._number_request(),
+                    )
+                    in_flight.append((future, sink))
+
+                future, sink = in_flight.popleft()
+                previous_count = len(data)
+                for items in self._drain(sink):
+                    expansion_batch = self._validate_answers(items)
+                    if expansion_batch:
+                        batch_start = len(data)
+                        with self.metrics.timer("filter"):
+                            filter.extend_unique(expansion_batch)
+                        if self.coverage is not None:
+                            self.coverage.add(data[batch_start:])
+                self._consumed_requests += 1
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    # Only a request that failed before its first chunk
+                    # raises, so the batch added nothing.
+                    self.metrics.count("requests_failed")
+                    failed_in_a_row += 1
+                    if failed_in_a_row >= MAX_FAILED_REQUESTS_IN_A_ROW:
+                        raise RuntimeError(
+                            f"{failed_in_a_row} expansion requests failed in a row"
+                        ) from e
+                    logger.error("Expansion request failed, skipping it: %s", e)
+                    continue
+                failed_in_a_row = 0
+                loop_iteration += 1
+                # Logging
+                current_count = len(data)
+                accepted = current_count - previous_count
+                returned = outcome.returned
+                self._expansion_calls += 1
+                self._expansion_accepted += accepted
+                self.metrics.count("samples_accepted", accepted)
+                self.expansion_sizer.record(outcome, accepted)
+                self._record_salvage(outcome)
+                percent = min(100.0, (current_count / self.num_samples) * 100)
                 logger.info(
-                    f"Checkpoint reached (Loop {loop_iteration}). Intermediate data saved"
+                    "Expansion Loop %d: %d/%d (%.1f%%) - batch %d, accepted %d/%d (%.0f%%), lost %d, %.1f accepted per call overall",
+                    loop_iteration,
+                    current_count,
+                    self.num_samples,
+                    percent,
+                    outcome.batch_num,
+                    accepted,
+                    returned,
+                    100.0 * accepted / returned if returned else 0.0,
+                    outcome.lost,
+                    self._expansion_accepted / self._expansion_calls,
                 )
-        self._save_data(data)
+                # Saving checkpoint.
+                if self.save_interval > 0 and loop_iteration % self.save_interval == 0:
+                    self._checkpoint(data)
+                    logger.info(
+                        f"Checkpoint reached (Loop {loop_iteration}). Intermediate data saved"
+                    )
+                    self._log_rejections()
+                    logger.info("Batch sizes: %s", self.expansion_sizer.summary())
+                    if self._router is not None:
+                        logger.info("Router backends:\n%s", self._router.summary())
+                self._update_cost()
+                self.metrics.maybe_write()
+        finally:
+            # The target is met (or the run failed): drop queued prompts and
+            # wait for the requests still in flight, which must not outlive
+            # the engine unloaded by `run()`.
+            executor.shutdown(wait=True, cancel_futures=True)
+            filter.close()
+            # Keeps the samples accepted so far, also when the run failed.
+            self._save_data(data)
+        self._log_rejections()
+        logger.info(
+            "Streaming parser: %d elements lost, %d items salvaged from damaged responses",
+            self._lost_count,
+            self._salvaged_count,
+        )
+        if self._subset_prompt_count:
+            logger.info(
+                "Property subsetting saved ~%d input tokens over %d prompts "
+                "(%.1f/%d properties listed per prompt)",
+                self._property_tokens_saved,
+                self._subset_prompt_count,
+                self._subset_property_count / self._subset_prompt_count,
+                len(self._property_entries),
+            )
+        cost, cost_per_sample = self._update_cost()
+        self.metrics.write()
+        self.metrics.log_summary()
+        logger.info(
+            "Tokens: %d input (%d cached), %d output; estimated cost $%.2f, $%.4f per accepted sample",
+            self.metrics.counter("input_tokens"),
+            self.metrics.counter("cached_input_tokens"),
+            self.metrics.counter("output_tokens"),
+            cost,
+            cost_per_sample,
+        )
         logger.info(f"Process completed. Total samples saved: {len(data)}")
 
+    def _validate_answers(
+        self, batch: Optional[List[QueryItem]]
+    ) -> Optional[List[QueryItem]]:
+        """Drops items with answers that do not match the property catalogue."""
+        if not batch or self.validator is None:
+            return batch
+        with self.metrics.timer("validate_answers"):
+            return self.validator.filter(batch)
+
+    def _log_rejections(self):
+        if self.validator is not None and self.validator.rejections:
+            logger.info(
+                "Answer validation rejections: %s",
+                dict(self.validator.rejections.most_common()),
+            )
+
+    def _create_filter(self, data: List[QueryItem]) -> QueryFilter:
+        return QueryFilter(data, **self._filter_options())
+
+    def _filter_options(self) -> Dict:
+        cache_path = None
+        if self.token_cache:
+            cache_path = self.output_path.with_name(self.output_path.name + ".tokens")
+        return {
+            "use_index": self.filter_mode == "lsh",
+            "workers": self.filter_workers,
+            "cache_path": cache_path,
+            "tokenizer_file": self.filter_tokenizer,
+            "metrics": self.metrics,
+        }
+
     def _is_cold_start(self) -> bool:
-        return not self.output_path.exists()
+        return not self.output_path.exists() and not self.journal_path.exists()
 
     def _generate_valid_seed(self, max_retries: int = 5) -> List[QueryItem]:
         """Attempts to generate seed data with a retry limit."""
         for attempt in range(max_retries):
-            seed_data = self._run_seed_generation()
+            items: List[QueryItem] = []
+            outcome = self._run_seed_generation(items.append)
+            self._consumed_requests += 1
+            self._record_salvage(outcome)
+            seed_data = self._validate_answers(items)
+            self.seed_sizer.record(outcome, len(seed_data) if seed_data else 0)
+            logger.info(
+                "Seed attempt %d: batch %d, %d valid samples",
+                attempt + 1,
+                outcome.batch_num,
+                len(seed_data) if seed_data else 0,
+            )
             if seed_data:
                 return seed_data
         raise RuntimeError(
             f"Failed to generate seed data after {max_retries} attempts."
         )
 
-    def _run_seed_generation(self) -> Optional[List[QueryItem]]:
+    def _run_seed_generation(
+        self, emit: Callable[[QueryItem], None]
+    ) -> BatchOutcome:
         """Prepares prompt and runs generation for the seed phase."""
         example_section = SEED_GENERATION_EXAMPLE_SECTION.replace(
             "{xlam_function_calling_samples_placeholder}",
             self.prompt_assets["xlam_samples"],
         )
-        prompt = self._construct_prompt(example_section, batch_num=15)
-        return self._generate_batch(prompt)
-
-    def _run_expansion_generation(
-        self, warm_data: List[QueryItem], example_num: int = 8
-    ) -> Optional[List[QueryItem]]:
-        """Prepares prompt and runs generation for the expansion phase."""
-        # Select random examples from existing data
+        batch_num = self.seed_sizer.next_size()
+        with self.metrics.timer("prompt"):
+            prompt = self._construct_prompt(
+                example_section, batch_num=batch_num, required_properties=set()
+            )
+        return self._generate_batch(prompt, batch_num, emit, self._number_request())
+
+    def _number_request(self) -> int:
+        """Returns the number of the next request, in prompt build order."""
+        index = self._request_count
+        self._request_count += 1
+        return index
+
+    def _cache_request(self, index: int) -> ContextManager:
+        """Keys the cached response of request `index` on its number."""
+        if self._cache is None:
+            return nullcontext()
+        return self._cache.request(index)
+
+    def _build_expansion_prompt(
+        self, warm_data: List[QueryItem], batch_num: int, example_num: int = 8
+    ) -> str:
+        """
+        Builds an expansion prompt from existing samples. With coverage-aware
+        sampling, the examples and a coverage hint favour the parts of the
+        catalogue the dataset exercises least; otherwise examples are random.
+        """
         sample_size = min(example_num, len(warm_data))
-        example_subset = random.sample(warm_data, sample_size)
+        coverage_section = ""
+        if self.coverage is None:
+            example_subset = random.sample(warm_data, sample_size)
+            hint_properties = set()
+        else:
+            example_subset = self.coverage.sample_examples(warm_data, sample_size)
+            hint_cells = self.coverage.underrepresented(COVERAGE_HINT_CELLS)
+            hint_properties = {property_name for _, property_name, _ in hint_cells}
+            coverage_section = COVERAGE_HINT_SECTION.format(
+                coverage_calls_placeholder="\n".join(
+                    f"- {function}(propertyName={property_name}, areaId={area_id})"
+                    for function, property_name, area_id in hint_cells
+                ),
+                call_count_placeholder=self._describe_call_count(
+                    self.coverage.rarest_call_count()
+                ),
+            )
         example_json = json.dumps(
             [item.model_dump() for item in example_subset], indent=2, ensure_ascii=False
         )
         example_section = EXPANSION_GENERATION_EXAMPLE_SECTION.replace(
             "{expansion_function_calling_samples_placeholder}", example_json
         )
-        prompt = self._construct_prompt(example_section, batch_num=30)
-        return self._generate_batch(prompt)
-
-    def _construct_prompt(self, example_section: str, batch_num: int) -> str:
-        replacements = {
-            "{section_examples_placeholder}": example_section,
-            "{vehicle_property_schema_placeholder}": self.prompt_assets[
-                "vehicle_schema"
-            ],
-            "{vehicle_properties_placeholder}": self.prompt_assets["vehicle_props"],
-            "{car_property_functions_placeholder}": self.prompt_assets["car_funcs"],
-            "{pair_number_placeholder}": str(batch_num),
+        required_properties = hint_properties | {
+            answer.arguments.get("propertyName")
+            for item in example_subset
+            for answer in item.answers
         }
+        return self._construct_prompt(
+            example_section,
+            batch_num=batch_num,
+            required_properties=required_properties,
+            coverage_section=coverage_section,
+        )
 
-        prompt = GENERATION_PROMPT
-        for placeholder, content in replacements.items():
-            prompt = prompt.replace(placeholder, content)
-
-        return prompt
-
-    def _generate_batch(self, prompt: str) -> Optional[List[QueryItem]]:
-        response = self.engine.generate(prompt)
-        json_str = self._extract_json_str(response.text)
+    @staticmethod
+    def _describe_call_count(calls: int) -> str:
+        if calls == CoverageIndex.MAX_CALLS:
+            return f"{calls} or more"
+        return str(calls)
+
+    def _construct_prompt(
+        self,
+        example_section: str,
+        batch_num: int,
+        required_properties: Set[str],
+        coverage_section: str = "",
+    ) -> str:
+        """Builds the per-request part of the prompt; see `prompt_prefix`."""
+        properties_section = ""
+        if self.property_subset > 0:
+            properties_section = SUBSET_PROPERTIES_SECTION.replace(
+                "{vehicle_properties_placeholder}",
+                self._select_properties(required_properties),
+            )
+        return GENERATION_PROMPT_SUFFIX.format(
+            section_properties_placeholder=properties_section,
+            section_examples_placeholder=example_section,
+            section_coverage_placeholder=coverage_section,
+            pair_number_placeholder=batch_num,
+        )
 
-        if not json_str:
+    def _select_properties(self, required_properties: Set[str]) -> str:
+        """
+        Returns the minified catalogue entries for `required_properties` plus
+        `property_subset` properties from the rotation.
+        """
+        selected = set(required_properties)
+        selected.intersection_update(self._property_entries)
+
+        extra = 0
+        while extra < self.property_subset and len(selected) < len(
+            self._property_entries
+        ):
+            if not self._property_rotation:
+                self._property_rotation = list(self._property_entries)
+                random.shuffle(self._property_rotation)
+            name = self._property_rotation.pop()
+            if name not in selected:
+                selected.add(name)
+                extra += 1
+
+        properties = json.dumps(
+            [
+                prop
+                for name, prop in self._property_entries.items()
+                if name in selected
+            ],
+            separators=(",", ":"),
+            ensure_ascii=False,
+        )
+        # Rough estimate of ~4 characters per token.
+        tokens_saved = (
+            len(self.prompt_assets["vehicle_props"]) - len(properties)
+        ) // 4
+        self._property_tokens_saved += tokens_saved
+        self._subset_prompt_count += 1
+        self._subset_property_count += len(selected)
+        logger.debug(
+            "Prompt lists %d/%d properties, ~%d input tokens saved",
+            len(selected),
+            len(self._property_entries),
+            tokens_saved,
+        )
+        return properties
+
+    def _generate_batch(
+        self,
+        prompt: str,
+        batch_num: int,
+        emit: Callable[[QueryItem], None],
+        request_index: int,
+    ) -> BatchOutcome:
+        """
+        Streams a response and parses its JSON array incrementally. Every
+        complete element that forms a valid QueryItem is passed to `emit` as
+        soon as it arrives; malformed, invalid or cut-off elements are dropped
+        on their own. A stream that fails after its first chunk keeps the
+        items already emitted, and its tail counts as one lost element.
+        """
+        start = time.perf_counter()
+        stream = JsonArrayStream()
+        returned = invalid = 0
+        finish_reason = None
+        texts = []
+        # Time spent extracting and validating elements, and the last
+        # reported (cumulative) token usage.
+        extract_seconds = parse_seconds = 0.0
+        usage = None
+        failure = None
+        try:
+            with self._cache_request(request_index):
+                for chunk in self.engine.generate_stream(prompt):
+                    if not texts:
+                        self.metrics.observe(
+                            "llm_first_chunk", time.perf_counter() - start
+                        )
+                    texts.append(chunk.text)
+                    finish_reason = chunk.finish_reason or finish_reason
+                    if chunk.input_tokens is not None:
+                        usage = chunk
+                    extract_start = time.perf_counter()
+                    elements = stream.feed(chunk.text)
+                    parse_start = time.perf_counter()
+                    extract_seconds += parse_start - extract_start
+                    for element in elements:
+                        try:
+                            item = QueryItem.model_validate(element)
+                        except ValidationError:
+                            invalid += 1
+                            continue
+                        returned += 1
+                        emit(item)
+                    parse_seconds += time.perf_counter() - parse_start
+        except Exception as e:
+            if not texts:
+                raise
+            failure = e
+        lost_before_close = stream.lost
+        stream.close()
+        seconds = time.perf_counter() - start
+        self._record_request(seconds, extract_seconds, parse_seconds, usage)
+
+        if not stream.started:
+            logger.warning(
+                "No JSON content found in response. Response: %s", "".join(texts)
+            )
+        lost = stream.lost + invalid
+        if failure is not None:
+            if stream.lost == lost_before_close:
+                # The stream broke between elements; the tail is still lost.
+                lost += 1
             logger.warning(
-                "No JSON content found in response. Response: %s", response.text
+                "Response stream failed after %d chunks, keeping %d items: %s",
+                len(texts),
+                returned,
+                failure,
             )
-            return None
+        if lost:
+            logger.warning(
+                "Dropped %d malformed or cut-off elements, kept %d", lost, returned
+            )
+        return BatchOutcome(
+            batch_num,
+            returned,
+            lost,
+            seconds,
+            truncated=finish_reason == "MAX_TOKENS",
+            found_array=stream.started,
+        )
 
+    def _stream_to_queue(
+        self,
+        prompt: str,
+        batch_num: int,
+        sink: queue.SimpleQueue,
+        request_index: int,
+    ) -> BatchOutcome:
+        """Runs `_generate_batch` into `sink`, ending it with None."""
         try:
-            return parse_generated_data_safely(json_str)
-        except Exception as e:
-            logger.exception("Failed to parse generated JSON")
-            return None
+            return self._generate_batch(prompt, batch_num, sink.put, request_index)
+        finally:
+            sink.put(None)
 
     @staticmethod
-    def _extract_json_str(llm_response: str) -> Optional[str]:
+    def _drain(sink: queue.SimpleQueue) -> Iterator[List[QueryItem]]:
         """
-        Extracts the JSON substring from an LLM response.
-
-        Strategies:
-        1. Look for markdown code blocks (```json ... ```).
-        2. If no code block, look for the outermost list brackets [...].
+        Yields the items streamed into `sink`, grouped by arrival, until the
+        end marker.
         """
-        if not llm_response:
-            return None
-
-        text = llm_response.strip()
-
-        code_block_pattern = r"```(?:json)?\s*(.*?)```"
-        match = re.search(code_block_pattern, text, re.DOTALL)
-
-        if match:
-            return match.group(1).strip()
-
-        start_idx = text.find("[")
-        end_idx = text.rfind("]")
-
-        if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-            return text[start_idx : end_idx + 1]
-
-        return None
+        while True:
+            items = [sink.get()]
+            while not sink.empty():
+                items.append(sink.get())
+            done = items[-1] is None
+            if done:
+                items.pop()
+            if items:
+                yield items
+            if done:
+                return
+
+    def _record_request(
+        self,
+        seconds: float,
+        extract_seconds: float,
+        parse_seconds: float,
+        usage: Optional[LLMResponse],
+    ):
+        self.metrics.observe("llm_request", seconds)
+        self.metrics.observe("json_extract", extract_seconds)
+        self.metrics.observe("parse", parse_seconds)
+        self.metrics.count("requests")
+        if usage is not None:
+            self.metrics.count("input_tokens", usage.input_tokens)
+            self.metrics.count("output_tokens", usage.output_tokens or 0)
+            self.metrics.count("cached_input_tokens", usage.cached_input_tokens or 0)
+
+    def _update_cost(self) -> Tuple[float, float]:
+        """
+        Updates the estimated cost from the token usage so far; returns the
+        total and the cost per accepted sample. Self-hosted servers are not
+        billed per token, so the openai engine's cost is zero.
+        """
+        cost = 0.0
+        if self.engine_type == "gemini":
+            cached = self.metrics.counter("cached_input_tokens")
+            uncached = self.metrics.counter("input_tokens") - cached
+            cost = (
+                uncached * PRICE_PER_M_INPUT_TOKENS
+                + cached * PRICE_PER_M_CACHED_INPUT_TOKENS
+                + self.metrics.counter("output_tokens") * PRICE_PER_M_OUTPUT_TOKENS
+            ) / 1_000_000
+        cost_per_sample = cost / max(self.metrics.counter("samples_accepted"), 1)
+        self.metrics.set("cost_usd", cost)
+        self.metrics.set("cost_per_accepted_sample_usd", cost_per_sample)
+        return cost, cost_per_sample
+
+    def _record_salvage(self, outcome: BatchOutcome):
+        self._lost_count += outcome.lost
+        if outcome.damaged:
+            self._salvaged_count += outcome.returned
+
+    def _checkpoint(self, data: List[QueryItem]):
+        """
+        Persists intermediate results. In journal mode only the samples added
+        since the previous checkpoint are appended; otherwise the output file
+        is rewritten.
+        """
+        if self.checkpoint_mode == "journal":
+            with self.metrics.timer("save_journal"):
+                self._append_journal(data[self._saved_count :])
+            self._saved_count = len(data)
+            self._save_state()
+        else:
+            self._save_data(data)
 
     def _save_data(self, data: List[QueryItem]):
         """
         Saves the list of QueryItems to the output file in JSON format.
+        The file is replaced atomically, after which the journal is redundant.
         """
+        with self.metrics.timer("save"):
+            self._write_output(data)
+        self.journal_path.unlink(missing_ok=True)
+        self._saved_count = len(data)
+        self._save_state()
+
+    def _save_state(self):
+        """
+        Saves the learned batch size statistics and the number of requests
+        behind the saved data next to the output.
+        """
+        state = {
+            "seed_batch": self.seed_sizer.state(),
+            "expansion_batch": self.expansion_sizer.state(),
+            "requests": self._consumed_requests,
+        }
+        tmp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(state, indent=2), encoding="utf-8")
+        os.replace(tmp_path, self.state_path)
+
+    def _load_state(self):
+        if not self.state_path.exists():
+            return
+        try:
+            state = json.loads(self.state_path.read_text(encoding="utf-8"))
+            self.seed_sizer.restore(state.get("seed_batch", {}))
+            self.expansion_sizer.restore(state.get("expansion_batch", {}))
+            self._request_count = self._consumed_requests = int(
+                state.get("requests", 0)
+            )
+        except (ValueError, TypeError) as e:
+            logger.warning(
+                "Ignoring unreadable pipeline state %s: %s", self.state_path, e
+            )
+            return
+        logger.info("Resuming with batch sizes: %s", self.expansion_sizer.summary())
+
+    def _write_output(self, data: List[QueryItem]):
         self.output_path.parent.mkdir(parents=True, exist_ok=True)
         json_data = [item.model_dump() for item in data]
 
-        with open(self.output_path, "w", encoding="utf-8") as f:
+        tmp_path = self.output_path.with_name(self.output_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
             json.dump(json_data, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.output_path)
+
+    def _append_journal(self, items: List[QueryItem]):
+        """Appends samples to the JSONL journal and fsyncs it."""
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            for item in items:
+                f.write(item.model_dump_json() + "\n")
+            f.flush()
+            os.fsync(f.fileno())
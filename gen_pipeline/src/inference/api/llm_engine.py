@@ -1,10 +1,20 @@
+import asyncio
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
+from typing import Iterator, List, Optional, Sequence
 
 
 @dataclass
 class LLMResponse:
     text: str
+    # Why generation stopped, e.g. "STOP" or "MAX_TOKENS" (None if unknown).
+    finish_reason: Optional[str] = None
+    # Token usage reported by the provider (None if unknown or not billed,
+    # e.g. for a cached response). `cached_input_tokens` is the part of
+    # `input_tokens` served from a provider-side context cache.
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    cached_input_tokens: Optional[int] = None
 
 
 @dataclass
@@ -16,10 +26,18 @@ class LLMOptions:
     model_name: str
     temperature: float = 1.0
     thinking_mode: bool = False
+    # Static instructions sent ahead of every prompt. Engines that support
+    # provider-side context caching may upload it once and reference it.
+    system_instruction: Optional[str] = None
+    # Lifetime of the provider-side cache for `system_instruction`;
+    # None disables explicit caching.
+    context_cache_ttl: Optional[int] = None
 
     def __post_init__(self):
         if self.temperature < 0.0 or self.temperature > 2.0:
             raise ValueError("Temperature must be between 0.0 and 2.0")
+        if self.context_cache_ttl is not None and self.context_cache_ttl <= 0:
+            raise ValueError("Context cache TTL must be positive.")
 
 
 class LLMEngine(ABC):
@@ -42,9 +60,60 @@ class LLMEngine(ABC):
         pass
 
     @abstractmethod
-    def generate(self, prompt: str, options: LLMOptions) -> LLMResponse:
+    def generate(
+        self, prompt: str, options: Optional[LLMOptions] = None
+    ) -> LLMResponse:
         """
         Stateless generation: Sends a prompt, returns a response.
         Does not maintain conversation history internally.
+        When `options` is omitted, the options passed to `load()` are used.
         """
         pass
+
+    def generate_stream(
+        self, prompt: str, options: Optional[LLMOptions] = None
+    ) -> Iterator[LLMResponse]:
+        """
+        Streaming variant of `generate()`: yields the response text in chunks,
+        the last of which carries the finish reason.
+        The default implementation yields the whole response as one chunk;
+        engines that can stream should override it.
+        """
+        yield self.generate(prompt, options)
+
+    async def agenerate(
+        self, prompt: str, options: Optional[LLMOptions] = None
+    ) -> LLMResponse:
+        """
+        Asynchronous variant of `generate()`.
+        The default implementation runs `generate()` in a worker thread;
+        engines with a native async client should override it.
+        """
+        return await asyncio.to_thread(self.generate, prompt, options)
+
+    def generate_many(
+        self,
+        prompts: Sequence[str],
+        options: Optional[LLMOptions] = None,
+        max_concurrency: Optional[int] = None,
+    ) -> List[LLMResponse]:
+        """
+        Generates a response for every prompt, returned in prompt order.
+        Up to `max_concurrency` requests run at once (unbounded if None).
+        Engines that support native batching may override it.
+        """
+        return asyncio.run(self._agenerate_many(prompts, options, max_concurrency))
+
+    async def _agenerate_many(
+        self,
+        prompts: Sequence[str],
+        options: Optional[LLMOptions],
+        max_concurrency: Optional[int],
+    ) -> List[LLMResponse]:
+        semaphore = asyncio.Semaphore(max_concurrency or max(len(prompts), 1))
+
+        async def run_one(prompt: str) -> LLMResponse:
+            async with semaphore:
+                return await self.agenerate(prompt, options)
+
+        return list(await asyncio.gather(*(run_one(p) for p in prompts)))
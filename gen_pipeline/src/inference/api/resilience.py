@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+from typing import Awaitable, Callable, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Rough size of a token, used to estimate request sizes before they are sent.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(*texts: Optional[str]) -> int:
+    return sum(len(text) for text in texts if text) // CHARS_PER_TOKEN + 1
+
+
+class RetryableError(Exception):
+    """
+    Raised by engines for failures worth retrying (rate limits, transient
+    server or network errors). `retry_after` is the server-requested delay in
+    seconds, if any.
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Bucket:
+    """
+    A token bucket refilled at `rate_per_minute`, holding at most `capacity`.
+
+    Requests reserve tokens even when the bucket is short; the level then goes
+    negative and the caller is told how long to wait. Concurrent callers are
+    thus queued in arrival order instead of all waking up when tokens return.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float, now: float) -> float:
+        refill = (now - self.updated) * self.rate
+        self.level = min(self.capacity, self.level + refill)
+        self.updated = now
+        self.level -= amount
+        return max(0.0, -self.level / self.rate)
+
+    def refund(self, amount: float):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """
+    Paces requests to stay within requests-per-minute and tokens-per-minute
+    quotas. Either limit may be None (unlimited). Bursts are limited to
+    `burst_seconds` worth of quota so the provider never sees a full minute's
+    requests at once.
+    """
+
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        burst_seconds: float = 10.0,
+    ):
+        self._lock = threading.Lock()
+        self._requests = None
+        self._tokens = None
+        if rpm:
+            self._requests = _Bucket(rpm, max(1.0, rpm * burst_seconds / 60.0))
+        if tpm:
+            self._tokens = _Bucket(tpm, max(1.0, tpm * burst_seconds / 60.0))
+
+    def reserve(self, tokens: int) -> float:
+        """Reserves one request of `tokens`; returns the seconds to wait first."""
+        now = time.monotonic()
+        with self._lock:
+            wait = 0.0
+            if self._requests is not None:
+                wait = self._requests.reserve(1, now)
+            if self._tokens is not None:
+                wait = max(wait, self._tokens.reserve(tokens, now))
+            return wait
+
+    def adjust(self, estimated: int, actual: int):
+        """Corrects a reservation once the actual token usage is known."""
+        if self._tokens is None:
+            return
+        with self._lock:
+            self._tokens.refund(estimated - actual)
+
+
+class CircuitBreaker:
+    """
+    Stops dispatching after `failure_threshold` consecutive failures and
+    keeps the circuit open for `cooldown` seconds. After the cooldown a
+    single failure reopens it; a success closes it again. With a threshold
+    of None the circuit never opens on failures.
+    """
+
+    def __init__(self, failure_threshold: Optional[int] = 5, cooldown: float = 30.0):
+        self._lock = threading.Lock()
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._open_until = 0.0
+
+    def delay(self) -> float:
+        """Returns the seconds until requests may be dispatched again."""
+        with self._lock:
+            return max(0.0, self._open_until - time.monotonic())
+
+    def pause(self, seconds: float):
+        """Holds all dispatch for at least `seconds`, e.g. on a retry-after."""
+        with self._lock:
+            self._open_until = max(self._open_until, time.monotonic() + seconds)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if (
+                self.failure_threshold is not None
+                and self._failures >= self.failure_threshold
+            ):
+                self._open_until = time.monotonic() + self.cooldown
+                self._failures = self.failure_threshold - 1
+                logger.warning(
+                    "Circuit open: pausing requests for %.0fs after repeated failures",
+                    self.cooldown,
+                )
+
+
+class RequestGuard:
+    """
+    Runs requests through a rate limiter and a circuit breaker, retrying
+    `RetryableError`s with jittered exponential backoff. A server-provided
+    retry delay pauses dispatch for every request sharing the guard, so
+    in-flight requests do not all hit the quota again at once.
+    """
+
+    def __init__(
+        self,
+        limiter: Optional[RateLimiter] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        self.limiter = limiter or RateLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def call(self, fn: Callable[[], Tuple[T, Optional[int]]], tokens: int) -> T:
+        """
+        Calls `fn`, which returns its result and the actual token usage (or
+        None if unknown).
+        """
+        attempt = 0
+        while True:
+            time.sleep(self.breaker.delay())
+            time.sleep(self.limiter.reserve(tokens))
+            try:
+                result, used = fn()
+            except RetryableError as e:
+                time.sleep(self._on_failure(e, attempt))
+                attempt += 1
+                continue
+            self._on_success(tokens, used)
+            return result
+
+    async def acall(
+        self, fn: Callable[[], Awaitable[Tuple[T, Optional[int]]]], tokens: int
+    ) -> T:
+        """Asynchronous variant of `call()`."""
+        attempt = 0
+        while True:
+            await asyncio.sleep(self.breaker.delay())
+            await asyncio.sleep(self.limiter.reserve(tokens))
+            try:
+                result, used = await fn()
+            except RetryableError as e:
+                await asyncio.sleep(self._on_failure(e, attempt))
+                attempt += 1
+                continue
+            self._on_success(tokens, used)
+            return result
+
+    def _on_success(self, tokens: int, used: Optional[int]):
+        self.breaker.record_success()
+        if used is not None:
+            self.limiter.adjust(tokens, used)
+
+    def _on_failure(self, error: RetryableError, attempt: int) -> float:
+        """Records a failure; returns the delay before the next attempt."""
+        self.breaker.record_failure()
+        if attempt >= self.max_retries:
+            raise RuntimeError(
+                f"Request failed after {attempt + 1} attempts: {error}"
+            ) from error
+        if error.retry_after is not None:
+            self.breaker.pause(error.retry_after)
+            delay = error.retry_after + random.uniform(0, self.base_delay)
+        else:
+            ceiling = min(self.max_delay, self.base_delay * 2**attempt)
+            delay = random.uniform(0, ceiling)
+        logger.warning(
+            "Retrying request in %.1fs (attempt %d/%d): %s",
+            delay,
+            attempt + 1,
+            self.max_retries,
+            error,
+        )
+        return delay
+
+
+def parse_retry_delay(value) -> Optional[float]:
+    """Parses a delay such as "17s", "1.5s" or "30" into seconds."""
+    if value is None:
+        return None
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*s?\s*", str(value))
+    return float(match.group(1)) if match else None
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+from ..api.llm_engine import LLMEngine, LLMOptions, LLMResponse
+
+logger = logging.getLogger(__name__)
+
+
+class CachedLLMEngine(LLMEngine):
+    """
+    Wraps another LLMEngine with a content-addressed on-disk response cache.
+
+    Entries are keyed on a hash of the prompt, model name, temperature and
+    thinking mode. Sampling is not deterministic, so identical requests are
+    additionally told apart by their occurrence index within the process:
+    the n-th request for a given prompt replays the n-th recorded response,
+    and only requests beyond what was recorded reach the wrapped engine.
+    Retries of an identical prompt therefore still get fresh responses.
+
+    Requests made inside `request(index)` are keyed on that index instead
+    of the prompt, so a caller that numbers its requests replays the n-th
+    recorded response for its n-th request even when the prompt differs,
+    e.g. because it was built from data filtered with other thresholds.
+    The prompt hash is stored with the response as a check, and responses
+    replayed for a different prompt are counted in `prompt_mismatches`.
+
+    The cache is bounded by total size on disk; the least recently used
+    entries are evicted first.
+    """
+
+    def __init__(self, engine: LLMEngine, cache_dir: Path, max_bytes: int):
+        self._engine = engine
+        self._cache_dir = Path(cache_dir)
+        self._max_bytes = max_bytes
+        self._options: Optional[LLMOptions] = None
+        self._lock = threading.Lock()
+        self._occurrences: Dict[str, int] = {}
+        # The request index set by `request()` for the calling thread.
+        self._local = threading.local()
+        # Maps entry path -> size in bytes, ordered from least to most recently used.
+        self._entries: "OrderedDict[Path, int]" = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.prompt_mismatches = 0
+
+    def load(self, options: LLMOptions) -> None:
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        self._scan_cache_dir()
+        self._engine.load(options)
+        self._options = options
+
+    def unload(self) -> None:
+        self._engine.unload()
+        self._options = None
+        logger.info(
+            "Response cache: %d hits, %d misses, %.1f MB on disk",
+            self.hits,
+            self.misses,
+            self._total_bytes / 1e6,
+        )
+        if self.prompt_mismatches:
+            logger.info(
+                "Response cache: %d replayed responses were recorded for a "
+                "different prompt",
+                self.prompt_mismatches,
+            )
+
+    @contextmanager
+    def request(self, index: int) -> Iterator[None]:
+        """
+        Keys the requests this thread makes inside the block on `index`
+        instead of on their prompt.
+        """
+        self._local.index = index
+        try:
+            yield
+        finally:
+            self._local.index = None
+
+    def generate(
+        self, prompt: str, options: Optional[LLMOptions] = None
+    ) -> LLMResponse:
+        if self._options is None:
+            raise RuntimeError("Engine is not loaded. Call load() first.")
+        path = self._entry_path(prompt, options or self._options)
+
+        cached = self._read_entry(path, prompt)
+        if cached is not None:
+            return cached
+
+        response = self._engine.generate(prompt, options)
+        self._write_entry(path, prompt, response)
+        return response
+
+    def generate_stream(
+        self, prompt: str, options: Optional[LLMOptions] = None
+    ) -> Iterator[LLMResponse]:
+        """
+        Replays a cached response as one chunk, or streams from the wrapped
+        engine and caches the response once the stream completes.
+        """
+        if self._options is None:
+            raise RuntimeError("Engine is not loaded. Call load() first.")
+        path = self._entry_path(prompt, options or self._options)
+
+        cached = self._read_entry(path, prompt)
+        if cached is not None:
+            yield cached
+            return
+
+        texts = []
+        finish_reason = None
+        for chunk in self._engine.generate_stream(prompt, options):
+            texts.append(chunk.text)
+            finish_reason = chunk.finish_reason or finish_reason
+            yield chunk
+        self._write_entry(path, prompt, LLMResponse("".join(texts), finish_reason))
+
+    def _entry_path(self, prompt: str, options: LLMOptions) -> Path:
+        key = {
+            "model_name": options.model_name,
+            "temperature": options.temperature,
+            "thinking_mode": options.thinking_mode,
+            "system_instruction": options.system_instruction,
+        }
+        index = getattr(self._local, "index", None)
+        if index is None:
+            key["prompt"] = prompt
+        else:
+            key["request"] = index
+        request_key = json.dumps(key, sort_keys=True, ensure_ascii=False)
+        request_hash = hashlib.sha256(request_key.encode("utf-8")).hexdigest()
+        with self._lock:
+            occurrence = self._occurrences.get(request_hash, 0)
+            self._occurrences[request_hash] = occurrence + 1
+        name = f"{request_hash}-{occurrence}.json"
+        return self._cache_dir / request_hash[:2] / name
+
+    def _read_entry(self, path: Path, prompt: str) -> Optional[LLMResponse]:
+        with self._lock:
+            if path not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+        try:
+            os.utime(path)
+            payload = json.loads(path.read_text(encoding="utf-8"))
+            response = LLMResponse(
+                text=payload["text"], finish_reason=payload.get("finish_reason")
+            )
+        except (OSError, ValueError, KeyError):
+            logger.warning("Discarding unreadable cache entry: %s", path)
+            self._forget(path)
+            return None
+        recorded_prompt = payload.get("prompt_sha256")
+        if recorded_prompt is not None and recorded_prompt != _prompt_hash(prompt):
+            with self._lock:
+                self.prompt_mismatches += 1
+        return response
+
+    def _write_entry(self, path: Path, prompt: str, response: LLMResponse):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".tmp{threading.get_ident()}")
+        tmp_path.write_text(
+            json.dumps(
+                {
+                    "text": response.text,
+                    "finish_reason": response.finish_reason,
+                    "prompt_sha256": _prompt_hash(prompt),
+                },
+                ensure_ascii=False,
+            ),
+            encoding="utf-8",
+        )
+        os.replace(tmp_path, path)
+        size = path.stat().st_size
+
+        with self._lock:
+            self._total_bytes += size - self._entries.pop(path, 0)
+            self._entries[path] = size
+            evicted = []
+            while self._total_bytes > self._max_bytes and len(self._entries) > 1:
+                old_path, old_size = self._entries.popitem(last=False)
+                self._total_bytes -= old_size
+                evicted.append(old_path)
+        for old_path in evicted:
+            old_path.unlink(missing_ok=True)
+
+    def _forget(self, path: Path):
+        with self._lock:
+            self._total_bytes -= self._entries.pop(path, 0)
+        path.unlink(missing_ok=True)
+
+    def _scan_cache_dir(self):
+        entries = []
+        for path in self._cache_dir.glob("*/*.json"):
+            stat = path.stat()
+            entries.append((stat.st_mtime, path, stat.st_size))
+        entries.sort()
+        with self._lock:
+            self._entries = OrderedDict((path, size) for _, path, size in entries)
+            self._total_bytes = sum(self._entries.values())
+
+
+def _prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
@@ -0,0 +1,115 @@
+import logging
+import tomllib
+from typing import Dict, List, Optional
+from constants import SECRETS_PATH
+from .api.llm_engine import LLMEngine
+from .api.resilience import CircuitBreaker, RateLimiter, RequestGuard
+from .router.router_engine import RouterBackend, RouterEngine
+
+logger = logging.getLogger(__name__)
+
+
+def create_engine(
+    engine_type: str,
+    model_name: str,
+    base_url: str,
+    max_connections: int = 1,
+    rpm: Optional[float] = None,
+    tpm: Optional[float] = None,
+) -> LLMEngine:
+    """
+    Builds the engine selected by `--engine`: a self-hosted OpenAI-compatible
+    server, or Gemini with the keys of the secrets file.
+    """
+    if engine_type == "openai":
+        return create_openai_engine(base_url, max_connections)
+    return create_gemini_engine(model_name, rpm, tpm)
+
+
+def load_secrets(required: bool = True) -> Dict:
+    if not SECRETS_PATH.exists():
+        if not required:
+            return {}
+        raise FileNotFoundError(f"Secrets file not found at: {SECRETS_PATH}")
+
+    with open(SECRETS_PATH, "rb") as f:
+        return tomllib.load(f)
+
+
+def create_openai_engine(base_url: str, max_connections: int = 1) -> LLMEngine:
+    """
+    Builds an engine for a self-hosted OpenAI-compatible server. The API
+    key, if the server needs one, is read from `[ai_services.openai]`.
+    """
+    from .openai_compat.openai_engine import OpenAICompatibleEngine
+
+    secrets = load_secrets(required=False)
+    openai_secrets = secrets.get("ai_services", {}).get("openai", {})
+    return OpenAICompatibleEngine(
+        base_url,
+        api_key=openai_secrets.get("api_key"),
+        max_connections=max_connections,
+    )
+
+
+def create_gemini_engine(
+    model_name: str, rpm: Optional[float] = None, tpm: Optional[float] = None
+) -> LLMEngine:
+    """
+    Builds a Gemini engine, or a router when the secrets file configures
+    several backends.
+    """
+    # The Gemini SDK is slow to import, so it is only loaded when used.
+    from .gemini.google_gen_ai_engine import GoogleGenAIEngine
+
+    secrets = load_secrets()
+    gemini_secrets = secrets.get("ai_services", {}).get("gemini", {})
+    if "backends" in gemini_secrets:
+        return create_router(gemini_secrets["backends"], model_name, rpm, tpm)
+    api_key = gemini_secrets.get("api_key")
+    if not api_key:
+        raise ValueError("API key not found in secrets file.")
+    return GoogleGenAIEngine(api_key=api_key, rpm=rpm, tpm=tpm)
+
+
+def create_router(
+    backend_secrets: List[Dict],
+    model_name: str,
+    rpm: Optional[float] = None,
+    tpm: Optional[float] = None,
+) -> RouterEngine:
+    """
+    Builds a router over the `[[ai_services.gemini.backends]]` entries.
+    Each entry has an `api_key` and optionally a `model`, `name`, `rpm`,
+    `tpm` and `weight`; the quota defaults to `--rpm`/`--tpm` and the
+    weight to the rpm quota.
+
+    Each backend only paces requests to its own quota. It does not retry or
+    open a circuit, so the router sees every failure at once and handles it:
+    retrying on another key, backing off, or ejecting the backend.
+    """
+    from .gemini.google_gen_ai_engine import GoogleGenAIEngine
+
+    backends = []
+    for i, entry in enumerate(backend_secrets):
+        api_key = entry.get("api_key")
+        if not api_key:
+            raise ValueError(f"API key not found for Gemini backend {i}.")
+        backend_model = entry.get("model", model_name)
+        backend_rpm = entry.get("rpm", rpm)
+        guard = RequestGuard(
+            RateLimiter(backend_rpm, entry.get("tpm", tpm)),
+            CircuitBreaker(failure_threshold=None),
+            max_retries=0,
+        )
+        engine = GoogleGenAIEngine(api_key=api_key, guard=guard)
+        backends.append(
+            RouterBackend(
+                name=entry.get("name", f"{backend_model}#{i}"),
+                engine=engine,
+                model_name=backend_model,
+                weight=entry.get("weight", backend_rpm or 1.0),
+            )
+        )
+    logger.info("Routing requests over %d Gemini backends", len(backends))
+    return RouterEngine(backends)
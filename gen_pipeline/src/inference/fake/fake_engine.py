@@ -0,0 +1,218 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+from ..api.llm_engine import LLMEngine, LLMOptions, LLMResponse
+from ..api.resilience import estimate_tokens
+from constants import DATA_TYPE_TO_FUNCTION_SUFFIX
+
+_OPENERS = [
+    "",
+    "Please",
+    "Hey car,",
+    "Could you",
+    "Can you",
+    "I need you to",
+    "Quickly",
+    "Would you mind if you",
+    "Go ahead and",
+    "Real quick,",
+]
+_SET_VERBS = ["set", "change", "adjust", "switch", "put", "make", "update", "turn"]
+_GET_VERBS = ["tell me", "check", "what is", "show me", "read out", "report", "look up"]
+_CONTEXT_WORDS = [
+    "morning", "commute", "tired", "kids", "rain", "highway", "parking", "winter",
+    "summer", "meeting", "late", "airport", "traffic", "dog", "groceries", "sunset",
+    "tunnel", "mountain", "storm", "gym", "weekend", "office", "school", "dinner",
+    "coffee", "noisy", "foggy", "sunny", "freezing", "humid", "bumpy", "quiet",
+    "passenger", "grandma", "trip", "detour", "garage", "charger", "station", "bridge",
+]
+_JOINERS = [" and ", ", then ", ". Also ", " plus ", "; after that ", " while you're at it "]
+# Response size that `latency` and `malformed_rate` refer to.
+_REFERENCE_PAIRS = 30
+# Size of the text chunks a streamed response is split into.
+_STREAM_CHUNK_CHARS = 256
+
+
+class FakeLLMEngine(LLMEngine):
+    """
+    Deterministic stand-in engine that synthesizes QueryItem-shaped JSON from
+    the vehicle metadata, so the pipeline can run offline.
+
+    Each response is derived from the prompt hash and the number of times that
+    prompt has been seen, so a seeded run is reproducible regardless of the
+    order in which concurrent requests complete. Duplicates are repeats of
+    earlier items in the same response, and malformed responses are cut off
+    at a random point.
+
+    `latency` and `malformed_rate` are given for a 30-pair response. Half of
+    the latency is a fixed per-request cost and half scales with the number
+    of pairs, and the chance of a cut-off grows with the response length.
+    Token usage is estimated from the text lengths.
+    """
+
+    def __init__(
+        self,
+        functions_file: Path,
+        properties_file: Path,
+        seed: int = 0,
+        latency: float = 0.0,
+        malformed_rate: float = 0.0,
+        duplicate_rate: float = 0.0,
+    ):
+        self._functions_file = functions_file
+        self._properties_file = properties_file
+        self._seed = seed
+        self._latency = latency
+        self._malformed_rate = malformed_rate
+        self._duplicate_rate = duplicate_rate
+        self._properties: List[Dict[str, Any]] = []
+        self._function_names: set = set()
+        self._lock = threading.Lock()
+        self._occurrences: Dict[str, int] = {}
+        self._system_instruction: Optional[str] = None
+        self._loaded = False
+
+    def load(self, options: LLMOptions) -> None:
+        functions = json.loads(Path(self._functions_file).read_text(encoding="utf-8"))
+        self._function_names = {function["name"] for function in functions}
+        self._properties = json.loads(
+            Path(self._properties_file).read_text(encoding="utf-8")
+        )
+        self._system_instruction = options.system_instruction
+        self._loaded = True
+
+    def unload(self) -> None:
+        self._properties = []
+        self._function_names = set()
+        self._occurrences = {}
+        self._loaded = False
+
+    def generate(
+        self, prompt: str, options: Optional[LLMOptions] = None
+    ) -> LLMResponse:
+        if not self._loaded:
+            raise RuntimeError("Engine is not loaded. Call load() first.")
+        rng = self._request_rng(prompt)
+        match = re.search(r"generate (\d+) diverse", prompt)
+        pair_number = int(match.group(1)) if match else 10
+        scale = pair_number / _REFERENCE_PAIRS
+
+        if self._latency > 0:
+            time.sleep(self._latency * (0.5 + 0.5 * scale) * rng.uniform(0.5, 1.5))
+
+        items = []
+        for _ in range(pair_number):
+            if items and rng.random() < self._duplicate_rate:
+                items.append(rng.choice(items))
+            else:
+                items.append(self._synthesize_item(rng))
+
+        text = "```json\n" + json.dumps(items, indent=2, ensure_ascii=False) + "\n```"
+        finish_reason = "STOP"
+        if rng.random() < 1 - (1 - self._malformed_rate) ** scale:
+            # Emulate a response cut off mid-stream.
+            text = text[: rng.randint(1, len(text) - 1)]
+            finish_reason = "MAX_TOKENS"
+        return LLMResponse(
+            text=text,
+            finish_reason=finish_reason,
+            input_tokens=estimate_tokens(prompt, self._system_instruction),
+            output_tokens=estimate_tokens(text),
+            cached_input_tokens=0,
+        )
+
+    def generate_stream(
+        self, prompt: str, options: Optional[LLMOptions] = None
+    ) -> Iterator[LLMResponse]:
+        response = self.generate(prompt, options)
+        text = response.text
+        for start in range(0, len(text), _STREAM_CHUNK_CHARS):
+            yield LLMResponse(text=text[start : start + _STREAM_CHUNK_CHARS])
+        yield LLMResponse(
+            text="",
+            finish_reason=response.finish_reason,
+            input_tokens=response.input_tokens,
+            output_tokens=response.output_tokens,
+            cached_input_tokens=response.cached_input_tokens,
+        )
+
+    def _request_rng(self, prompt: str) -> random.Random:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            occurrence = self._occurrences.get(prompt_hash, 0)
+            self._occurrences[prompt_hash] = occurrence + 1
+        return random.Random(f"{self._seed}:{prompt_hash}:{occurrence}")
+
+    def _synthesize_item(self, rng: random.Random) -> Dict[str, Any]:
+        clauses = []
+        answers = []
+        for _ in range(rng.choice([1, 1, 1, 2, 2, 3])):
+            clause, answer = self._synthesize_call(rng)
+            clauses.append(clause)
+            answers.append(answer)
+
+        query = clauses[0]
+        for clause in clauses[1:]:
+            query += rng.choice(_JOINERS) + clause
+        opener = rng.choice(_OPENERS)
+        context = " ".join(rng.sample(_CONTEXT_WORDS, rng.randint(2, 5)))
+        query = f"{opener} {query}".strip()
+        query = f"{query}, it's {context}." if rng.random() < 0.5 else f"{context}: {query}?"
+        return {"query": query, "answers": answers}
+
+    def _synthesize_call(self, rng: random.Random):
+        prop = rng.choice(self._properties)
+        profile = rng.choice(prop["areaIdProfiles"])
+        suffix = DATA_TYPE_TO_FUNCTION_SUFFIX[prop["dataType"]]
+        subject = prop["propertyName"].lower().replace("_", " ")
+        area = self._describe_area(profile)
+
+        writable = prop["access"] != "ReadOnly"
+        if writable and rng.random() < 0.7:
+            value = self._sample_value(rng, prop["dataType"], profile)
+            clause = f"{rng.choice(_SET_VERBS)} the {subject} {area} to {value}"
+            name = f"set{suffix}Property"
+            arguments = {
+                "propertyName": prop["propertyName"],
+                "areaId": profile["areaId"],
+                "value": value,
+            }
+        else:
+            clause = f"{rng.choice(_GET_VERBS)} the {subject} {area}"
+            name = f"get{suffix}Property"
+            arguments = {
+                "propertyName": prop["propertyName"],
+                "areaId": profile["areaId"],
+            }
+        if name not in self._function_names:
+            raise ValueError(f"No function named '{name}' in {self._functions_file}")
+        return clause, {"name": name, "arguments": arguments}
+
+    @staticmethod
+    def _describe_area(profile: Dict[str, Any]) -> str:
+        match = re.search(r"for (.+?)\.?$", profile.get("areaIdDescription", ""))
+        return f"for the {match.group(1)}" if match else "for the whole car"
+
+    @staticmethod
+    def _sample_value(rng: random.Random, data_type: str, profile: Dict[str, Any]):
+        enum_values = profile.get("supportedEnumValues") or []
+        if enum_values:
+            return rng.choice(enum_values)
+        low = float(profile["minValue"]) if profile.get("minValue") != "" else 0.0
+        high = float(profile["maxValue"]) if profile.get("maxValue") != "" else 100.0
+        if data_type == "Boolean":
+            return rng.choice([True, False])
+        if data_type in ("Integer", "Long"):
+            return rng.randint(int(low), int(high))
+        if data_type == "Float":
+            return round(rng.uniform(low, high), 1)
+        if data_type in ("IntArray", "LongArray"):
+            return [rng.randint(int(low), int(high)) for _ in range(rng.randint(1, 3))]
+        if data_type == "FloatArray":
+            return [round(rng.uniform(low, high), 1) for _ in range(rng.randint(1, 3))]
+        return rng.choice(_CONTEXT_WORDS).title()
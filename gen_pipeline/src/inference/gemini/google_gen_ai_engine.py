@@ -1,19 +1,57 @@
-from typing import Optional
+import asyncio
+import logging
+import threading
+import time
+from typing import Iterator, List, Optional, Sequence
+import httpx
 from google import genai
-from google.genai import types
+from google.genai import errors, types
 from ..api.llm_engine import LLMEngine, LLMOptions, LLMResponse
+from ..api.resilience import (
+    RateLimiter,
+    RequestGuard,
+    RetryableError,
+    estimate_tokens,
+    parse_retry_delay,
+)
+
+logger = logging.getLogger(__name__)
+
+# HTTP status codes worth retrying: timeouts, rate limits and server errors.
+_RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
 
 
 class GoogleGenAIEngine(LLMEngine):
     """
     Implementation of LLMEngine using the Google GenAI SDK (Gemini).
+
+    Every request goes through a `RequestGuard`, which paces requests to the
+    rpm/tpm quota and retries rate limits and transient errors. Pass a shared
+    guard to make several engines draw on the same quota.
     """
 
-    def __init__(self, api_key):
+    def __init__(
+        self,
+        api_key,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        guard: Optional[RequestGuard] = None,
+    ):
         self._api_key = api_key
+        self._guard = guard or RequestGuard(RateLimiter(rpm, tpm))
         self._client: Optional[genai.Client] = None
         self._generation_config: Optional[types.GenerateContentConfig] = None
         self._model_name: Optional[str] = None
+        self._system_instruction: Optional[str] = None
+        # Handle of the explicit context cache holding the system instruction.
+        self._cached_content: Optional[str] = None
+        self._cache_ttl: Optional[int] = None
+        self._cache_refreshed_at = 0.0
+        self._cache_lock = threading.Lock()
+        # The async client binds its connection pool to the event loop it first
+        # runs on, so all async work is funneled through one long-lived loop.
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
 
     def load(self, options: LLMOptions) -> None:
         if not self._api_key:
@@ -21,43 +59,302 @@ class GoogleGenAIEngine(LLMEngine):
 
         self._client = genai.Client(api_key=self._api_key)
         self._model_name = options.model_name
-
-        thinking_config = None
-        if not options.thinking_mode:
-            thinking_config = types.ThinkingConfig(thinking_budget=0)
-        else:
-            thinking_config = types.ThinkingConfig(
-                thinking_budget=-1, include_thoughts=False
-            )
-
-        self._generation_config = types.GenerateContentConfig(
-            temperature=options.temperature,
-            thinking_config=thinking_config,
+        self._system_instruction = options.system_instruction
+        if options.system_instruction and options.context_cache_ttl:
+            self._create_context_cache(options)
+        self._generation_config = self._build_generation_config(
+            options, self._cached_content
         )
 
     def unload(self) -> None:
         """
-        Resets the client and configuration.
+        Resets the client and configuration, deleting the context cache.
         """
+        self._delete_context_cache()
+        if self._loop is not None:
+            if self._client is not None:
+                asyncio.run_coroutine_threadsafe(
+                    self._client.aio.aclose(), self._loop
+                ).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join()
+            self._loop.close()
+            self._loop = None
+            self._loop_thread = None
+        if self._client is not None:
+            self._client.close()
         self._client = None
         self._generation_config = None
         self._model_name = None
+        self._system_instruction = None
 
-    def generate(self, prompt: str) -> LLMResponse:
+    def generate(
+        self, prompt: str, options: Optional[LLMOptions] = None
+    ) -> LLMResponse:
         """
         Generates content using the loaded configuration.
         """
+        model_name, config = self._resolve_request(options)
+
+        def request():
+            try:
+                # We use generate_content for a stateless request
+                response = self._client.models.generate_content(
+                    model=model_name, contents=prompt, config=config
+                )
+            except Exception as e:
+                raise self._classify_error(e) from e
+            llm_response = self._to_llm_response(response)
+            return llm_response, llm_response.input_tokens
+
+        return self._guard.call(request, self._estimate_tokens(prompt, config))
+
+    def generate_stream(
+        self, prompt: str, options: Optional[LLMOptions] = None
+    ) -> Iterator[LLMResponse]:
+        """
+        Streams the response as the model produces it. Opening the stream is
+        retried; a failure after the first chunk is not.
+        """
+        model_name, config = self._resolve_request(options)
+        tokens = self._estimate_tokens(prompt, config)
+
+        def open_stream():
+            try:
+                stream = iter(
+                    self._client.models.generate_content_stream(
+                        model=model_name, contents=prompt, config=config
+                    )
+                )
+                first = next(stream, None)
+            except Exception as e:
+                raise self._classify_error(e) from e
+            return (stream, first), None
+
+        stream, chunk = self._guard.call(open_stream, tokens)
+        input_tokens = None
+        try:
+            while chunk is not None:
+                llm_response = self._to_llm_response(chunk)
+                input_tokens = llm_response.input_tokens or input_tokens
+                yield llm_response
+                chunk = next(stream, None)
+        except Exception as e:
+            raise RuntimeError(f"Google GenAI generation failed: {e}") from e
+        if input_tokens is not None:
+            self._guard.limiter.adjust(tokens, input_tokens)
+
+    async def agenerate(
+        self, prompt: str, options: Optional[LLMOptions] = None
+    ) -> LLMResponse:
+        """
+        Generates content through the SDK's async client. A call made from
+        another event loop is forwarded to the engine's loop.
+        """
+        loop = self._get_loop()
+        if asyncio.get_running_loop() is not loop:
+            return await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(self.agenerate(prompt, options), loop)
+            )
+        model_name, config = self._resolve_request(options)
+
+        async def request():
+            try:
+                response = await self._client.aio.models.generate_content(
+                    model=model_name, contents=prompt, config=config
+                )
+            except Exception as e:
+                raise self._classify_error(e) from e
+            llm_response = self._to_llm_response(response)
+            return llm_response, llm_response.input_tokens
+
+        return await self._guard.acall(
+            request, self._estimate_tokens(prompt, config)
+        )
+
+    def generate_many(
+        self,
+        prompts: Sequence[str],
+        options: Optional[LLMOptions] = None,
+        max_concurrency: Optional[int] = None,
+    ) -> List[LLMResponse]:
+        """
+        Fans the prompts out over the async client on the engine's event loop,
+        so consecutive calls share one connection pool.
+        """
+        self._resolve_request(options)
+        future = asyncio.run_coroutine_threadsafe(
+            self._agenerate_many(prompts, options, max_concurrency),
+            self._get_loop(),
+        )
+        return future.result()
+
+    def _resolve_request(self, options: Optional[LLMOptions]):
         if self._client is None or self._generation_config is None:
             raise RuntimeError("Engine is not loaded. Call load() first.")
+        if options is None:
+            self._refresh_context_cache()
+            return self._model_name, self._generation_config
+        cached_content = None
+        if (
+            options.model_name == self._model_name
+            and options.system_instruction == self._system_instruction
+        ):
+            cached_content = self._cached_content
+            self._refresh_context_cache()
+        return options.model_name, self._build_generation_config(
+            options, cached_content
+        )
 
+    def _create_context_cache(self, options: LLMOptions):
+        """
+        Uploads the system instruction once so that requests reference it by
+        name instead of resending it. Falls back to sending it inline when the
+        cache cannot be created (e.g. the model does not support caching or
+        the instruction is below the minimum cacheable size).
+        """
         try:
-            # We use generate_content for a stateless request
-            response = self._client.models.generate_content(
-                model=self._model_name, contents=prompt, config=self._generation_config
+            cache = self._client.caches.create(
+                model=options.model_name,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=options.system_instruction,
+                    ttl=f"{options.context_cache_ttl}s",
+                ),
             )
+        except Exception as e:
+            logger.warning(
+                "Context cache creation failed, sending instructions inline: %s", e
+            )
+            return
+        self._cached_content = cache.name
+        self._cache_ttl = options.context_cache_ttl
+        self._cache_refreshed_at = time.monotonic()
+        logger.info("Created context cache %s", cache.name)
 
-            response_text = response.text if response.text else ""
-            return LLMResponse(text=response_text)
+    def _refresh_context_cache(self):
+        """Extends the cache lifetime once half of its TTL has elapsed."""
+        if self._cached_content is None:
+            return
+        with self._cache_lock:
+            now = time.monotonic()
+            if now - self._cache_refreshed_at < self._cache_ttl / 2:
+                return
+            try:
+                self._client.caches.update(
+                    name=self._cached_content,
+                    config=types.UpdateCachedContentConfig(
+                        ttl=f"{self._cache_ttl}s"
+                    ),
+                )
+                self._cache_refreshed_at = now
+            except Exception as e:
+                logger.warning("Failed to extend context cache TTL: %s", e)
 
+    def _delete_context_cache(self):
+        if self._cached_content is None:
+            return
+        try:
+            self._client.caches.delete(name=self._cached_content)
         except Exception as e:
-            raise RuntimeError(f"Google GenAI generation failed: {e}") from e
+            logger.warning(
+                "Failed to delete context cache %s: %s", self._cached_content, e
+            )
+        self._cached_content = None
+        self._cache_ttl = None
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._loop_thread = threading.Thread(
+                target=self._loop.run_forever, name="genai-async", daemon=True
+            )
+            self._loop_thread.start()
+        return self._loop
+
+    def _estimate_tokens(
+        self, prompt: str, config: types.GenerateContentConfig
+    ) -> int:
+        """Estimates the input tokens of a request, including its instruction."""
+        system_instruction = config.system_instruction
+        if config.cached_content is not None:
+            system_instruction = self._system_instruction
+        return estimate_tokens(prompt, system_instruction)
+
+    @staticmethod
+    def _classify_error(error: Exception) -> Exception:
+        """
+        Maps an SDK error to a RetryableError for rate limits and transient
+        failures, or to a RuntimeError otherwise.
+        """
+        message = f"Google GenAI generation failed: {error}"
+        if isinstance(error, errors.APIError):
+            if error.code in _RETRYABLE_STATUS_CODES:
+                return RetryableError(message, _retry_after(error))
+        elif isinstance(error, (httpx.TransportError, TimeoutError)):
+            return RetryableError(message)
+        return RuntimeError(message)
+
+    @staticmethod
+    def _to_llm_response(response: types.GenerateContentResponse) -> LLMResponse:
+        response_text = response.text if response.text else ""
+        finish_reason = None
+        if response.candidates and response.candidates[0].finish_reason:
+            reason = response.candidates[0].finish_reason
+            finish_reason = getattr(reason, "name", str(reason))
+        input_tokens = output_tokens = cached_input_tokens = None
+        usage = response.usage_metadata
+        if usage is not None and usage.prompt_token_count is not None:
+            input_tokens = usage.prompt_token_count
+            output_tokens = (usage.candidates_token_count or 0) + (
+                usage.thoughts_token_count or 0
+            )
+            cached_input_tokens = usage.cached_content_token_count or 0
+        return LLMResponse(
+            text=response_text,
+            finish_reason=finish_reason,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            cached_input_tokens=cached_input_tokens,
+        )
+
+    @staticmethod
+    def _build_generation_config(
+        options: LLMOptions, cached_content: Optional[str] = None
+    ) -> types.GenerateContentConfig:
+        thinking_config = None
+        if not options.thinking_mode:
+            thinking_config = types.ThinkingConfig(thinking_budget=0)
+        else:
+            thinking_config = types.ThinkingConfig(
+                thinking_budget=-1, include_thoughts=False
+            )
+
+        # A cached content already carries the system instruction.
+        if cached_content is not None:
+            return types.GenerateContentConfig(
+                temperature=options.temperature,
+                thinking_config=thinking_config,
+                cached_content=cached_content,
+            )
+        return types.GenerateContentConfig(
+            temperature=options.temperature,
+            thinking_config=thinking_config,
+            system_instruction=options.system_instruction,
+        )
+
+
+def _retry_after(error: errors.APIError) -> Optional[float]:
+    """
+    Reads the server-requested retry delay from the Retry-After header or from
+    the RetryInfo detail of the error body.
+    """
+    headers = getattr(error.response, "headers", None)
+    if headers is not None:
+        delay = parse_retry_delay(headers.get("retry-after"))
+        if delay is not None:
+            return delay
+    body = error.details if isinstance(error.details, dict) else {}
+    for detail in body.get("error", body).get("details", []):
+        if isinstance(detail, dict) and "retryDelay" in detail:
+            return parse_retry_delay(detail["retryDelay"])
+    return None
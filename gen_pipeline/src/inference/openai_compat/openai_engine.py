@@ -0,0 +1,211 @@
+import json
+import logging
+from typing import Any, Dict, Iterator, Optional
+import httpx
+from ..api.llm_engine import LLMEngine, LLMOptions, LLMResponse
+from ..api.resilience import (
+    RateLimiter,
+    RequestGuard,
+    RetryableError,
+    estimate_tokens,
+    parse_retry_delay,
+)
+
+logger = logging.getLogger(__name__)
+
+# HTTP status codes worth retrying: timeouts, rate limits and server errors.
+_RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# Maps OpenAI finish reasons to the names used by the other engines.
+_FINISH_REASONS = {"stop": "STOP", "length": "MAX_TOKENS"}
+
+
+class OpenAICompatibleEngine(LLMEngine):
+    """
+    Implementation of LLMEngine for servers exposing the OpenAI chat
+    completions API, such as vLLM or llama-server.
+
+    Requests share one HTTP client whose pool keeps up to `max_connections`
+    keep-alive connections, so concurrent requests reuse connections instead
+    of reconnecting. The system instruction is sent as an identical leading
+    system message, which lets servers with prefix caching reuse it, and
+    servers with continuous batching serve the concurrent requests together.
+    Requests go through a `RequestGuard` like the Gemini engine; a
+    self-hosted server usually needs no rpm/tpm limits, but overload
+    responses are still retried.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: Optional[str] = None,
+        max_connections: int = 16,
+        timeout: float = 600.0,
+        guard: Optional[RequestGuard] = None,
+        transport: Optional[httpx.BaseTransport] = None,
+    ):
+        if max_connections < 1:
+            raise ValueError("Max connections must be at least 1.")
+        self._base_url = base_url.rstrip("/")
+        self._api_key = api_key
+        self._max_connections = max_connections
+        self._timeout = timeout
+        self._guard = guard or RequestGuard(RateLimiter())
+        # Replaces the network transport, e.g. with an httpx.MockTransport.
+        self._transport = transport
+        self._client: Optional[httpx.Client] = None
+        self._options: Optional[LLMOptions] = None
+
+    def load(self, options: LLMOptions) -> None:
+        headers = {}
+        if self._api_key:
+            headers["Authorization"] = f"Bearer {self._api_key}"
+        self._client = httpx.Client(
+            base_url=self._base_url,
+            headers=headers,
+            timeout=httpx.Timeout(self._timeout, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=self._max_connections,
+                max_keepalive_connections=self._max_connections,
+            ),
+            transport=self._transport,
+        )
+        self._options = options
+
+    def unload(self) -> None:
+        if self._client is not None:
+            self._client.close()
+        self._client = None
+        self._options = None
+
+    def generate(
+        self, prompt: str, options: Optional[LLMOptions] = None
+    ) -> LLMResponse:
+        body = self._request_body(prompt, options, stream=False)
+
+        def request():
+            try:
+                response = self._client.post("/chat/completions", json=body)
+                response.raise_for_status()
+                payload = response.json()
+            except Exception as e:
+                raise self._classify_error(e) from e
+            choice = payload["choices"][0]
+            llm_response = self._to_llm_response(
+                choice["message"].get("content") or "",
+                choice.get("finish_reason"),
+                payload.get("usage"),
+            )
+            return llm_response, llm_response.input_tokens
+
+        return self._guard.call(request, self._estimate_tokens(body))
+
+    def generate_stream(
+        self, prompt: str, options: Optional[LLMOptions] = None
+    ) -> Iterator[LLMResponse]:
+        """
+        Streams the response from server-sent events. Opening the stream is
+        retried; a failure after it has started is not.
+        """
+        body = self._request_body(prompt, options, stream=True)
+        tokens = self._estimate_tokens(body)
+
+        def open_stream():
+            response = None
+            try:
+                response = self._client.send(
+                    self._client.build_request("POST", "/chat/completions", json=body),
+                    stream=True,
+                )
+                if response.is_error:
+                    response.read()
+                    response.raise_for_status()
+            except Exception as e:
+                if response is not None:
+                    response.close()
+                raise self._classify_error(e) from e
+            return response, None
+
+        response = self._guard.call(open_stream, tokens)
+        finish_reason = usage = None
+        try:
+            for line in response.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:") :].strip()
+                if data == "[DONE]":
+                    # Read on to the end of the body so that the connection
+                    # goes back to the pool.
+                    continue
+                event = json.loads(data)
+                usage = event.get("usage") or usage
+                for choice in event.get("choices") or []:
+                    finish_reason = choice.get("finish_reason") or finish_reason
+                    text = (choice.get("delta") or {}).get("content")
+                    if text:
+                        yield LLMResponse(text=text)
+        except (httpx.HTTPError, ValueError) as e:
+            raise RuntimeError(f"OpenAI-compatible generation failed: {e}") from e
+        finally:
+            response.close()
+        final = self._to_llm_response("", finish_reason, usage)
+        if final.input_tokens is not None:
+            self._guard.limiter.adjust(tokens, final.input_tokens)
+        yield final
+
+    def _request_body(
+        self, prompt: str, options: Optional[LLMOptions], stream: bool
+    ) -> Dict[str, Any]:
+        if self._client is None:
+            raise RuntimeError("Engine is not loaded. Call load() first.")
+        options = options or self._options
+        messages = []
+        if options.system_instruction:
+            messages.append({"role": "system", "content": options.system_instruction})
+        messages.append({"role": "user", "content": prompt})
+        body = {
+            "model": options.model_name,
+            "messages": messages,
+            "temperature": options.temperature,
+            "stream": stream,
+        }
+        if stream:
+            body["stream_options"] = {"include_usage": True}
+        return body
+
+    @staticmethod
+    def _estimate_tokens(body: Dict[str, Any]) -> int:
+        return estimate_tokens(*(message["content"] for message in body["messages"]))
+
+    @staticmethod
+    def _classify_error(error: Exception) -> Exception:
+        """
+        Maps an HTTP error to a RetryableError for overload and transient
+        failures, or to a RuntimeError otherwise.
+        """
+        message = f"OpenAI-compatible generation failed: {error}"
+        if isinstance(error, httpx.HTTPStatusError):
+            if error.response.status_code in _RETRYABLE_STATUS_CODES:
+                return RetryableError(
+                    message, parse_retry_delay(error.response.headers.get("retry-after"))
+                )
+        elif isinstance(error, httpx.TransportError):
+            return RetryableError(message)
+        return RuntimeError(message)
+
+    @staticmethod
+    def _to_llm_response(
+        text: str, finish_reason: Optional[str], usage: Optional[Dict[str, Any]]
+    ) -> LLMResponse:
+        input_tokens = output_tokens = cached_input_tokens = None
+        if usage:
+            input_tokens = usage.get("prompt_tokens")
+            output_tokens = usage.get("completion_tokens")
+            details = usage.get("prompt_tokens_details") or {}
+            cached_input_tokens = details.get("cached_tokens") or 0
+        return LLMResponse(
+            text=text,
+            finish_reason=_FINISH_REASONS.get(finish_reason, finish_reason),
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            cached_input_tokens=cached_input_tokens,
+        )
@@ -0,0 +1,326 @@
+import asyncio
+import dataclasses
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Sequence
+from ..api.llm_engine import LLMEngine, LLMOptions, LLMResponse
+from ..api.resilience import RetryableError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RouterBackend:
+    """
+    One engine behind a RouterEngine. `model_name` overrides the model of the
+    router's options, and `weight` is the backend's share of the quota (e.g.
+    its requests per minute).
+    """
+
+    name: str
+    engine: LLMEngine
+    model_name: Optional[str] = None
+    weight: float = 1.0
+
+
+@dataclass(eq=False)
+class _BackendState:
+    backend: RouterBackend
+    options: Optional[LLMOptions] = None
+    in_flight: int = 0
+    requests: int = 0
+    failures: int = 0
+    output_tokens: int = 0
+    # Decayed request latency and failure rate; None until observed.
+    latency: Optional[float] = None
+    error_rate: float = 0.0
+    consecutive_failures: int = 0
+    ejections: int = 0
+    ejected_until: float = 0.0
+
+
+class RouterEngine(LLMEngine):
+    """
+    Spreads requests over several engines, e.g. Gemini clients with different
+    API keys or models.
+
+    Each request goes to a backend drawn with probability proportional to
+    its weight, divided by its decayed latency and in-flight requests and
+    discounted by its recent failure rate. A backend that fails
+    `eject_after` times in a row is ejected for `eject_seconds`, doubling on
+    each repeated ejection up to `max_eject_seconds`; when every backend is
+    ejected, the one due back first is used. A request that fails with a
+    `RetryableError`, or an error caused by one, is retried on another
+    backend, except for a stream that has already produced output. Once
+    every backend has failed a request, it is retried in up to `max_rounds`
+    further rounds after a jittered exponential backoff, or after the delay
+    a rate-limited backend asked for. Other errors, such as a rejected
+    request, are raised at once and do not count against the backend.
+    """
+
+    def __init__(
+        self,
+        backends: Sequence[RouterBackend],
+        eject_after: int = 3,
+        eject_seconds: float = 30.0,
+        max_eject_seconds: float = 600.0,
+        decay: float = 0.8,
+        max_rounds: int = 3,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        if not backends:
+            raise ValueError("RouterEngine needs at least one backend.")
+        names = [backend.name for backend in backends]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicate backend names: {names}")
+        self._states = [_BackendState(backend) for backend in backends]
+        self._eject_after = eject_after
+        self._eject_seconds = eject_seconds
+        self._max_eject_seconds = max_eject_seconds
+        self._decay = decay
+        self._max_rounds = max_rounds
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._lock = threading.Lock()
+        self._rng = random.Random()
+        self._loaded_at: Optional[float] = None
+
+    def load(self, options: LLMOptions) -> None:
+        for state in self._states:
+            state.options = self._backend_options(state, options)
+            state.backend.engine.load(state.options)
+        self._loaded_at = time.monotonic()
+
+    def unload(self) -> None:
+        for state in self._states:
+            state.backend.engine.unload()
+        if self._loaded_at is not None:
+            logger.info("Router backends:\n%s", self.summary())
+        self._loaded_at = None
+
+    def generate(
+        self, prompt: str, options: Optional[LLMOptions] = None
+    ) -> LLMResponse:
+        tried: List[_BackendState] = []
+        while True:
+            state = self._acquire(tried)
+            start = time.perf_counter()
+            try:
+                response = state.backend.engine.generate(
+                    prompt, self._backend_options(state, options)
+                )
+            except Exception as e:
+                if not _is_retryable(e):
+                    self._release(state, time.perf_counter() - start)
+                    raise
+                self._release(state, time.perf_counter() - start, error=e)
+                time.sleep(self._retry_delay(tried, e))
+                continue
+            self._release(state, time.perf_counter() - start, response=response)
+            return response
+
+    def generate_stream(
+        self, prompt: str, options: Optional[LLMOptions] = None
+    ) -> Iterator[LLMResponse]:
+        tried: List[_BackendState] = []
+        while True:
+            state = self._acquire(tried)
+            start = time.perf_counter()
+            started = False
+            usage = None
+            try:
+                for chunk in state.backend.engine.generate_stream(
+                    prompt, self._backend_options(state, options)
+                ):
+                    started = True
+                    if chunk.output_tokens is not None:
+                        usage = chunk
+                    yield chunk
+            except Exception as e:
+                if not _is_retryable(e):
+                    self._release(state, time.perf_counter() - start)
+                    raise
+                self._release(state, time.perf_counter() - start, error=e)
+                if started:
+                    # Output already handed out cannot be taken back.
+                    raise
+                time.sleep(self._retry_delay(tried, e))
+                continue
+            except GeneratorExit:
+                self._release(state, time.perf_counter() - start)
+                raise
+            self._release(state, time.perf_counter() - start, response=usage)
+            return
+
+    async def agenerate(
+        self, prompt: str, options: Optional[LLMOptions] = None
+    ) -> LLMResponse:
+        tried: List[_BackendState] = []
+        while True:
+            state = self._acquire(tried)
+            start = time.perf_counter()
+            try:
+                response = await state.backend.engine.agenerate(
+                    prompt, self._backend_options(state, options)
+                )
+            except Exception as e:
+                if not _is_retryable(e):
+                    self._release(state, time.perf_counter() - start)
+                    raise
+                self._release(state, time.perf_counter() - start, error=e)
+                await asyncio.sleep(self._retry_delay(tried, e))
+                continue
+            self._release(state, time.perf_counter() - start, response=response)
+            return response
+
+    def summary(self) -> str:
+        """Describes the throughput and health of every backend."""
+        now = time.monotonic()
+        minutes = max(now - (self._loaded_at or now), 1e-9) / 60.0
+        lines = []
+        with self._lock:
+            for state in self._states:
+                status = "ok"
+                if state.ejected_until > now:
+                    status = f"ejected for {state.ejected_until - now:.0f}s"
+                lines.append(
+                    f"{state.backend.name}: {state.requests} requests "
+                    f"({state.requests / minutes:.1f}/min), "
+                    f"{state.failures} failed, "
+                    f"latency {state.latency or 0.0:.2f}s, "
+                    f"{state.output_tokens / minutes:.0f} output tokens/min, "
+                    f"{status}"
+                )
+        return "\n".join(lines)
+
+    @staticmethod
+    def _backend_options(
+        state: _BackendState, options: Optional[LLMOptions]
+    ) -> Optional[LLMOptions]:
+        if options is None:
+            return state.options
+        if state.backend.model_name is None:
+            return options
+        return dataclasses.replace(options, model_name=state.backend.model_name)
+
+    def _acquire(self, tried: List[_BackendState]) -> _BackendState:
+        """
+        Picks a backend not yet tried in the current round, and counts the
+        request in flight.
+        """
+        now = time.monotonic()
+        current_round = tried[len(tried) - len(tried) % len(self._states) :]
+        with self._lock:
+            untried = [state for state in self._states if state not in current_round]
+            healthy = [state for state in untried if state.ejected_until <= now]
+            if healthy:
+                state = self._rng.choices(
+                    healthy, weights=[self._score(s) for s in healthy]
+                )[0]
+            else:
+                state = min(untried, key=lambda s: s.ejected_until)
+            state.in_flight += 1
+            tried.append(state)
+            return state
+
+    def _score(self, state: _BackendState) -> float:
+        observed = [s.latency for s in self._states if s.latency is not None]
+        # Unobserved backends are assumed to be as fast as the average one.
+        latency = state.latency or (sum(observed) / len(observed) if observed else 1.0)
+        return (
+            state.backend.weight
+            * max(1.0 - state.error_rate, 0.05)
+            / (max(latency, 1e-3) * (state.in_flight + 1))
+        )
+
+    def _release(
+        self,
+        state: _BackendState,
+        seconds: float,
+        response: Optional[LLMResponse] = None,
+        error: Optional[Exception] = None,
+    ):
+        with self._lock:
+            state.in_flight -= 1
+            state.requests += 1
+            state.error_rate *= self._decay
+            if error is not None:
+                state.failures += 1
+                state.error_rate += 1.0 - self._decay
+                state.consecutive_failures += 1
+                if state.consecutive_failures >= self._eject_after:
+                    self._eject(state, error)
+                return
+            state.consecutive_failures = 0
+            state.ejections = 0
+            if state.latency is None:
+                state.latency = seconds
+            else:
+                state.latency = self._decay * state.latency + (1 - self._decay) * seconds
+            if response is not None and response.output_tokens is not None:
+                state.output_tokens += response.output_tokens
+
+    def _eject(self, state: _BackendState, error: Exception):
+        seconds = min(
+            self._eject_seconds * 2**state.ejections, self._max_eject_seconds
+        )
+        state.ejections += 1
+        state.consecutive_failures = 0
+        state.ejected_until = time.monotonic() + seconds
+        logger.warning(
+            "Ejecting backend %s for %.0fs after repeated failures: %s",
+            state.backend.name,
+            seconds,
+            error,
+        )
+
+    def _retry_delay(self, tried: List[_BackendState], error: Exception) -> float:
+        """
+        Returns the delay before a failed request is retried, or re-raises
+        `error` when every round is used up.
+        """
+        if len(tried) % len(self._states):
+            logger.warning(
+                "Backend %s failed, retrying on another backend: %s",
+                tried[-1].backend.name,
+                error,
+            )
+            return 0.0
+        rounds = len(tried) // len(self._states)
+        if rounds > self._max_rounds:
+            raise error
+        retry_after = next(
+            (
+                e.retry_after
+                for e in (error, error.__cause__)
+                if isinstance(e, RetryableError) and e.retry_after is not None
+            ),
+            None,
+        )
+        if retry_after is not None:
+            delay = retry_after + self._rng.uniform(0, self._base_delay)
+        else:
+            ceiling = min(self._max_delay, self._base_delay * 2 ** (rounds - 1))
+            delay = self._rng.uniform(0, ceiling)
+        logger.warning(
+            "All backends failed, retrying in %.1fs (round %d/%d): %s",
+            delay,
+            rounds,
+            self._max_rounds,
+            error,
+        )
+        return delay
+
+
+def _is_retryable(error: Exception) -> bool:
+    """
+    Tells whether `error` is a RetryableError, or was raised by a guard
+    whose retries ran out on one.
+    """
+    return isinstance(error, RetryableError) or isinstance(
+        error.__cause__, RetryableError
+    )
@@ -0,0 +1,142 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Prefix of the exported Prometheus metric names.
+_PROMETHEUS_PREFIX = "cartool"
+_QUANTILES = (0.5, 0.95)
+
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank quantile of a sorted, non-empty list."""
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Metrics:
+    """
+    Thread-safe stage timers, counters and gauges for a pipeline run.
+
+    Every timed stage keeps all of its durations, so the summary reports
+    exact quantiles; stages are timed per request or batch, which keeps the
+    number of observations small. When `path` is given, `maybe_write()`
+    exports the metrics at most every `interval` seconds, as a Prometheus
+    textfile if the path ends in `.prom` and as JSON otherwise.
+    """
+
+    def __init__(self, path: Optional[Path] = None, interval: float = 30.0):
+        self.path = path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._durations: Dict[str, List[float]] = defaultdict(list)
+        self._counters: Dict[str, float] = defaultdict(int)
+        self._gauges: Dict[str, float] = {}
+        self._started = time.monotonic()
+        self._written = self._started
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            self._durations[stage].append(seconds)
+
+    def count(self, name: str, amount: float = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def set(self, name: str, value: float):
+        with self._lock:
+            self._gauges[name] = value
+
+    def counter(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            stages = {}
+            for stage, durations in self._durations.items():
+                ordered = sorted(durations)
+                stages[stage] = {
+                    "count": len(ordered),
+                    "sum": sum(ordered),
+                    **{f"p{int(q * 100)}": _quantile(ordered, q) for q in _QUANTILES},
+                }
+            return {
+                "elapsed_seconds": time.monotonic() - self._started,
+                "stages": stages,
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+            }
+
+    def maybe_write(self):
+        """Writes the metrics if `interval` seconds passed since the last write."""
+        if self.path is not None and time.monotonic() - self._written >= self.interval:
+            self.write()
+
+    def write(self):
+        """Atomically replaces the metrics file with the current values."""
+        if self.path is None:
+            return
+        snapshot = self.snapshot()
+        if self.path.suffix == ".prom":
+            content = self._format_prometheus(snapshot)
+        else:
+            content = json.dumps(snapshot, indent=2)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(content, encoding="utf-8")
+        os.replace(tmp_path, self.path)
+        self._written = time.monotonic()
+
+    def log_summary(self):
+        """Logs a table of the quantiles and totals of every stage."""
+        stages = self.snapshot()["stages"]
+        if not stages:
+            return
+        lines = [
+            f"{'stage':<24} {'count':>8} {'p50 ms':>10} {'p95 ms':>10} {'total s':>10}"
+        ]
+        for stage, values in sorted(stages.items()):
+            lines.append(
+                f"{stage:<24} {values['count']:>8} {values['p50'] * 1000:>10.1f} "
+                f"{values['p95'] * 1000:>10.1f} {values['sum']:>10.2f}"
+            )
+        logger.info("Stage timings:\n%s", "\n".join(lines))
+
+    @staticmethod
+    def _format_prometheus(snapshot: Dict) -> str:
+        lines = []
+        name = f"{_PROMETHEUS_PREFIX}_stage_seconds"
+        lines.append(f"# TYPE {name} summary")
+        for stage, values in sorted(snapshot["stages"].items()):
+            for q in _QUANTILES:
+                lines.append(
+                    f'{name}{{stage="{stage}",quantile="{q}"}} '
+                    f"{values[f'p{int(q * 100)}']:.6f}"
+                )
+            lines.append(f'{name}_sum{{stage="{stage}"}} {values["sum"]:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {values["count"]}')
+        for counter, value in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE {_PROMETHEUS_PREFIX}_{counter}_total counter")
+            lines.append(f"{_PROMETHEUS_PREFIX}_{counter}_total {value}")
+        gauges = dict(snapshot["gauges"], elapsed_seconds=snapshot["elapsed_seconds"])
+        for gauge, value in sorted(gauges.items()):
+            lines.append(f"# TYPE {_PROMETHEUS_PREFIX}_{gauge} gauge")
+            lines.append(f"{_PROMETHEUS_PREFIX}_{gauge} {value}")
+        return "\n".join(lines) + "\n"
@@ -1,4 +1,6 @@
-GENERATION_PROMPT = """
+# Static part of the generation prompt. It is rendered once per run and sent as
+# a byte-identical prefix (system instruction) so that it can be cached.
+GENERATION_PROMPT_PREFIX = """
 You are an expert Data Labeler specializing in automotive datasets. Your task is to generate a set of diverse user queries and corresponding answers in JSON format based on the provided function definitions.
 These functions act as interfaces to access and control vehicle properties. You must construct query-answer pairs that exemplify the practical usage of these functions in realistic scenarios.
 
@@ -19,11 +21,9 @@ These functions act as interfaces to access and control vehicle properties. You
 - The generated function calls must accurately and effectively resolve the user's request.
 - The corresponding result's parameter types and ranges match with the property descriptions.
 
-{section_examples_placeholder}
-
 ### Output JSON Format:
 
-Similar to the examples above, your output MUST strictly adhere to the following JSON format. Do not include any explanatory text outside the JSON block:
+Similar to the examples provided with the request, your output MUST strictly adhere to the following JSON format. Do not include any explanatory text outside the JSON block:
 
 ```json
 [
@@ -53,11 +53,34 @@ Here is the list of vehicle properties supported by the vehicle:
 
 The detailed functions description is as follows:
 {car_property_functions_placeholder}
+"""
+
+# Per-request part of the generation prompt, sent after the static prefix.
+GENERATION_PROMPT_SUFFIX = """{section_properties_placeholder}{section_examples_placeholder}{section_coverage_placeholder}
 
 Now, please generate {pair_number_placeholder} diverse query and answer pairs following the Output JSON Format specified above.
 
 """
 
+# Replaces the property list in the prefix when each request carries its own
+# subset of the catalogue.
+SUBSET_PROPERTIES_NOTE = """The vehicle properties relevant to each request are listed in the "Vehicle Properties" section of the request."""
+
+SUBSET_PROPERTIES_SECTION = """### Vehicle Properties:
+
+Here is the list of vehicle properties to use for this request. Only use the properties listed here:
+{vehicle_properties_placeholder}
+
+"""
+
+# Steers expansion requests toward parts of the catalogue the dataset rarely uses.
+COVERAGE_HINT_SECTION = """
+### Coverage:
+
+The dataset generated so far rarely uses the following function calls. Prefer queries that exercise them:
+{coverage_calls_placeholder}
+
+Also prefer queries that require {call_count_placeholder} function call(s)."""
 
 SEED_GENERATION_EXAMPLE_SECTION = """### Examples:
 
@@ -83,3 +106,10 @@ Here is a list of vehicle properties supported by my vehicle described in JSON f
 
 You are a model that can do function calling with the following functions.
 """
+
+# Follows the developer message of a refined entry when a model is evaluated
+# through a text-only engine, which cannot pass the tools separately.
+EVALUATION_TOOLS_SECTION = """{tools_placeholder}
+
+Respond to the user with the function calls that fulfil the request, as a JSON array of objects with "name" and "arguments" fields.
+"""
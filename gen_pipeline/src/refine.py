@@ -1,40 +1,81 @@
 import logging
 import json
 import random
-import copy
+import tempfile
+from array import array
+from itertools import chain, islice
+from multiprocessing import Pool
 from pathlib import Path
-from typing import List, Dict
-from data.data_format import load_existing_data
+from typing import BinaryIO, Iterator, Optional, TextIO, Tuple
+from data.data_format import iter_query_items
+from data.entry_template import EntryTemplate
+from data.leakage import LeakageIndex
+from data.seed_format import open_output, write_seeds_header, format_seed_record
 from constants import (
     VEHICLE_PROPERTY_SCHEMA_FILE,
     VEHICLE_PROPERTIES_FILE,
     CAR_PROPERTY_FUNCTIONS_FILE,
 )
 from prompt.prompt import DEVELOPER_MESSAGE_PROMPT
+from metrics import Metrics
 
 logger = logging.getLogger(__name__)
 
+# Entries handed to a worker process at a time.
+_CHUNK_SIZE = 64
+# Leaking eval items shown in the log.
+_LEAK_EXAMPLES = 5
+
+_worker_template: Optional[EntryTemplate] = None
+
+
+def _init_worker(template: EntryTemplate):
+    global _worker_template
+    _worker_template = template
+
+
+def _build_entry(task: Tuple[bytes, str, int]) -> str:
+    line, metadata_label, seed = task
+    return _worker_template.build(
+        json.loads(line), metadata_label, random.Random(seed)
+    )
+
 
 class PostProcess:
     """
     Handles the preparation of training and evaluation datasets.
     """
 
-    def __init__(self, data_file, num_test, output_file):
+    def __init__(
+        self,
+        data_file,
+        num_test,
+        output_file,
+        trusted=False,
+        workers=1,
+        output_format="jsonl",
+        compression="none",
+        metrics_out=None,
+        leakage="report",
+        filter_tokenizer=None,
+    ):
+        if workers < 1:
+            raise ValueError("Workers must be at least 1.")
         self.data_file = data_file
         self.num_test = num_test
         self.output_file = output_file
+        self.trusted = trusted
+        self.workers = workers
+        self.output_format = output_format
+        self.compression = compression
+        self.metrics = Metrics(metrics_out)
+        # How near-duplicates of eval items in train are handled: "report",
+        # "redraw" or "off".
+        self.leakage = leakage
+        self.filter_tokenizer = filter_tokenizer
 
     def refine(self):
         """Orchestrates the data loading, splitting, formatting, and saving."""
-        data_items = load_existing_data(self.data_file)
-        total_count = len(data_items)
-        if total_count < self.num_test:
-            raise ValueError(
-                f"Insufficient data items. Total found: {total_count}, "
-                f"but requested num_test: {self.num_test}."
-            )
-
         raw_tools_data = self._load_json_file(CAR_PROPERTY_FUNCTIONS_FILE)
         raw_vehicle_props = self._load_json_file(VEHICLE_PROPERTIES_FILE)
 
@@ -43,29 +84,143 @@ class PostProcess:
             VEHICLE_PROPERTY_SCHEMA_FILE.read_text(encoding="utf-8"),
         )
 
-        random.shuffle(data_items)
-        eval_items = data_items[: self.num_test]
-        train_items = data_items[self.num_test :]
+        # Items are streamed into a spool file and read back by offset, so
+        # only the offsets and the shuffled order are held in memory.
+        with tempfile.TemporaryFile() as spool:
+            offsets = array("q")
+            with self.metrics.timer("load"):
+                for item in iter_query_items(self.data_file, trusted=self.trusted):
+                    offsets.append(spool.tell())
+                    spool.write(item.model_dump_json().encode("utf-8") + b"\n")
+
+            total_count = len(offsets)
+            if total_count < self.num_test:
+                raise ValueError(
+                    f"Insufficient data items. Total found: {total_count}, "
+                    f"but requested num_test: {self.num_test}."
+                )
+
+            order = array("q", range(total_count))
+            random.shuffle(order)
+            eval_indices = order[: self.num_test]
+            train_indices = order[self.num_test :]
+            if self.leakage != "off":
+                with self.metrics.timer("leakage"):
+                    eval_indices, train_indices = self._check_leakage(
+                        spool, offsets, eval_indices, train_indices
+                    )
+            # Each entry shuffles with its own generator, seeded from its output
+            # position, so the result does not depend on how work is split.
+            base_seed = random.getrandbits(64)
+
+            def tasks() -> Iterator[Tuple[bytes, str, int]]:
+                labelled = chain(
+                    (("train", index) for index in train_indices),
+                    (("eval", index) for index in eval_indices),
+                )
+                for position, (label, index) in enumerate(labelled):
+                    spool.seek(offsets[index])
+                    yield spool.readline(), label, base_seed + position
+
+            self.output_file.parent.mkdir(parents=True, exist_ok=True)
+            with self.metrics.timer("write"), open_output(
+                self.output_file, self.compression
+            ) as f:
+                if self.output_format == "seeds":
+                    # Only the seeds are stored; entries are rebuilt on load.
+                    write_seeds_header(
+                        f, raw_tools_data, raw_vehicle_props, base_prompt_template
+                    )
+                    for line, label, seed in tasks():
+                        f.write(format_seed_record(json.loads(line), label, seed))
+                else:
+                    template = EntryTemplate(
+                        raw_tools_data, raw_vehicle_props, base_prompt_template
+                    )
+                    self._write_entries(f, tasks(), template)
+
+        self.metrics.count("train_entries", len(train_indices))
+        self.metrics.count("eval_entries", len(eval_indices))
+        self.metrics.write()
+        self.metrics.log_summary()
+        logger.info(
+            f"Dataset created: {self.output_file} (Train: {len(train_indices)}, Eval: {len(eval_indices)})"
+        )
 
-        train_entries = [
-            self._build_jsonl_entry(
-                item, "train", raw_tools_data, raw_vehicle_props, base_prompt_template
-            )
-            for item in train_items
-        ]
-        eval_entries = [
-            self._build_jsonl_entry(
-                item, "eval", raw_tools_data, raw_vehicle_props, base_prompt_template
+    def _check_leakage(
+        self,
+        spool: BinaryIO,
+        offsets: array,
+        eval_indices: array,
+        train_indices: array,
+    ) -> Tuple[array, array]:
+        """
+        Looks for eval items with near-duplicates in train, using the
+        similarity of the generation duplicate filter. Leaks are logged and,
+        in "redraw" mode, the leaking eval items are replaced.
+        """
+        spool.seek(0)
+        index = LeakageIndex(spool, self.filter_tokenizer, self.workers)
+        leaks = index.find_leaks(eval_indices, train_indices)
+        self.metrics.count("leaking_eval_items", len(leaks))
+        if not leaks:
+            logger.info("No near-duplicates of eval items found in train")
+            return eval_indices, train_indices
+
+        logger.warning(
+            "%d/%d eval items have near-duplicates in train (%d pairs)",
+            len(leaks),
+            len(eval_indices),
+            sum(len(found) for found in leaks.values()),
+        )
+        for position, found in list(leaks.items())[:_LEAK_EXAMPLES]:
+            train_position, score = found[0]
+            logger.info(
+                "Eval %r ~ train %r (ROUGE-L %.2f)",
+                self._read_query(spool, offsets, position),
+                self._read_query(spool, offsets, train_position),
+                score,
             )
-            for item in eval_items
-        ]
-
-        all_entries = train_entries + eval_entries
-        self._write_jsonl(self.output_file, all_entries)
+        if self.leakage != "redraw":
+            return eval_indices, train_indices
 
-        logger.info(
-            f"Dataset created: {self.output_file} (Train: {len(train_entries)}, Eval: {len(eval_entries)})"
+        new_eval, new_train, still_leaking = index.redraw(
+            eval_indices, train_indices, leaks
         )
+        redrawn = len(set(new_eval) - set(eval_indices))
+        self.metrics.count("redrawn_eval_items", redrawn)
+        logger.info("Redrew %d eval items from train", redrawn)
+        if still_leaking:
+            logger.warning(
+                "Train ran out of clean items, %d eval items still have "
+                "near-duplicates in train",
+                len(still_leaking),
+            )
+        return array("q", new_eval), array("q", new_train)
+
+    @staticmethod
+    def _read_query(spool: BinaryIO, offsets: array, position: int) -> str:
+        spool.seek(offsets[position])
+        return json.loads(spool.readline())["query"]
+
+    def _write_entries(
+        self,
+        f: TextIO,
+        tasks: Iterator[Tuple[bytes, str, int]],
+        template: EntryTemplate,
+    ):
+        if self.workers == 1:
+            _init_worker(template)
+            f.writelines(entry + "\n" for entry in map(_build_entry, tasks))
+            return
+
+        with Pool(self.workers, initializer=_init_worker, initargs=(template,)) as pool:
+            # `imap` reads its input eagerly, so tasks are handed over in
+            # windows to keep the spooled lines off the heap.
+            window = self.workers * _CHUNK_SIZE * 4
+            while block := list(islice(tasks, window)):
+                entries = pool.imap(_build_entry, block, _CHUNK_SIZE)
+                f.writelines(entry + "\n" for entry in entries)
 
     def _load_json_file(self, file_path: Path):
         content = file_path.read_text(encoding="utf-8")
@@ -73,78 +228,3 @@ class PostProcess:
             return json.loads(content)
         except json.JSONDecodeError as e:
             raise ValueError(f"Invalid JSON format: {e}")
-
-    def _build_jsonl_entry(
-        self, item, metadata_label, raw_tools, raw_props, base_prompt
-    ):
-        """
-        Builds a single entry, creating a shuffled version of tools and props.
-        """
-        shuffled_tools_def = self._randomize_tools(raw_tools)
-        formatted_tools = [{"function": tool_def} for tool_def in shuffled_tools_def]
-
-        shuffled_props_data = self._randomize_vehicle_props(raw_props)
-        shuffled_props_str = json.dumps(
-            shuffled_props_data, separators=(",", ":"), ensure_ascii=False
-        )
-
-        dev_msg = base_prompt.replace(
-            "{vehicle_properties_placeholder}", shuffled_props_str
-        )
-
-        tool_calls = []
-        for answer in item.answers:
-            tool_calls.append(
-                {"function": {"name": answer.name, "arguments": answer.arguments}}
-            )
-
-        messages = [
-            {"role": "developer", "content": dev_msg},
-            {"role": "user", "content": item.query},
-            {"role": "assistant", "tool_calls": tool_calls},
-        ]
-
-        return {
-            "metadata": metadata_label,
-            "tools": formatted_tools,
-            "messages": messages,
-        }
-
-    def _randomize_tools(self, tools_data: List[Dict]) -> List[Dict]:
-        """
-        Shuffles the list of tools AND the order of properties within each tool.
-        """
-        tools = copy.deepcopy(tools_data)
-        random.shuffle(tools)
-
-        for tool in tools:
-            params = tool.get("parameters", {})
-            if "properties" in params and isinstance(params["properties"], dict):
-                props_dict = params["properties"]
-                keys = list(props_dict.keys())
-                random.shuffle(keys)
-
-                # Reconstruct dictionary in new order (Python 3.7+ guarantees insertion order)
-                shuffled_props_dict = {k: props_dict[k] for k in keys}
-                params["properties"] = shuffled_props_dict
-
-        return tools
-
-    def _randomize_vehicle_props(self, props_data: List[Dict]) -> List[Dict]:
-        """
-        Shuffles the list of vehicle properties AND the areaIdProfiles within them.
-        """
-        props = copy.deepcopy(props_data)
-        random.shuffle(props)
-
-        for prop in props:
-            if "areaIdProfiles" in prop and isinstance(prop["areaIdProfiles"], list):
-                random.shuffle(prop["areaIdProfiles"])
-
-        return props
-
-    def _write_jsonl(self, path: Path, entries: List[Dict]):
-        path.parent.mkdir(parents=True, exist_ok=True)
-        with open(path, "w", encoding="utf-8") as f:
-            for entry in entries:
-                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
@@ -0,0 +1,83 @@
+import json
+import random
+import sys
+from pathlib import Path
+from typing import List
+import pytest
+
+# The pipeline modules import each other from `gen_pipeline/src`, as when
+# `cli.py` is run as a script.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from constants import CAR_PROPERTY_FUNCTIONS_FILE, VEHICLE_PROPERTIES_FILE
+from data.data_format import QueryItem
+from inference.api.llm_engine import LLMOptions
+from inference.fake.fake_engine import FakeLLMEngine
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+
+@pytest.fixture
+def repo_root(monkeypatch) -> Path:
+    """Runs the test from the repository root, where the metadata paths resolve."""
+    monkeypatch.chdir(REPO_ROOT)
+    return REPO_ROOT
+
+
+@pytest.fixture(scope="session")
+def tokenizer_file(tmp_path_factory) -> Path:
+    """
+    A small byte-level BPE tokenizer trained on the property catalogue, so
+    that the duplicate filter runs without downloading its tokenizer.
+    """
+    from tokenizers import Tokenizer, models, pre_tokenizers, trainers
+
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=2000, initial_alphabet=pre_tokenizers.ByteLevel.alphabet()
+    )
+    tokenizer.train([str(REPO_ROOT / VEHICLE_PROPERTIES_FILE)], trainer)
+    path = tmp_path_factory.mktemp("tokenizer") / "tokenizer.json"
+    tokenizer.save(str(path))
+    return path
+
+
+def perturb(query: str, rng: random.Random) -> str:
+    """Drops, repeats or swaps a word or two, as near-duplicate queries do."""
+    words = query.split()
+    for _ in range(rng.randint(1, 2)):
+        i = rng.randrange(len(words))
+        action = rng.choice(["drop", "repeat", "swap"])
+        if action == "drop" and len(words) > 3:
+            del words[i]
+        elif action == "repeat":
+            words.insert(i, words[i])
+        else:
+            j = rng.randrange(len(words))
+            words[i], words[j] = words[j], words[i]
+    return " ".join(words)
+
+
+@pytest.fixture
+def batches(repo_root) -> List[List[QueryItem]]:
+    """Batches of fake responses, with exact and near duplicates mixed in."""
+    engine = FakeLLMEngine(
+        CAR_PROPERTY_FUNCTIONS_FILE, VEHICLE_PROPERTIES_FILE, duplicate_rate=0.1
+    )
+    engine.load(LLMOptions(model_name="fake"))
+    rng = random.Random(0)
+    batches = []
+    seen: List[QueryItem] = []
+    for i in range(12):
+        text = engine.generate(f"batch {i}: generate 30 diverse pairs").text
+        raw = json.loads(text.removeprefix("```json").removesuffix("```"))
+        batch = [QueryItem.model_validate(item) for item in raw]
+        for item in rng.sample(seen, min(len(seen), 10)):
+            batch.append(
+                item.model_copy(update={"query": perturb(item.query, rng)})
+            )
+        rng.shuffle(batch)
+        seen.extend(batch)
+        batches.append(batch)
+    return batches
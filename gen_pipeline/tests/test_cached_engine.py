@@ -0,0 +1,99 @@
+from typing import Optional
+from inference.api.llm_engine import LLMEngine, LLMOptions, LLMResponse
+from inference.cache.cached_engine import CachedLLMEngine
+
+OPTIONS = LLMOptions(model_name="test-model", system_instruction="sys")
+
+
+class CountingEngine(LLMEngine):
+    """Answers every request with a new number."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def load(self, options: LLMOptions) -> None:
+        pass
+
+    def unload(self) -> None:
+        pass
+
+    def generate(
+        self, prompt: str, options: Optional[LLMOptions] = None
+    ) -> LLMResponse:
+        self.calls += 1
+        return LLMResponse(text=f"{prompt}:{self.calls}", finish_reason="STOP")
+
+
+def make_cache(tmp_path, max_bytes=1 << 20):
+    inner = CountingEngine()
+    cache = CachedLLMEngine(inner, tmp_path / "cache", max_bytes)
+    cache.load(OPTIONS)
+    return cache, inner
+
+
+def stream_text(cache: CachedLLMEngine, prompt: str) -> str:
+    return "".join(chunk.text for chunk in cache.generate_stream(prompt))
+
+
+def test_identical_prompts_replay_by_occurrence(tmp_path):
+    cache, _ = make_cache(tmp_path)
+    first = [cache.generate("a").text for _ in range(2)]
+    cache.unload()
+
+    cache, inner = make_cache(tmp_path)
+    replayed = [cache.generate("a").text for _ in range(3)]
+
+    assert first == ["a:1", "a:2"]
+    assert replayed[:2] == first
+    assert inner.calls == 1
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_numbered_requests_replay_for_other_prompts(tmp_path):
+    cache, _ = make_cache(tmp_path)
+    recorded = []
+    for index, prompt in enumerate(["a", "b", "c"]):
+        with cache.request(index):
+            recorded.append(stream_text(cache, prompt))
+    cache.unload()
+
+    # A resumed run continues at request 1 with prompts built from other data.
+    cache, inner = make_cache(tmp_path)
+    replayed = []
+    for index, prompt in [(1, "b"), (2, "x"), (3, "y")]:
+        with cache.request(index):
+            replayed.append(stream_text(cache, prompt))
+
+    assert replayed == ["b:2", "c:3", "y:1"]
+    assert inner.calls == 1
+    assert cache.prompt_mismatches == 1
+    # Outside of `request()`, the prompt is the key again.
+    assert cache.generate("b").text == "b:2"
+
+
+def test_options_are_part_of_the_key(tmp_path):
+    cache, inner = make_cache(tmp_path)
+    with cache.request(0):
+        cache.generate("a")
+    with cache.request(0):
+        cache.generate("a", LLMOptions(model_name="other-model"))
+
+    assert inner.calls == 2
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache, _ = make_cache(tmp_path)
+    cache.generate("a")
+    entry_size = cache._total_bytes
+    cache.unload()
+
+    cache, inner = make_cache(tmp_path, max_bytes=2 * entry_size)
+    cache.generate("b")
+    cache.generate("c")
+
+    assert len(cache._entries) == 2
+    assert cache._total_bytes <= 2 * entry_size
+    cache.unload()
+    cache, inner = make_cache(tmp_path, max_bytes=2 * entry_size)
+    cache.generate("a")
+    assert inner.calls == 1
@@ -0,0 +1,102 @@
+import itertools
+from typing import List
+import pytest
+from constants import FILTER_LSH_BANDS, FILTER_LSH_NUM_PERM, FILTER_THRESHOLD
+from data.data_filter import QueryFilter
+from data.data_format import QueryItem
+from data.lcs import LCSMatcher
+from data.lsh_index import MinHashLSHIndex
+from data.sharded_scorer import ShardedOverlapScorer
+from data.token_store import TokenStore
+
+
+def run_filter(batches, tokenizer_file, existing=1, **options) -> List[str]:
+    """Filters the batches after the first `existing`, which are kept as is."""
+    data = list(itertools.chain.from_iterable(batches[:existing]))
+    query_filter = QueryFilter(data, tokenizer_file=tokenizer_file, **options)
+    try:
+        for batch in batches[existing:]:
+            query_filter.extend_unique(batch)
+    finally:
+        query_filter.close()
+    return [item.query for item in data]
+
+
+def test_lsh_filter_decides_like_the_exact_filter(batches, tokenizer_file):
+    exact = run_filter(batches, tokenizer_file, use_index=False)
+    lsh = run_filter(batches, tokenizer_file, use_index=True)
+
+    candidates = sum(len(batch) for batch in batches)
+    assert lsh == exact
+    # The inputs exercise the filter: a fair share of them is rejected.
+    assert len(batches[0]) < len(exact) < candidates - 40
+
+
+def test_lsh_index_finds_every_pair_over_the_threshold(batches, tokenizer_file):
+    query_filter = QueryFilter([], use_index=False, tokenizer_file=tokenizer_file)
+    tokens = [
+        query_filter._get_masked_tokens(item)
+        for item in itertools.chain.from_iterable(batches)
+    ]
+    index = MinHashLSHIndex(FILTER_LSH_NUM_PERM, FILTER_LSH_BANDS)
+    signatures = [index.signature(t) for t in tokens]
+    for signature in signatures:
+        index.add(signature)
+
+    pairs = 0
+    for i, a in enumerate(tokens):
+        matcher = LCSMatcher(a)
+        candidates = index.query(signatures[i])
+        for j in range(i + 1, len(tokens)):
+            if matcher.fmeasure(tokens[j]) > FILTER_THRESHOLD:
+                pairs += 1
+                assert j in candidates, (i, j)
+    assert pairs > 50
+
+
+@pytest.mark.parametrize("use_index", [False, True])
+def test_sharded_filter_decides_like_one_process(batches, tokenizer_file, use_index):
+    # The workers hold the existing items; later ones are scored in process.
+    single = run_filter(batches, tokenizer_file, existing=6, use_index=use_index)
+    sharded = run_filter(
+        batches, tokenizer_file, existing=6, use_index=use_index, workers=2
+    )
+
+    assert sharded == single
+
+
+def test_sharded_scorer_scores_appended_items(batches, tokenizer_file):
+    query_filter = QueryFilter([], use_index=False, tokenizer_file=tokenizer_file)
+    tokens = [
+        query_filter._get_masked_tokens(item)
+        for item in itertools.chain.from_iterable(batches)
+    ]
+
+    def expected(candidates, ids=None):
+        return [
+            not query_filter._validate(
+                candidate, store if ids is None else (store[i] for i in ids[k])
+            )
+            for k, candidate in enumerate(candidates)
+        ]
+
+    store = TokenStore()
+    store.extend(tokens[:100])
+    scorer = ShardedOverlapScorer(store, workers=2)
+    try:
+        # Items appended after the snapshot are scored in this process.
+        for start in range(100, len(tokens), 50):
+            candidates = tokens[start : start + 50]
+            ids = [list(range(k % 3, len(store), 3)) for k in range(len(candidates))]
+            assert scorer.rejected(candidates) == expected(candidates)
+            assert scorer.rejected(candidates, ids) == expected(candidates, ids)
+            store.extend(candidates)
+        assert scorer._snapshot_size == 100
+
+        # A long enough tail rebuilds the shared snapshot.
+        store.extend(tokens * 3)
+        candidates = tokens[::7]
+        assert scorer.rejected(candidates) == expected(candidates)
+        assert scorer._snapshot_size == len(store)
+    finally:
+        scorer.close()
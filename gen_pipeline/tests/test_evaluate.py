@@ -0,0 +1,92 @@
+import asyncio
+import json
+from pathlib import Path
+from typing import List, Optional, Set
+from evaluate import Evaluator
+from inference.api.llm_engine import LLMEngine, LLMOptions, LLMResponse
+
+
+class AsyncStubEngine(LLMEngine):
+    """Answers each query with its target call, failing the queries in `fail`."""
+
+    def __init__(self, answers: dict, fail: Set[str] = frozenset()):
+        self.answers = answers
+        self.fail = set(fail)
+        self.loops: List[asyncio.AbstractEventLoop] = []
+        self.instructions: List[str] = []
+
+    def load(self, options: LLMOptions) -> None:
+        pass
+
+    def unload(self) -> None:
+        pass
+
+    def generate(
+        self, prompt: str, options: Optional[LLMOptions] = None
+    ) -> LLMResponse:
+        raise AssertionError("evaluate should only use agenerate")
+
+    async def agenerate(
+        self, prompt: str, options: Optional[LLMOptions] = None
+    ) -> LLMResponse:
+        self.loops.append(asyncio.get_running_loop())
+        self.instructions.append(options.system_instruction)
+        await asyncio.sleep(0)
+        if prompt in self.fail:
+            raise RuntimeError("bad request")
+        return LLMResponse(text=json.dumps(self.answers[prompt]), output_tokens=1)
+
+
+def write_dataset(path: Path, count: int) -> dict:
+    answers = {}
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            query = f"query {i}"
+            call = {"name": "set_fan", "arguments": {"level": i}}
+            answers[query] = [call]
+            entry = {
+                "metadata": "eval",
+                "tools": [{"name": "set_fan", "index": i}],
+                "messages": [
+                    {"role": "developer", "content": f"developer {i}"},
+                    {"role": "user", "content": query},
+                    {"role": "assistant", "tool_calls": [{"function": call}]},
+                ],
+            }
+            f.write(json.dumps(entry) + "\n")
+    return answers
+
+
+def test_batches_share_one_event_loop(tmp_path):
+    answers = write_dataset(tmp_path / "data.jsonl", 5)
+    engine = AsyncStubEngine(answers)
+    evaluator = Evaluator(
+        tmp_path / "data.jsonl", tmp_path / "results.jsonl", engine, batch_size=2
+    )
+
+    summary = evaluator.run()
+
+    assert len(engine.loops) == 5
+    assert len(set(map(id, engine.loops))) == 1
+    assert len(set(engine.instructions)) == 5
+    assert summary["entries"] == 5
+    assert summary["accuracy"] == 1.0
+    assert summary["failed"] == 0
+
+
+def test_failed_entries_are_retried(tmp_path):
+    answers = write_dataset(tmp_path / "data.jsonl", 5)
+    output = tmp_path / "results.jsonl"
+    engine = AsyncStubEngine(answers, fail={"query 3"})
+
+    summary = Evaluator(tmp_path / "data.jsonl", output, engine, batch_size=2).run()
+
+    assert summary["entries"] == 4
+    assert summary["failed"] == 1
+
+    engine = AsyncStubEngine(answers)
+    summary = Evaluator(tmp_path / "data.jsonl", output, engine, batch_size=2).run()
+
+    assert engine.instructions and len(engine.instructions) == 1
+    assert summary["entries"] == 5
+    assert summary["failed"] == 0
@@ -0,0 +1,102 @@
+import json
+import logging
+import random
+from typing import Iterator, Optional, Set
+import pytest
+from constants import (
+    CAR_PROPERTY_FUNCTIONS_FILE,
+    MAX_FAILED_REQUESTS_IN_A_ROW,
+    VEHICLE_PROPERTIES_FILE,
+)
+from generation_pipeline import GenerationPipeline
+from inference.api.llm_engine import LLMOptions, LLMResponse
+from inference.fake.fake_engine import FakeLLMEngine
+
+
+class FailingEngine(FakeLLMEngine):
+    """Fails the numbered streams in `fail` (or all from `fail_from`) at once."""
+
+    def __init__(self, fail: Set[int] = frozenset(), fail_from: Optional[int] = None):
+        super().__init__(
+            CAR_PROPERTY_FUNCTIONS_FILE,
+            VEHICLE_PROPERTIES_FILE,
+            malformed_rate=0.05,
+            duplicate_rate=0.1,
+        )
+        self.fail = fail
+        self.fail_from = fail_from
+        self.streams = 0
+        self.unloads = 0
+
+    def unload(self) -> None:
+        super().unload()
+        self.unloads += 1
+
+    def generate_stream(
+        self, prompt: str, options: Optional[LLMOptions] = None
+    ) -> Iterator[LLMResponse]:
+        self.streams += 1
+        if self.streams in self.fail or (
+            self.fail_from is not None and self.streams >= self.fail_from
+        ):
+            raise RuntimeError("Request failed after 7 attempts")
+        yield from super().generate_stream(prompt, options)
+
+
+def make_pipeline(tmp_path, tokenizer_file, engine, num_samples=150, **options):
+    random.seed(0)
+    return GenerationPipeline(
+        num_samples,
+        tmp_path / "dataset.json",
+        save_interval=2,
+        concurrency=2,
+        engine=engine,
+        filter_tokenizer=tokenizer_file,
+        **options,
+    )
+
+
+def saved_count(tmp_path) -> int:
+    return len(json.loads((tmp_path / "dataset.json").read_text(encoding="utf-8")))
+
+
+def test_failed_requests_are_skipped(repo_root, tmp_path, tokenizer_file):
+    # The first stream is the seed request.
+    engine = FailingEngine(fail={3, 4, 6})
+    pipeline = make_pipeline(tmp_path, tokenizer_file, engine)
+
+    pipeline.run()
+
+    assert saved_count(tmp_path) >= 150
+    assert pipeline.metrics.counter("requests_failed") == 3
+    assert engine.unloads == 1
+
+
+def test_failed_run_unloads_and_saves(repo_root, tmp_path, tokenizer_file):
+    engine = FailingEngine(fail_from=4)
+    pipeline = make_pipeline(tmp_path, tokenizer_file, engine, num_samples=1000)
+
+    with pytest.raises(RuntimeError, match="failed in a row"):
+        pipeline.run()
+
+    assert pipeline.metrics.counter("requests_failed") == MAX_FAILED_REQUESTS_IN_A_ROW
+    assert engine.unloads == 1
+    assert saved_count(tmp_path) > 0
+
+
+def test_property_subsetting_is_summarized_once(
+    repo_root, tmp_path, tokenizer_file, caplog
+):
+    pipeline = make_pipeline(
+        tmp_path, tokenizer_file, FailingEngine(), property_subset=5
+    )
+
+    with caplog.at_level(logging.INFO, logger="generation_pipeline"):
+        pipeline.run()
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert not any(message.startswith("Prompt lists") for message in messages)
+    summaries = [m for m in messages if m.startswith("Property subsetting saved")]
+    assert len(summaries) == 1
+    assert f"over {pipeline._subset_prompt_count} prompts" in summaries[0]
+    assert pipeline._subset_prompt_count > 1
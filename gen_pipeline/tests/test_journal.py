@@ -0,0 +1,103 @@
+import json
+import random
+import pytest
+from constants import CAR_PROPERTY_FUNCTIONS_FILE, VEHICLE_PROPERTIES_FILE
+from data.data_format import QueryItem, load_existing_data
+from generation_pipeline import GenerationPipeline
+from inference.fake.fake_engine import FakeLLMEngine
+
+
+def make_items(start: int, count: int):
+    return [
+        QueryItem(
+            query=f"query {i}",
+            answers=[{"name": "getIntProperty", "arguments": {"areaId": i}}],
+        )
+        for i in range(start, start + count)
+    ]
+
+
+def write_output(path, items):
+    path.write_text(
+        json.dumps([item.model_dump() for item in items], indent=2), encoding="utf-8"
+    )
+
+
+def write_journal(path, items, tail=""):
+    with open(path, "w", encoding="utf-8") as f:
+        for item in items:
+            f.write(item.model_dump_json() + "\n")
+        f.write(tail)
+
+
+def test_journal_follows_the_output(tmp_path):
+    write_output(tmp_path / "d.json", make_items(0, 5))
+    write_journal(tmp_path / "d.journal.jsonl", make_items(5, 3))
+
+    data = load_existing_data(tmp_path / "d.json", journal=tmp_path / "d.journal.jsonl")
+
+    assert data == make_items(0, 8)
+
+
+def test_torn_last_line_is_skipped(tmp_path):
+    torn = make_items(8, 1)[0].model_dump_json()[:-7]
+    write_journal(tmp_path / "d.journal.jsonl", make_items(5, 3), tail=torn)
+
+    # The output may be missing when only the journal was written.
+    data = load_existing_data(tmp_path / "d.json", journal=tmp_path / "d.journal.jsonl")
+
+    assert data == make_items(5, 3)
+
+
+def test_torn_line_before_the_end_is_an_error(tmp_path):
+    torn = make_items(8, 1)[0].model_dump_json()[:-7] + "\n"
+    write_journal(tmp_path / "d.journal.jsonl", [], tail=torn)
+    with open(tmp_path / "d.journal.jsonl", "a", encoding="utf-8") as f:
+        f.write(make_items(9, 1)[0].model_dump_json() + "\n")
+
+    with pytest.raises(ValueError):
+        load_existing_data(tmp_path / "d.json", journal=tmp_path / "d.journal.jsonl")
+
+
+class CrashingPipeline(GenerationPipeline):
+    """Crashes on the final save, after the seed was written."""
+
+    def _write_output(self, data):
+        if self.output_path.exists():
+            raise KeyboardInterrupt("killed")
+        super()._write_output(data)
+
+
+def make_pipeline(cls, tmp_path, tokenizer_file, num_samples):
+    random.seed(0)
+    engine = FakeLLMEngine(
+        CAR_PROPERTY_FUNCTIONS_FILE, VEHICLE_PROPERTIES_FILE, duplicate_rate=0.1
+    )
+    return cls(
+        num_samples,
+        tmp_path / "d.json",
+        save_interval=1,
+        engine=engine,
+        checkpoint_mode="journal",
+        filter_tokenizer=tokenizer_file,
+    )
+
+
+def test_resume_recovers_the_journal(repo_root, tmp_path, tokenizer_file):
+    crashed = make_pipeline(CrashingPipeline, tmp_path, tokenizer_file, 200)
+    with pytest.raises(KeyboardInterrupt):
+        crashed.run()
+    journal = tmp_path / "d.json.journal.jsonl"
+    # Add the torn line a kill during an append would leave.
+    with open(journal, "a", encoding="utf-8") as f:
+        f.write('{"query": "cut off", "ans')
+    recovered = load_existing_data(tmp_path / "d.json", journal=journal)
+    assert len(recovered) == crashed._saved_count
+
+    resumed = make_pipeline(GenerationPipeline, tmp_path, tokenizer_file, 300)
+    resumed.run()
+
+    data = load_existing_data(tmp_path / "d.json")
+    assert len(data) >= 300
+    assert data[: len(recovered)] == recovered
+    assert not journal.exists()
@@ -0,0 +1,86 @@
+import json
+from typing import List, Tuple
+import pytest
+from data.json_stream import JsonArrayStream
+
+ITEMS = [
+    {"query": "Set the fan to 3", "answers": [{"name": "set", "arguments": {}}]},
+    {"query": 'Say "hi" [twice] {now}', "answers": []},
+    {"query": "Escaped \\\" and \\\\ and ``` inside", "answers": [[1, [2]], {}]},
+]
+
+
+def parse(text: str, chunk_size: int) -> Tuple[List, JsonArrayStream]:
+    stream = JsonArrayStream()
+    elements = []
+    for start in range(0, len(text), chunk_size):
+        elements.extend(stream.feed(text[start : start + chunk_size]))
+    stream.close()
+    return elements, stream
+
+
+def fenced(payload: str) -> str:
+    return f"Sure! Here you go:\n```json\n{payload}\n```\nAnything else?"
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        json.dumps(ITEMS),
+        json.dumps(ITEMS, indent=2),
+        fenced(json.dumps(ITEMS, indent=2)),
+        "Here are [3] queries, as {requested}:\n" + fenced(json.dumps(ITEMS)),
+        "Pick [one of\n```json\n" + json.dumps(ITEMS) + "\n```",
+    ],
+)
+def test_every_chunk_boundary(text):
+    for chunk_size in range(1, len(text) + 1):
+        elements, stream = parse(text, chunk_size)
+        assert elements == ITEMS, chunk_size
+        assert stream.started and stream.finished
+        assert stream.lost == 0
+
+
+def test_array_in_prose_without_a_fence():
+    text = "The queries are " + json.dumps(ITEMS) + " and that is all [done]."
+
+    elements, stream = parse(text, 7)
+
+    assert elements == ITEMS
+    assert stream.lost == 0
+
+
+def test_fence_after_elements_is_ignored():
+    text = json.dumps(ITEMS[:1]) + "\n```json\n" + json.dumps(ITEMS) + "\n```"
+
+    elements, _ = parse(text, 5)
+
+    assert elements == ITEMS[:1]
+
+
+def test_malformed_element_is_dropped_alone():
+    payload = f'[{json.dumps(ITEMS[0])}, {{"query": oops}}, {json.dumps(ITEMS[1])}]'
+
+    elements, stream = parse(fenced(payload), 4)
+
+    assert elements == ITEMS[:2]
+    assert stream.lost == 1
+
+
+def test_cut_off_tail_counts_as_lost():
+    text = fenced(json.dumps(ITEMS))
+    cut = text[: text.index("Escaped")]
+
+    elements, stream = parse(cut, 3)
+
+    assert elements == ITEMS[:2]
+    assert stream.started and not stream.finished
+    assert stream.lost == 1
+
+
+def test_no_array():
+    elements, stream = parse("I cannot help with that.", 4)
+
+    assert elements == []
+    assert not stream.started
+    assert stream.lost == 0
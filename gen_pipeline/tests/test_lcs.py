@@ -0,0 +1,63 @@
+import random
+import pytest
+from rouge_score.rouge_scorer import _score_lcs
+from data.lcs import LCSMatcher
+
+
+def random_pairs(count: int, seed: int = 0):
+    """Token sequences from a small vocabulary, so that they overlap a lot."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        vocabulary = rng.randint(1, 12)
+        target = [rng.randrange(vocabulary) for _ in range(rng.randint(0, 90))]
+        if rng.random() < 0.5:
+            # A perturbed copy, as near-duplicate queries are.
+            prediction = [
+                token if rng.random() < 0.8 else rng.randrange(vocabulary)
+                for token in target
+                if rng.random() < 0.9
+            ]
+        else:
+            prediction = [rng.randrange(vocabulary) for _ in range(rng.randint(0, 90))]
+        yield target, prediction
+
+
+def reference_lcs_length(a, b) -> int:
+    table = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i, x in enumerate(a):
+        for j, y in enumerate(b):
+            table[i + 1][j + 1] = (
+                table[i][j] + 1 if x == y else max(table[i][j + 1], table[i + 1][j])
+            )
+    return table[-1][-1]
+
+
+@pytest.mark.parametrize("target, prediction", list(random_pairs(300)))
+def test_matches_rouge_score_lcs(target, prediction):
+    matcher = LCSMatcher(target)
+
+    assert matcher.lcs_length(prediction) == reference_lcs_length(target, prediction)
+    # The filter compares the F-measure against a threshold, so it must be
+    # bit-for-bit the reference value, not just close to it.
+    reference = _score_lcs([str(t) for t in target], [str(t) for t in prediction])
+    assert matcher.fmeasure(prediction) == reference.fmeasure
+    # The length bound may round differently; the filter allows for that
+    # with a margin of 1e-9.
+    assert matcher.max_fmeasure(len(prediction)) >= matcher.fmeasure(prediction) - 1e-9
+
+
+def test_one_matcher_scores_many_sequences():
+    target = [5, 1, 5, 2, 9, 1, 5]
+    matcher = LCSMatcher(target)
+
+    for _, prediction in random_pairs(50, seed=1):
+        assert matcher.lcs_length(prediction) == reference_lcs_length(
+            target, prediction
+        )
+
+
+def test_empty_sequences():
+    assert LCSMatcher([]).fmeasure([1, 2]) == 0.0
+    assert LCSMatcher([1, 2]).fmeasure([]) == 0.0
+    assert LCSMatcher([1, 2]).fmeasure([3, 4]) == 0.0
+    assert LCSMatcher([1, 2]).fmeasure([1, 2]) == 1.0
@@ -0,0 +1,74 @@
+import io
+import itertools
+import random
+import pytest
+from constants import FILTER_THRESHOLD
+from data import leakage
+from data.data_filter import QueryFilter
+from data.filter_tokenizer import FilterTokenizer
+from data.lcs import LCSMatcher
+from data.leakage import LeakageIndex
+
+
+@pytest.fixture
+def dataset(batches, tokenizer_file):
+    """The batches as JSON lines, their masked tokens and a random split."""
+    items = list(itertools.chain.from_iterable(batches))
+    lines = [item.model_dump_json().encode("utf-8") + b"\n" for item in items]
+    tokenizer = FilterTokenizer.load(tokenizer_file)
+    tokens = [
+        tokenizer.encode(
+            QueryFilter.mask_query(
+                item.query, [answer.arguments for answer in item.answers]
+            )
+        )
+        for item in items
+    ]
+    positions = list(range(len(items)))
+    random.Random(0).shuffle(positions)
+    split = len(positions) // 4
+    return lines, tokens, positions[:split], positions[split:]
+
+
+def brute_force(tokens, eval_indices, train_indices):
+    leaks = {}
+    for position in eval_indices:
+        matcher = LCSMatcher(tokens[position])
+        found = []
+        for other in sorted(train_indices):
+            score = matcher.fmeasure(tokens[other])
+            if score > FILTER_THRESHOLD:
+                found.append((other, score))
+        if found:
+            leaks[position] = found
+    return leaks
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_find_leaks_matches_brute_force(dataset, tokenizer_file, workers, monkeypatch):
+    # Small chunks, so that the eval items are split across the workers.
+    monkeypatch.setattr(leakage, "_SEARCH_CHUNK_SIZE", 8)
+    lines, tokens, eval_indices, train_indices = dataset
+    index = LeakageIndex(io.BytesIO(b"".join(lines)), tokenizer_file, workers)
+
+    leaks = index.find_leaks(eval_indices, train_indices)
+
+    expected = brute_force(tokens, eval_indices, train_indices)
+    assert leaks == expected
+    assert len(leaks) > 20
+
+
+def test_redraw_leaves_no_leaks(dataset, tokenizer_file):
+    lines, tokens, eval_indices, train_indices = dataset
+    index = LeakageIndex(io.BytesIO(b"".join(lines)), tokenizer_file)
+    leaks = index.find_leaks(eval_indices, train_indices)
+
+    new_eval, new_train, still_leaking = index.redraw(
+        eval_indices, train_indices, leaks
+    )
+
+    assert len(new_eval) == len(eval_indices)
+    assert sorted(new_eval + new_train) == list(range(len(lines)))
+    remaining = brute_force(tokens, new_eval, new_train)
+    assert sorted(remaining) == still_leaking
+    assert len(still_leaking) < len(leaks)
@@ -0,0 +1,166 @@
+import json
+from typing import Callable, List
+import httpx
+import pytest
+from inference.api.llm_engine import LLMOptions
+from inference.api.resilience import CircuitBreaker, RequestGuard, RetryableError
+from inference.openai_compat.openai_engine import OpenAICompatibleEngine
+
+BASE_URL = "http://stand-in/v1"
+OPTIONS = LLMOptions(model_name="test-model", temperature=0.0, system_instruction="sys")
+
+
+def sse(*events) -> bytes:
+    lines = []
+    for event in events:
+        data = event if isinstance(event, str) else json.dumps(event)
+        lines.append(f"data: {data}\n\n")
+    return "".join(lines).encode("utf-8")
+
+
+def make_engine(
+    handler: Callable[[httpx.Request], httpx.Response], max_retries: int = 2
+) -> OpenAICompatibleEngine:
+    guard = RequestGuard(
+        breaker=CircuitBreaker(failure_threshold=None),
+        max_retries=max_retries,
+        base_delay=0.01,
+    )
+    engine = OpenAICompatibleEngine(
+        BASE_URL, guard=guard, transport=httpx.MockTransport(handler)
+    )
+    engine.load(OPTIONS)
+    return engine
+
+
+def test_stream_yields_chunks_then_usage():
+    requests: List[dict] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(json.loads(request.content))
+        body = sse(
+            {"choices": [{"index": 0, "delta": {"role": "assistant"}}]},
+            {"choices": [{"index": 0, "delta": {"content": "[{\"query\""}}]},
+            {"choices": [{"index": 0, "delta": {"content": ": 1}]"}}]},
+            {"choices": [{"index": 0, "delta": {}, "finish_reason": "length"}]},
+            # With `include_usage`, the usage arrives alone after the choices.
+            {
+                "choices": [],
+                "usage": {
+                    "prompt_tokens": 12,
+                    "completion_tokens": 5,
+                    "prompt_tokens_details": {"cached_tokens": 8},
+                },
+            },
+            "[DONE]",
+        )
+        return httpx.Response(
+            200, content=body, headers={"content-type": "text/event-stream"}
+        )
+
+    engine = make_engine(handler)
+    chunks = list(engine.generate_stream("prompt"))
+    engine.unload()
+
+    assert [chunk.text for chunk in chunks] == ['[{"query"', ": 1}]", ""]
+    final = chunks[-1]
+    assert final.finish_reason == "MAX_TOKENS"
+    assert (final.input_tokens, final.output_tokens, final.cached_input_tokens) == (
+        12,
+        5,
+        8,
+    )
+    assert all(chunk.input_tokens is None for chunk in chunks[:-1])
+
+    (body,) = requests
+    assert body["stream"] is True
+    assert body["stream_options"] == {"include_usage": True}
+    assert body["messages"] == [
+        {"role": "system", "content": "sys"},
+        {"role": "user", "content": "prompt"},
+    ]
+
+
+def test_stream_without_usage():
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = sse(
+            {"choices": [{"delta": {"content": "ok"}, "finish_reason": "stop"}]},
+            "[DONE]",
+        )
+        return httpx.Response(200, content=body)
+
+    engine = make_engine(handler)
+    chunks = list(engine.generate_stream("prompt"))
+
+    assert [chunk.text for chunk in chunks] == ["ok", ""]
+    assert chunks[-1].finish_reason == "STOP"
+    assert chunks[-1].input_tokens is None
+
+
+def test_429_is_retried_after_retry_after():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"retry-after": "0"}, json={})
+        return httpx.Response(
+            200,
+            json={
+                "choices": [
+                    {"message": {"content": "done"}, "finish_reason": "stop"}
+                ],
+                "usage": {"prompt_tokens": 3, "completion_tokens": 1},
+            },
+        )
+
+    engine = make_engine(handler)
+    response = engine.generate("prompt")
+
+    assert len(calls) == 2
+    assert response.text == "done"
+    assert response.finish_reason == "STOP"
+    assert (response.input_tokens, response.output_tokens) == (3, 1)
+
+
+def test_stream_429_is_retried():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"retry-after": "0"})
+        body = sse({"choices": [{"delta": {"content": "x"}}]})
+        return httpx.Response(200, content=body)
+
+    engine = make_engine(handler)
+
+    assert [chunk.text for chunk in engine.generate_stream("prompt")] == ["x", ""]
+    assert len(calls) == 2
+
+
+def test_429_carries_retry_after_when_retries_run_out():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(429, headers={"retry-after": "17s"})
+
+    engine = make_engine(handler, max_retries=0)
+    with pytest.raises(RuntimeError) as excinfo:
+        engine.generate("prompt")
+
+    cause = excinfo.value.__cause__
+    assert isinstance(cause, RetryableError)
+    assert cause.retry_after == 17.0
+
+
+def test_client_error_is_not_retried():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(400, json={"error": "bad request"})
+
+    engine = make_engine(handler)
+    with pytest.raises(RuntimeError):
+        list(engine.generate_stream("prompt"))
+
+    assert len(calls) == 1
@@ -0,0 +1,182 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from inference.api import resilience
+from inference.api.resilience import (
+    CircuitBreaker,
+    RateLimiter,
+    RequestGuard,
+    RetryableError,
+    parse_retry_delay,
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake monotonic clock that sleeping advances."""
+    state = SimpleNamespace(now=1000.0, sleeps=[])
+
+    def sleep(seconds):
+        state.sleeps.append(seconds)
+        state.now += seconds
+
+    async def asleep(seconds):
+        sleep(seconds)
+
+    monkeypatch.setattr(
+        resilience, "time", SimpleNamespace(monotonic=lambda: state.now, sleep=sleep)
+    )
+    monkeypatch.setattr(resilience.asyncio, "sleep", asleep)
+    return state
+
+
+def test_rate_limiter_allows_a_burst_then_queues(clock):
+    # 60 requests per minute with a 10 second burst.
+    limiter = RateLimiter(rpm=60)
+
+    assert [limiter.reserve(1) for _ in range(10)] == [0.0] * 10
+    assert limiter.reserve(1) == pytest.approx(1.0)
+    assert limiter.reserve(1) == pytest.approx(2.0)
+
+    clock.now += 5.0
+    # The queue of two is served, and three more requests are available.
+    assert [limiter.reserve(1) for _ in range(3)] == [0.0] * 3
+    assert limiter.reserve(1) == pytest.approx(1.0)
+
+
+def test_rate_limiter_refills_up_to_the_burst(clock):
+    limiter = RateLimiter(rpm=60)
+    clock.now += 3600.0
+
+    waits = [limiter.reserve(1) for _ in range(11)]
+
+    assert waits[:10] == [0.0] * 10
+    assert waits[10] == pytest.approx(1.0)
+
+
+def test_token_quota_and_adjustment(clock):
+    # 6000 tokens per minute with a 10 second burst of 1000.
+    limiter = RateLimiter(tpm=6000)
+
+    assert limiter.reserve(800) == 0.0
+    assert limiter.reserve(800) == pytest.approx(6.0)
+    # The first request only used 200 tokens, which pays back 600.
+    limiter.adjust(800, 200)
+    assert limiter.reserve(0) == pytest.approx(0.0)
+    assert limiter.reserve(100) == pytest.approx(1.0)
+
+
+def test_unlimited_rate_limiter(clock):
+    limiter = RateLimiter()
+
+    assert all(limiter.reserve(10**6) == 0.0 for _ in range(100))
+    limiter.adjust(10, 5)
+
+
+def test_circuit_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=30.0)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.delay() == 0.0
+    breaker.record_failure()
+    assert breaker.delay() == pytest.approx(30.0)
+
+    clock.now += 30.0
+    assert breaker.delay() == 0.0
+    # Half-open: a single failure opens the circuit again.
+    breaker.record_failure()
+    assert breaker.delay() == pytest.approx(30.0)
+
+    clock.now += 30.0
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.delay() == 0.0
+
+
+def test_circuit_without_threshold_only_pauses(clock):
+    breaker = CircuitBreaker(failure_threshold=None)
+    for _ in range(100):
+        breaker.record_failure()
+    assert breaker.delay() == 0.0
+
+    breaker.pause(12.0)
+    breaker.pause(5.0)
+    assert breaker.delay() == pytest.approx(12.0)
+
+
+def failing(errors, result="ok"):
+    calls = []
+
+    def fn():
+        calls.append(None)
+        if errors:
+            raise errors.pop(0)
+        return result, None
+
+    return fn, calls
+
+
+def test_guard_retries_with_backoff(clock, monkeypatch):
+    monkeypatch.setattr(resilience.random, "uniform", lambda low, high: high)
+    guard = RequestGuard(breaker=CircuitBreaker(None), base_delay=1.0, max_delay=3.0)
+    fn, calls = failing([RetryableError("503") for _ in range(4)])
+
+    assert guard.call(fn, 10) == "ok"
+
+    assert len(calls) == 5
+    assert [s for s in clock.sleeps if s] == [1.0, 2.0, 3.0, 3.0]
+
+
+def test_guard_honours_retry_after(clock):
+    breaker = CircuitBreaker(None)
+    guard = RequestGuard(breaker=breaker, base_delay=0.5)
+    fn, calls = failing([RetryableError("429", retry_after=20.0)])
+
+    guard.call(fn, 10)
+
+    assert len(calls) == 2
+    retry_delay = max(clock.sleeps)
+    assert 20.0 <= retry_delay <= 20.5
+    # Every request sharing the guard was paused as well.
+    assert breaker._open_until >= clock.now - retry_delay + 20.0
+
+
+def test_guard_gives_up_after_max_retries(clock):
+    guard = RequestGuard(breaker=CircuitBreaker(None), max_retries=2)
+    fn, calls = failing([RetryableError(str(i)) for i in range(5)])
+
+    with pytest.raises(RuntimeError, match="after 3 attempts") as excinfo:
+        guard.call(fn, 10)
+
+    assert len(calls) == 3
+    assert isinstance(excinfo.value.__cause__, RetryableError)
+
+
+def test_guard_does_not_retry_other_errors(clock):
+    guard = RequestGuard()
+    fn, calls = failing([ValueError("bad request")])
+
+    with pytest.raises(ValueError):
+        guard.call(fn, 10)
+    assert len(calls) == 1
+
+
+def test_async_guard_retries(clock):
+    guard = RequestGuard(breaker=CircuitBreaker(None))
+    fn, calls = failing([RetryableError("503"), RetryableError("503")])
+
+    async def afn():
+        return fn()
+
+    assert asyncio.run(guard.acall(afn, 10)) == "ok"
+    assert len(calls) == 3
+
+
+@pytest.mark.parametrize(
+    "value, seconds",
+    [("17s", 17.0), ("1.5s", 1.5), ("30", 30.0), (" 2 s ", 2.0), ("soon", None)],
+)
+def test_parse_retry_delay(value, seconds):
+    assert parse_retry_delay(value) == seconds
@@ -0,0 +1,120 @@
+import asyncio
+from typing import Iterator, List, Optional
+import pytest
+from inference.api.llm_engine import LLMEngine, LLMOptions, LLMResponse
+from inference.api.resilience import RetryableError
+from inference.router.router_engine import RouterBackend, RouterEngine
+
+OPTIONS = LLMOptions(model_name="test-model")
+
+
+class ScriptedEngine(LLMEngine):
+    """Raises the scripted errors in turn, then answers with its name."""
+
+    def __init__(self, name: str, errors: List[Optional[Exception]] = ()):
+        self.name = name
+        self.errors = list(errors)
+        self.calls = 0
+
+    def load(self, options: LLMOptions) -> None:
+        pass
+
+    def unload(self) -> None:
+        pass
+
+    def generate(
+        self, prompt: str, options: Optional[LLMOptions] = None
+    ) -> LLMResponse:
+        self.calls += 1
+        error = self.errors.pop(0) if self.errors else None
+        if error is not None:
+            raise error
+        return LLMResponse(text=self.name, output_tokens=1)
+
+    def generate_stream(
+        self, prompt: str, options: Optional[LLMOptions] = None
+    ) -> Iterator[LLMResponse]:
+        yield self.generate(prompt, options)
+
+
+def guard_error(message: str) -> RuntimeError:
+    """A RuntimeError raised by a RequestGuard whose retries ran out."""
+    try:
+        try:
+            raise RetryableError(message)
+        except RetryableError as e:
+            raise RuntimeError(f"Request failed after 1 attempts: {e}") from e
+    except RuntimeError as e:
+        return e
+
+
+def make_router(*engines: ScriptedEngine, **kwargs) -> RouterEngine:
+    router = RouterEngine(
+        [RouterBackend(engine.name, engine) for engine in engines],
+        base_delay=0.001,
+        **kwargs,
+    )
+    router.load(OPTIONS)
+    return router
+
+
+def call(router: RouterEngine, mode: str) -> str:
+    if mode == "generate":
+        return router.generate("prompt").text
+    if mode == "stream":
+        return "".join(chunk.text for chunk in router.generate_stream("prompt"))
+    return asyncio.run(router.agenerate("prompt")).text
+
+
+def failures(router: RouterEngine) -> dict:
+    return {state.backend.name: state.failures for state in router._states}
+
+
+@pytest.mark.parametrize("mode", ["generate", "stream", "agenerate"])
+@pytest.mark.parametrize("error", [RetryableError("429"), guard_error("503")])
+def test_retryable_error_fails_over(mode, error):
+    a = ScriptedEngine("a", [error])
+    b = ScriptedEngine("b", [error])
+    router = make_router(a, b)
+
+    # Whichever backend is drawn first fails; the other one answers, or the
+    # first one again in the next round.
+    assert call(router, mode) in {"a", "b"}
+    assert a.calls + b.calls in (2, 3)
+    assert sum(failures(router).values()) == a.calls + b.calls - 1
+
+
+@pytest.mark.parametrize("mode", ["generate", "stream", "agenerate"])
+def test_non_retryable_error_is_raised_at_once(mode):
+    a = ScriptedEngine("a", [RuntimeError("400 bad request")] * 5)
+    b = ScriptedEngine("b", [RuntimeError("400 bad request")] * 5)
+    router = make_router(a, b, eject_after=1)
+
+    with pytest.raises(RuntimeError, match="400"):
+        call(router, mode)
+
+    assert a.calls + b.calls == 1
+    assert failures(router) == {"a": 0, "b": 0}
+    assert all(state.ejected_until == 0.0 for state in router._states)
+
+
+def test_retryable_errors_eject_a_backend():
+    a = ScriptedEngine("a", [RetryableError("503")] * 10)
+    b = ScriptedEngine("b")
+    router = make_router(a, b, eject_after=1)
+
+    for _ in range(10):
+        assert router.generate("prompt").text == "b"
+
+    assert a.calls == 1
+    assert router._states[0].ejected_until > 0.0
+
+
+def test_rounds_run_out():
+    a = ScriptedEngine("a", [RetryableError("503")] * 10)
+    router = make_router(a, max_rounds=2)
+
+    with pytest.raises(RetryableError):
+        router.generate("prompt")
+
+    assert a.calls == 3
@@ -0,0 +1,130 @@
+import random
+from typing import List
+from data.data_filter import QueryFilter
+from data.data_format import QueryItem
+from data.filter_tokenizer import FilterTokenizer
+from data.token_cache import TokenCache
+
+
+def make_items(count: int, prefix: str = "query") -> List[QueryItem]:
+    return [
+        QueryItem(
+            query=f"{prefix} {i}",
+            answers=[{"name": "getIntProperty", "arguments": {"areaId": i}}],
+        )
+        for i in range(count)
+    ]
+
+
+def tokens_of(items: List[QueryItem]) -> List[List[int]]:
+    # Distinct lengths, so that misplaced offsets show.
+    return [[len(item.query)] * (i % 4 + 1) for i, item in enumerate(items)]
+
+
+def write_cache(prefix, items, tokenizer_id="tok") -> TokenCache:
+    cache = TokenCache(prefix, tokenizer_id)
+    cache.load([])
+    cache.append(items[:4], tokens_of(items)[:4])
+    cache.append(items[4:], tokens_of(items)[4:])
+    return cache
+
+
+def test_reuses_all_cached_items(tmp_path):
+    items = make_items(10)
+    write_cache(tmp_path / "d.tokens", items)
+
+    store, reused = TokenCache(tmp_path / "d.tokens", "tok").load(items)
+
+    assert reused == 10
+    assert [list(tokens) for tokens in store] == tokens_of(items)
+
+
+def test_changed_item_truncates_the_cache(tmp_path):
+    items = make_items(10)
+    write_cache(tmp_path / "d.tokens", items)
+    changed = items[:6] + make_items(4, prefix="other")
+
+    cache = TokenCache(tmp_path / "d.tokens", "tok")
+    store, reused = cache.load(changed)
+
+    assert reused == 6
+    assert [list(tokens) for tokens in store] == tokens_of(items)[:6]
+    # The re-tokenized tail is appended after the reused prefix.
+    cache.append(changed[6:], tokens_of(changed)[6:])
+    store, reused = TokenCache(tmp_path / "d.tokens", "tok").load(changed)
+    assert reused == 10
+    assert [list(tokens) for tokens in store] == tokens_of(changed)
+
+
+def test_dataset_shorter_than_the_cache(tmp_path):
+    items = make_items(10)
+    write_cache(tmp_path / "d.tokens", items)
+
+    store, reused = TokenCache(tmp_path / "d.tokens", "tok").load(items[:3])
+
+    assert reused == 3
+    assert len(store) == 3
+    assert (tmp_path / "d.tokens.digests").stat().st_size == 3 * TokenCache.DIGEST_SIZE
+
+
+def test_other_tokenizer_resets_the_cache(tmp_path):
+    items = make_items(10)
+    write_cache(tmp_path / "d.tokens", items)
+
+    store, reused = TokenCache(tmp_path / "d.tokens", "other-tok").load(items)
+
+    assert reused == 0
+    assert len(store) == 0
+    assert (tmp_path / "d.tokens.data").stat().st_size == 0
+
+
+def test_partial_append_is_dropped(tmp_path):
+    items = make_items(10)
+    write_cache(tmp_path / "d.tokens", items)
+    # A crash after the data and offsets of the last item were written, but
+    # before its digest was.
+    digests = tmp_path / "d.tokens.digests"
+    digests.write_bytes(digests.read_bytes()[: -TokenCache.DIGEST_SIZE - 3])
+
+    cache = TokenCache(tmp_path / "d.tokens", "tok")
+    store, reused = cache.load(items)
+
+    assert reused == 8
+    assert [list(tokens) for tokens in store] == tokens_of(items)[:8]
+    cache.append(items[8:], tokens_of(items)[8:])
+    store, reused = TokenCache(tmp_path / "d.tokens", "tok").load(items)
+    assert reused == 10
+    assert [list(tokens) for tokens in store] == tokens_of(items)
+
+
+def test_filter_reuses_cached_tokens(tmp_path, tokenizer_file, monkeypatch):
+    rng = random.Random(0)
+    words = "set the fan seat heat level window defrost mirror trunk light".split()
+    items = [
+        QueryItem(
+            query=" ".join(rng.sample(words, 6)),
+            answers=[{"name": "getIntProperty", "arguments": {"areaId": 1}}],
+        )
+        for _ in range(20)
+    ]
+    data = list(items[:10])
+    query_filter = QueryFilter(
+        data, cache_path=tmp_path / "d.tokens", tokenizer_file=tokenizer_file
+    )
+    query_filter.extend_unique(items[10:])
+    assert len(data) > 10
+    expected = [list(tokens) for tokens in query_filter._existing_tokens]
+
+    encoded = []
+    encode = FilterTokenizer.encode
+    monkeypatch.setattr(
+        FilterTokenizer,
+        "encode",
+        lambda self, text: encoded.append(text) or encode(self, text),
+    )
+    resumed = QueryFilter(
+        data, cache_path=tmp_path / "d.tokens", tokenizer_file=tokenizer_file
+    )
+
+    assert encoded == []
+    assert [list(tokens) for tokens in resumed._existing_tokens] == expected